@@ -1,15 +1,15 @@
 import os
 from datetime import datetime, date, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
+from flask import Flask, Response, stream_with_context, render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_migrate import Migrate
 import logging
 from werkzeug.utils import secure_filename
 from functools import wraps
-import csv
-from io import StringIO
-from sqlalchemy import func, Time
+import click
+from sqlalchemy import func, update, Time
+from sqlalchemy.orm import joinedload, selectinload
 
 from extensions import db
 
@@ -21,14 +21,36 @@ app = Flask(__name__)
 # setup a secret key, required by sessions
 app.secret_key = os.environ.get("FLASK_SECRET_KEY") or "a secret key"
 # configure the database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital_tracker.db'  # For SQLite
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///hospital_tracker.db')  # For SQLite
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+# Seconds the ER board may serve an unchanged queue snapshot before rebuilding it
+app.config['ER_QUEUE_SNAPSHOT_MAX_AGE'] = int(os.environ.get('ER_QUEUE_SNAPSHOT_MAX_AGE', 60))
+# Seconds one ER board event stream stays open before the browser reconnects (and catches up)
+app.config['ER_STREAM_MAX_SECONDS'] = int(os.environ.get('ER_STREAM_MAX_SECONDS', 300))
+# Seconds between background priority aging passes (0 disables the scheduler)
+app.config['PRIORITY_AGING_INTERVAL'] = int(os.environ.get('PRIORITY_AGING_INTERVAL', 300))
+# Aging ticks slower than this are logged as warnings; others at INFO when enabled
+app.config['PRIORITY_AGING_SLOW_TICK_SECONDS'] = float(os.environ.get('PRIORITY_AGING_SLOW_TICK_SECONDS', 1.0))
+app.config['PRIORITY_AGING_LOG_METRICS'] = os.environ.get('PRIORITY_AGING_LOG_METRICS', '1') == '1'
+# Run the periodic jobs inside the web server; set to 0 when they run as `flask ... --loop` workers
+app.config['RUN_BACKGROUND_SCHEDULERS'] = os.environ.get('RUN_BACKGROUND_SCHEDULERS', '1') == '1'
+# Seconds between background Google Calendar sync passes (0 disables the worker thread)
+app.config['CALENDAR_SYNC_INTERVAL'] = int(os.environ.get('CALENDAR_SYNC_INTERVAL', 30))
+# Send calendar changes to an in-memory fake instead of Google, for offline development
+app.config['CALENDAR_SYNC_FAKE'] = os.environ.get('CALENDAR_SYNC_FAKE', '0') == '1'
+# Seconds between background inventory reorder evaluations (0 disables the scheduler)
+app.config['REORDER_EVALUATION_INTERVAL'] = int(os.environ.get('REORDER_EVALUATION_INTERVAL', 900))
 # initialize the app with the extension
 db.init_app(app)
-migrate = Migrate(app, db)
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Keep the FTS5 patient search tables out of migration autogenerate"""
+    return not (type_ == 'table' and name.startswith('patient_search'))
+
+migrate = Migrate(app, db, include_object=include_object)
 
 # Initialize login manager
 login_manager = LoginManager()
@@ -46,6 +68,47 @@ with app.app_context():
 
     db.create_all()
 
+    # Load waiting admissions into the in-memory priority queue
+    from utils.admission_queue import admission_queue
+    from utils.er_events import er_broker, publish_bed_change
+    from utils.bed_allocation import bed_allocator
+    from utils.ward_occupancy import get_ward_occupancy, total_counts, register_occupancy_listeners
+    register_occupancy_listeners()
+    # The search index itself is created by the patient_search_index migration
+    from utils.patient_search import register_search_listeners
+    register_search_listeners()
+    from utils.admission_rollups import register_rollup_listeners, ensure_admission_rollups
+    register_rollup_listeners()
+    ensure_admission_rollups()
+    from utils.dashboard_metrics import get_dashboard_metrics, register_metrics_listeners
+    register_metrics_listeners()
+    admission_queue.rebuild()
+    bed_allocator.rebuild()
+
+# Periodically re-age waiting admissions so queue order does not go stale
+from utils.priority_aging import start_priority_aging_scheduler, run_aging_tick, aging_stats
+
+# Push queued appointment changes to Google Calendar outside the request path
+from utils.calendar_sync import start_calendar_sync_worker, run_calendar_sync, sync_stats
+
+# Raise supplier reorders in periodic batches rather than after every transaction
+from utils.reorder import start_reorder_scheduler, run_reorder_evaluation, reorder_stats
+
+def start_background_schedulers():
+    """Start the periodic background jobs; only the web server entry points call this.
+
+    Importing the app (as every `flask` command, including `flask db
+    upgrade`, does) never starts them, and the --loop commands below run
+    each job as a standalone worker instead. A lock file lets only one
+    process per host run them, however many gunicorn workers there are.
+    """
+    from utils.scheduler_lock import acquire_scheduler_lock
+    if not app.config['RUN_BACKGROUND_SCHEDULERS'] or not acquire_scheduler_lock(app.instance_path):
+        return
+    start_priority_aging_scheduler(app)
+    start_calendar_sync_worker(app)
+    start_reorder_scheduler(app)
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -74,31 +137,150 @@ def login():
 @app.route('/dashboard')
 @login_required
 def dashboard():
+    metrics, _ = get_dashboard_metrics()
     stats = {
-        'total_patients': Patient.query.count(),
-        'total_appointments': Appointment.query.count(),
-        'available_beds': Bed.query.filter_by(occupied=False).count(),
-        'total_staff': User.query.count()
+        'total_patients': metrics['totals']['patients'],
+        'total_appointments': metrics['totals']['appointments'],
+        'available_beds': metrics['totals']['available_beds'],
+        'total_staff': metrics['totals']['staff']
     }
     return render_template('dashboard.html', stats=stats)
 
+@app.route('/api/dashboard/metrics')
+@login_required
+def api_dashboard_metrics():
+    """Chart data for the dashboard; clients revalidate with If-None-Match"""
+    metrics, etag = get_dashboard_metrics()
+    response = jsonify(metrics)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# Orderings available for the patient listing; the trailing id keeps keys unique
+PATIENT_SORTS = {
+    'name': ('name', 'id'),
+    'created': ('created_at', 'id'),
+}
+
+def get_patient_page():
+    """Keyset page of patients for the current request's sort, cursor and limit args"""
+    from utils.pagination import keyset_paginate, parse_page_size
+    sort = request.args.get('sort', 'name')
+    if sort not in PATIENT_SORTS:
+        sort = 'name'
+    columns = [getattr(Patient, name) for name in PATIENT_SORTS[sort]]
+    page = keyset_paginate(Patient.query,
+                           columns,
+                           cursor=request.args.get('cursor'),
+                           limit=parse_page_size(request.args.get('limit')))
+    return sort, page
+
 @app.route('/patients')
 @login_required
 def patient_list():
-    return render_template('patients.html', patients=Patient.query.all())
+    from utils.pagination import CursorError
+    try:
+        sort, page = get_patient_page()
+    except CursorError:
+        flash('Invalid page link, showing the first page')
+        return redirect(url_for('patient_list'))
+    return render_template('patients.html',
+                         patients=page.items,
+                         page=page,
+                         sort=sort)
+
+@app.route('/api/patients/search')
+@login_required
+def api_patient_search():
+    from utils.patient_search import search_patients, MAX_SEARCH_LIMIT, DEFAULT_SEARCH_LIMIT
+    from utils.pagination import parse_page_size
+    query = request.args.get('q', '').strip()
+    limit = parse_page_size(request.args.get('limit'), default=DEFAULT_SEARCH_LIMIT, maximum=MAX_SEARCH_LIMIT)
+    patients = search_patients(query, limit=limit)
+    return jsonify({
+        'query': query,
+        'results': [{
+            'id': patient.id,
+            'name': patient.name,
+            'age': patient.age,
+            'gender': patient.gender,
+            'contact': patient.contact,
+            'email': patient.email,
+            'insurance_number': patient.insurance_number
+        } for patient in patients]
+    })
+
+@app.route('/api/patients/typeahead')
+@login_required
+def api_patient_typeahead():
+    """Small, label-only patient matches for pickers such as the booking form"""
+    from utils.patient_search import search_patients
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        return jsonify({'results': []})
+    return jsonify({
+        'results': [{
+            'id': patient.id,
+            'label': f'{patient.name} · {patient.contact}'
+        } for patient in search_patients(query, limit=10)]
+    })
+
+@app.route('/api/patients')
+@login_required
+def api_patient_list():
+    from utils.pagination import CursorError
+    try:
+        sort, page = get_patient_page()
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'patients': [{
+            'id': patient.id,
+            'name': patient.name,
+            'age': patient.age,
+            'gender': patient.gender,
+            'contact': patient.contact,
+            'email': patient.email,
+            'created_at': patient.created_at.isoformat() if patient.created_at else None
+        } for patient in page.items],
+        'sort': sort,
+        'limit': page.limit,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    })
+
+# Days of appointments shown by default, and the widest window one page may request
+APPOINTMENT_WINDOW_DAYS = 7
+MAX_APPOINTMENT_WINDOW_DAYS = 62
 
 @app.route('/appointments')
 @login_required
 def appointment_list():
-    from datetime import date
-    appointments = Appointment.query.all()
-    doctors = User.query.filter_by(role='doctor').all()
-    patients = Patient.query.all()
+    # Only the requested date window is loaded, so the page does not grow with history
+    today = date.today()
+    start = request.args.get('start', today, type=date.fromisoformat)
+    days = min(max(request.args.get('days', APPOINTMENT_WINDOW_DAYS, type=int), 1), MAX_APPOINTMENT_WINDOW_DAYS)
+    end = start + timedelta(days=days - 1)
+    doctor_id = request.args.get('doctor_id', type=int)
+
+    query = Appointment.query.options(
+        joinedload(Appointment.patient), joinedload(Appointment.doctor)
+    ).filter(Appointment.date.between(start, end))
+    if doctor_id:
+        query = query.filter(Appointment.doctor_id == doctor_id)
+    appointments = query.order_by(Appointment.date, Appointment.time).all()
+
+    doctors = User.query.filter_by(role='doctor').order_by(User.name).all()
     return render_template('appointments.html',
                          appointments=appointments,
                          doctors=doctors,
-                         patients=patients,
-                         today=date.today())
+                         doctor_id=doctor_id,
+                         start=start,
+                         end=end,
+                         days=days,
+                         prev_start=start - timedelta(days=days),
+                         next_start=end + timedelta(days=1),
+                         today=today)
 
 @app.route('/staff')
 @login_required
@@ -108,7 +290,14 @@ def staff_list():
 @app.route('/wards')
 @login_required
 def ward_list():
-    return render_template('wards.html', wards=Ward.query.all(), beds=Bed.query.all())
+    # Group beds per ward once instead of filtering the full bed list for every ward
+    beds_by_ward = {}
+    for bed in Bed.query.order_by(Bed.ward_id, Bed.number):
+        beds_by_ward.setdefault(bed.ward_id, []).append(bed)
+    return render_template('wards.html',
+                         wards=Ward.query.all(),
+                         beds_by_ward=beds_by_ward,
+                         occupancy=get_ward_occupancy())
 
 @app.route('/logout')
 @login_required
@@ -253,11 +442,14 @@ def view_lab_test(id):
 @app.route('/patients/<int:id>')
 @login_required
 def patient_detail(id):
-    from models import Patient, Ward
-    from utils.wellness import generate_wellness_tip
+    from models import Ward
+    from utils.patient_chart import load_patient_chart
 
-    patient = Patient.query.get_or_404(id)
-    wards = Ward.query.all()  # Get all wards for admission modal
+    chart = load_patient_chart(id)
+    if chart is None:
+        abort(404)
+    # Get all wards with their beds for the admission modal
+    wards = Ward.query.options(selectinload(Ward.beds)).all()
 
     # Initialize tip_data with a default state
     tip_data = {
@@ -267,10 +459,32 @@ def patient_detail(id):
     }
 
     return render_template('patient_detail.html', 
-                         patient=patient, 
+                         patient=chart.patient, 
+                         sections=chart.sections,
                          wards=wards,
                          tip_data=tip_data)
 
+@app.route('/api/patients/<int:id>/chart/<section>')
+@login_required
+def api_patient_chart_section(id, section):
+    """Next entries of one patient chart section, rendered as table rows"""
+    from utils.patient_chart import (load_chart_section, CHART_SECTIONS,
+                                     CHART_SECTION_LIMIT, MAX_CHART_SECTION_LIMIT)
+    from utils.pagination import parse_page_size, CursorError
+    if section not in CHART_SECTIONS:
+        abort(404)
+    limit = parse_page_size(request.args.get('limit'), default=CHART_SECTION_LIMIT, maximum=MAX_CHART_SECTION_LIMIT)
+    try:
+        page = load_chart_section(id, section, cursor=request.args.get('cursor'), limit=limit)
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'section': section,
+        'html': render_template('patient_chart_rows.html', section=section, items=page.items),
+        'count': len(page.items),
+        'next_cursor': page.next_cursor
+    })
+
 @app.route('/patients/<int:id>/update', methods=['POST'])
 @login_required
 def update_patient(id):
@@ -411,9 +625,9 @@ def admit_patient(id):
             flash('Patient is already admitted or in queue')
             return redirect(url_for('patient_detail', id=id))
 
-        priority_level = request.form.get('priority_level', 'routine')
+        priority_level = request.form.get('priority_level', 'standard')
         if priority_level not in PRIORITY_LEVELS:
-            priority_level = 'routine'
+            priority_level = 'standard'
 
         # Create admission record with priority
         admission = Admission(
@@ -430,13 +644,14 @@ def admit_patient(id):
         bed_id = request.form.get('bed_id')
         if bed_id:
             bed = Bed.query.get_or_404(bed_id)
-            if not bed.occupied:
+            if not bed.occupied and (bed.status or 'available') == 'available':
                 admission.bed_id = bed_id
                 admission.status = 'active'
                 bed.occupied = True
+                bed.status = 'occupied'
                 bed.patient_id = id
             else:
-                # If bed is occupied, add to queue
+                # If bed is occupied or out of service, add to queue
                 admission.status = 'waiting'
                 queue_entry = AdmissionQueue(
                     admission=admission,
@@ -457,6 +672,14 @@ def admit_patient(id):
         db.session.add(admission)
         db.session.commit()
 
+        admission_queue.sync(admission)
+        admission_queue.commit_changes()
+        if admission.bed:
+            bed_allocator.bed_taken(admission.bed.id)
+            publish_bed_change(admission.bed)
+        else:
+            bed_allocator.admission_waiting(admission, request.form['ward_type'])
+
         if admission.status == 'active':
             flash('Patient admitted successfully')
         else:
@@ -486,10 +709,19 @@ def discharge_patient(id):
         # Free up the bed
         bed = admission.bed
         bed.occupied = False
+        bed.status = 'available'
         bed.patient_id = None
 
         db.session.commit()
-        flash('Patient discharged successfully')
+        admission_queue.discard(admission.id)
+        admission_queue.commit_changes()
+        publish_bed_change(bed)
+
+        # Hand the freed bed to the highest-priority patient waiting for this ward type
+        if bed_allocator.bed_freed(bed):
+            flash('Patient discharged successfully; bed assigned to the next patient in queue')
+        else:
+            flash('Patient discharged successfully')
     except Exception as e:
         db.session.rollback()
         flash(f'Error discharging patient: {str(e)}')
@@ -510,225 +742,118 @@ def admission_list():
     ).all()
     return render_template('admissions.html', admissions=admissions)
 
-@app.route('/admissions/analytics')
+@app.route('/admissions/rebalance', methods=['POST'])
 @login_required
-def admission_analytics():
-    from models import Admission, Ward, AdmissionQueue, Bed
-    # Calculate average length of stay for completed admissions
-    avg_stay = db.session.query(
-        func.avg(
-            func.extract('epoch', Admission.discharge_date - Admission.admission_date) / 86400
-        )
-    ).filter(
-        Admission.status == 'discharged'
-    ).scalar() or 0
+def rebalance_beds():
+    """Fill every free bed from the admission queue, e.g. at shift change"""
+    assignments = bed_allocator.rebalance()
+    flash(f'{len(assignments)} queued patients assigned to beds')
+    return redirect(url_for('admission_list'))
 
-    # Get admission counts by priority level
-    priority_distribution = db.session.query(
-        Admission.priority_level,
-        func.count(Admission.id)
-    ).group_by(
-        Admission.priority_level
-    ).all()
+@app.route('/beds/<int:id>/status', methods=['POST'])
+@login_required
+def update_bed_status(id):
+    from models import Bed
+    bed = Bed.query.get_or_404(id)
+    try:
+        status = request.form['status']
+        if status not in ('available', 'maintenance', 'reserved'):
+            raise ValueError(f'Invalid bed status: {status}')
+        # Conditional so a bed assigned meanwhile by the allocator is never put out of service
+        changed = db.session.execute(
+            update(Bed)
+            .where(Bed.id == id, Bed.occupied.isnot(True))
+            .values(status=status, notes=request.form.get('notes', bed.notes))
+            .execution_options(synchronize_session='fetch')
+        ).rowcount
+        if not changed:
+            raise ValueError('Bed is occupied; discharge or move the patient first')
+        db.session.commit()
+        publish_bed_change(bed)
 
-    # Get admission counts by month for the last 12 months
-    monthly_trends = db.session.query(
-        func.date_trunc('month', Admission.admission_date),
-        func.count(Admission.id)
-    ).group_by(
-        func.date_trunc('month', Admission.admission_date)
-    ).order_by(
-        func.date_trunc('month', Admission.admission_date).desc()
-    ).limit(12).all()
-
-    # Calculate current ward occupancy rates - Fixed query
-    ward_occupancy = db.session.query(
-        Ward.name,
-        func.count(Admission.id).filter(Admission.status == 'active').label('occupied'),
-        func.count(Bed.id).label('total')
+        if bed_allocator.bed_freed(bed):
+            flash('Bed status updated; bed assigned to the next patient in queue')
+        else:
+            flash('Bed status updated successfully')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error updating bed status: {str(e)}')
+    return redirect(url_for('ward_list'))
+
+@app.route('/admissions/analytics')
+@login_required
+def admission_analytics():
+    from models import Admission, AdmissionQueue, Ward, PRIORITY_LEVELS
+    from utils.admission_rollups import get_admission_analytics
+
+    # Average stay, priority mix, monthly trend and common reasons come from the rollup tables
+    analytics = get_admission_analytics()
+
+    # Current ward occupancy rates from the cached per-ward bed counts
+    occupancy = get_ward_occupancy()
+    ward_occupancy = [
+        {'name': ward.name, 'occupied': occupancy[ward.id]['occupied'], 'total': occupancy[ward.id]['total']}
+        for ward in Ward.query.order_by(Ward.name)
+        if occupancy.get(ward.id, {}).get('total')
+    ]
+
+    # Get current queue statistics; the waiting list is small, so average in Python
+    waiting = db.session.query(
+        Admission.priority_score, Admission.admission_date
     ).join(
-        Bed, Ward.id == Bed.ward_id
-    ).outerjoin(
-        Admission, Admission.bed_id == Bed.id
-    ).group_by(
-        Ward.id, Ward.name
+        AdmissionQueue
+    ).filter(
+        Admission.status == 'waiting'
     ).all()
-
-    # Get common admission reasons
-    common_reasons = db.session.query(
-        Admission.admission_reason,
-        func.count(Admission.id).label('count')
-    ).group_by(
-        Admission.admission_reason
-    ).order_by(
-        func.count(Admission.id).desc()
-    ).limit(10).all()
-
-    # Get current queue statistics
+    now = datetime.utcnow()
     queue_stats = {
-        'total_waiting': AdmissionQueue.query.count(),
-        'high_priority': AdmissionQueue.query.join(Admission).filter(
-            Admission.priority_level == 'high'
-        ).count(),
-        'avg_wait_time': db.session.query(
-            func.avg(
-                func.extract('epoch', func.now() - Admission.admission_date) / 3600
-            )
-        ).join(
-            AdmissionQueue
-        ).filter(
-            Admission.status == 'waiting'
-        ).scalar() or 0
+        'total_waiting': len(waiting),
+        'high_priority': sum(1 for score, _ in waiting if score <= PRIORITY_LEVELS['emergency']),
+        'avg_wait_time': sum((now - admitted).total_seconds() for _, admitted in waiting) / 3600 / len(waiting)
+                         if waiting else 0
     }
 
     return render_template(
         'admission_analytics.html',
-        avg_stay=round(avg_stay, 1),
-        priority_distribution=priority_distribution,
-        monthly_trends=monthly_trends,
+        avg_stay=round(analytics['avg_stay'], 1),
+        priority_distribution=analytics['priority_distribution'],
+        monthly_trends=analytics['monthly_trends'],
         ward_occupancy=ward_occupancy,
-        common_reasons=common_reasons,
+        common_reasons=analytics['common_reasons'],
         queue_stats=queue_stats
     )
 
 @app.route('/admissions/report/generate')
 @login_required
 def generate_admission_report():
-    from models import Admission, Ward
-    from datetime import datetime, timedelta
-
-    # Get date range from query parameters or default to last 30 days
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)
-
-    # Query admissions within the date range
-    admissions = Admission.query.filter(
-        Admission.admission_date.between(start_date, end_date)
-    ).order_by(
-        Admission.admission_date.desc()
-    ).all()
-
-    # Create CSV data
-    si = StringIO()
-    writer = csv.writer(si)
-
-    # Write header
-    writer.writerow([
-        'Admission ID', 'Patient Name', 'Admission Date', 'Discharge Date',
-        'Length of Stay (days)', 'Priority Level', 'Ward', 'Bed Number',
-        'Admission Reason', 'Status'
-    ])
-
-    # Write admission data
-    for admission in admissions:
-        length_of_stay = None
-        if admission.discharge_date:
-            length_of_stay = (admission.discharge_date - admission.admission_date).days
-
-        writer.writerow([
-            admission.id,
-            admission.patient.name,
-            admission.admission_date.strftime('%Y-%m-%d %H:%M'),
-            admission.discharge_date.strftime('%Y-%m-%d %H:%M') if admission.discharge_date else 'N/A',
-            length_of_stay if length_of_stay is not None else 'N/A',
-            admission.priority_level,
-            admission.bed.ward.name if admission.bed else 'N/A',
-            admission.bed.number if admission.bed else 'N/A',
-            admission.admission_reason,
-            admission.status
-        ])
-
-    # Create response
-    output = si.getvalue()
-    si.close()
-
-    response = app.make_response(output)
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=admission_report_{datetime.now().strftime("%Y%m%d")}.csv'
+    from utils.csv_export import admission_report_rows, csv_lines, parse_report_range
 
+    # Get date range from the start/end query parameters (YYYY-MM-DD) or default to last 30 days
+    try:
+        start_date, end_date = parse_report_range(request.args.get('start'), request.args.get('end'))
+    except ValueError as e:
+        flash(f'Invalid report range: {str(e)}')
+        return redirect(url_for('admission_analytics'))
+
+    # Stream the CSV as rows come out of the database instead of building it in memory
+    response = Response(stream_with_context(csv_lines(admission_report_rows(start_date, end_date))),
+                        mimetype='text/csv')
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename=admission_report_{start_date.strftime("%Y%m%d")}_'
+        f'{(end_date - timedelta(seconds=1)).strftime("%Y%m%d")}.csv'
+    )
     return response
 
 @app.route('/patients/<int:id>/export', methods=['GET'])
 @login_required
 def export_patient_data(id):
     from models import Patient
+    from utils.csv_export import csv_lines, patient_export_rows
     patient = Patient.query.get_or_404(id)
 
-    # Create a string buffer to write CSV data
-    si = StringIO()
-    writer = csv.writer(si)
-
-    # Write patient basic information
-    writer.writerow(['Patient Information'])
-    writer.writerow(['ID', 'Name', 'Age', 'Gender', 'Contact', 'Email', 'Blood Type'])
-    writer.writerow([
-        patient.id, patient.name, patient.age, patient.gender,
-        patient.contact, patient.email or '', patient.blood_type or ''
-    ])
-
-    # Write vital signs
-    writer.writerow([])  # Empty row for spacing
-    writer.writerow(['Vital Signs'])
-    writer.writerow(['Date', 'Temperature', 'Blood Pressure', 'Heart Rate', 'Respiratory Rate', 'Oxygen Saturation'])
-    for vital in patient.vital_signs:
-        writer.writerow([
-            vital.measured_at.strftime('%Y-%m-%d %H:%M'),
-            vital.temperature or '',
-            f"{vital.blood_pressure_systolic}/{vital.blood_pressure_diastolic}" if vital.blood_pressure_systolic else '',
-            vital.heart_rate or '',
-            vital.respiratory_rate or '',
-            vital.oxygen_saturation or ''
-        ])
-
-    # Write allergies
-    writer.writerow([])
-    writer.writerow(['Allergies'])
-    writer.writerow(['Allergen', 'Severity', 'Reaction', 'Diagnosis Date'])
-    for allergy in patient.allergies:
-        writer.writerow([
-            allergy.allergen,
-            allergy.severity or '',
-            allergy.reaction or '',
-            allergy.diagnosis_date.strftime('%Y-%m-%d') if allergy.diagnosis_date else ''
-        ])
-
-    # Write medical history
-    writer.writerow([])
-    writer.writerow(['Medical History'])
-    writer.writerow(['Condition', 'Diagnosis Date', 'Treatment', 'Status'])
-    for history in patient.medical_history:
-        writer.writerow([
-            history.condition,
-            history.diagnosis_date.strftime('%Y-%m-%d') if history.diagnosis_date else '',
-            history.treatment or '',
-            history.status or ''
-        ])
-
-    # Write prescriptions
-    writer.writerow([])
-    writer.writerow(['Prescriptions'])
-    writer.writerow(['Date', 'Doctor', 'Diagnosis', 'Medications'])
-    for prescription in patient.prescriptions:
-        medications = '; '.join([
-            f"{med.medication_name} ({med.dosage}, {med.frequency}, {med.duration})"
-            for med in prescription.medications
-        ])
-        writer.writerow([
-            prescription.date.strftime('%Y-%m-%d'),
-            prescription.doctor.name,
-            prescription.diagnosis,
-            medications
-        ])
-
-    # Get the CSV data and create the response
-    output = si.getvalue()
-    si.close()
-
-    # Create the response with CSV mimetype
-    response = app.make_response(output)
-    response.headers['Content-Type'] = 'text/csv'
+    # Stream the CSV section by section
+    response = Response(stream_with_context(csv_lines(patient_export_rows(patient))), mimetype='text/csv')
     response.headers['Content-Disposition'] = f'attachment; filename=patient_{patient.id}_data_{datetime.now().strftime("%Y%m%d")}.csv'
-
     return response
 
 def doctor_required(f):
@@ -957,8 +1082,8 @@ def get_wellness_tip(id):
 @app.route('/api/doctor-availability/<int:doctor_id>', methods=['GET'])
 @login_required
 def get_doctor_availability(doctor_id):
-    from models import User, Appointment
-    from datetime import datetime, timedelta
+    from models import User
+    from utils.availability import doctor_day_schedule, DEFAULT_SLOT_MINUTES
 
     doctor = User.query.get_or_404(doctor_id)
     date_str = request.args.get('date')
@@ -978,36 +1103,21 @@ def get_doctor_availability(doctor_id):
     if day_name not in working_days:
         return jsonify({'error': 'Doctor is not available on this day'}), 400
 
-    # Get existing appointments for the selected date
-    existing_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.date == selected_date
-    ).all()
-
-    booked_times = {apt.time.strftime('%H:%M') for apt in existing_appointments}
-
-    # Generate available time slots (30-minute intervals)
-    available_slots = []
-    current_time = doctor.work_start_time
-
-    while current_time <= doctor.work_end_time:
-        # Skip break time if set
-        if doctor.break_start_time and doctor.break_end_time:
-            if not (doctor.break_start_time <= current_time <= doctor.break_end_time):
-                time_str = current_time.strftime('%H:%M')
-                if time_str not in booked_times:
-                    available_slots.append(time_str)
-        else:
-            time_str = current_time.strftime('%H:%M')
-            if time_str not in booked_times:
-                available_slots.append(time_str)
-
-        current_time = (datetime.combine(datetime.today(), current_time) + 
-                       timedelta(minutes=30)).time()
+    # Free time is working hours minus the break minus booked appointment ranges
+    schedule = doctor_day_schedule(doctor, selected_date)
+    length = request.args.get('duration', DEFAULT_SLOT_MINUTES, type=int)
+    if length <= 0:
+        return jsonify({'error': 'Invalid duration'}), 400
+    limit = request.args.get('limit', type=int)
+    # Today only offers slots that have not started yet
+    after = datetime.now() if selected_date == date.today() else None
+    available_slots = [slot.strftime('%H:%M')
+                       for slot in schedule.next_free_slots(limit, length=length, after=after)]
 
     return jsonify({
         'doctor_name': doctor.name,
         'available_slots': available_slots,
+        'duration': length,
         'working_hours': {
             'start': doctor.work_start_time.strftime('%H:%M'),
             'end': doctor.work_end_time.strftime('%H:%M'),
@@ -1016,56 +1126,183 @@ def get_doctor_availability(doctor_id):
         }
     })
 
+@app.route('/api/availability/search', methods=['GET'])
+@login_required
+def search_availability():
+    """Earliest free slots across every doctor matching a department or specialization"""
+    from models import User
+    from utils.availability import search_free_slots, DEFAULT_SLOT_MINUTES, MAX_SEARCH_DAYS
+    from utils.pagination import parse_page_size
+
+    try:
+        start_day = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else date.today()
+        end_day = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else start_day + timedelta(days=6)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    if end_day < start_day or (end_day - start_day).days >= MAX_SEARCH_DAYS:
+        return jsonify({'error': f'Date range must span 1 to {MAX_SEARCH_DAYS} days'}), 400
+    length = request.args.get('duration', DEFAULT_SLOT_MINUTES, type=int)
+    if length <= 0:
+        return jsonify({'error': 'Invalid duration'}), 400
+    limit = parse_page_size(request.args.get('limit'), default=20, maximum=100)
+
+    doctors = User.query.options(joinedload(User.department)).filter(
+        User.role == 'doctor',
+        User.is_available.isnot(False)
+    )
+    if request.args.get('department_id'):
+        doctors = doctors.filter(User.department_id == request.args.get('department_id', type=int))
+    if request.args.get('specialization'):
+        doctors = doctors.filter(User.specialization.ilike(f"%{request.args['specialization']}%"))
+
+    # Slots that have already started today are not offered
+    slots = search_free_slots(doctors.all(), start_day, end_day, length=length, limit=limit, after=datetime.now())
+
+    return jsonify({
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'duration': length,
+        'slots': [{
+            'doctor_id': doctor.id,
+            'doctor_name': doctor.name,
+            'specialization': doctor.specialization,
+            'department': doctor.department.name if doctor.department else None,
+            'date': slot.date().isoformat(),
+            'time': slot.strftime('%H:%M'),
+            'start': slot.isoformat()
+        } for slot, doctor in slots]
+    })
+
 @app.route('/appointments/schedule', methods=['POST'])
 @login_required
 def schedule_appointment():
-    from models import Appointment, User
+    from models import User
+    from utils.booking import reserve_appointment, BookingError
+    from utils.availability import DEFAULT_SLOT_MINUTES
+    from utils.calendar_sync import enqueue_calendar_sync
+    # fetch() callers ask for JSON so a 409 can trigger a retry instead of a redirect
+    wants_json = request.accept_mimetypes.best == 'application/json'
     try:
         doctor_id = request.form['doctor_id']
         patient_id = request.form['patient_id']
         date_str = request.form['date']
         time_str = request.form['time']
+        duration = request.form.get('duration', DEFAULT_SLOT_MINUTES, type=int)
 
         # Validate doctor availability
         doctor = User.query.get_or_404(doctor_id)
         if not doctor.is_available:
-            flash('Selected doctor is currently unavailable')
-            return redirect(url_for('appointment_list'))
+            raise BookingError('Selected doctor is currently unavailable')
+        if duration <= 0:
+            raise BookingError('Invalid appointment duration')
 
         # Convert strings to datetime objects
         appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         appointment_time = datetime.strptime(time_str, '%H:%M').time()
 
-        # Check for existing appointments
-        existing_appointment = Appointment.query.filter_by(
-            doctor_id=doctor_id,
-            date=appointment_date,
-            time=appointment_time
-        ).first()
-
-        if existing_appointment:
-            flash('This time slot is already booked')
-            return redirect(url_for('appointment_list'))
-
-        # Create new appointment
-        appointment = Appointment(
+        # Reserve the time range atomically; overlapping bookings raise BookingConflict
+        appointment = reserve_appointment(
+            doctor,
+            appointment_date,
+            appointment_time,
+            duration,
             patient_id=patient_id,
-            doctor_id=doctor_id,
-            date=appointment_date,
-            time=appointment_time,
             status='Scheduled'
         )
-
-        db.session.add(appointment)
+        # Queued with the booking; the sync worker creates the calendar event later
+        enqueue_calendar_sync(appointment, 'upsert', current_user)
         db.session.commit()
         flash('Appointment scheduled successfully')
+        if wants_json:
+            return jsonify({'id': appointment.id}), 201
 
+    except BookingError as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': str(e)}), e.status_code
+        flash(str(e))
     except Exception as e:
         db.session.rollback()
+        if wants_json:
+            return jsonify({'error': f'Error scheduling appointment: {str(e)}'}), 400
         flash(f'Error scheduling appointment: {str(e)}')
 
     return redirect(url_for('appointment_list'))
 
+@app.route('/appointments/series', methods=['POST'])
+@login_required
+def schedule_appointment_series():
+    from models import User
+    from utils.booking import reserve_series, BookingError, SeriesConflict
+    from utils.availability import DEFAULT_SLOT_MINUTES
+    from utils.calendar_sync import enqueue_calendar_sync_many
+    from utils.recurrence import RecurrenceRule
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    try:
+        doctor = User.query.get_or_404(request.form['doctor_id'])
+        if not doctor.is_available:
+            raise BookingError('Selected doctor is currently unavailable')
+        duration = request.form.get('duration', DEFAULT_SLOT_MINUTES, type=int)
+        if duration <= 0:
+            raise BookingError('Invalid appointment duration')
+        start_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+        start_time = datetime.strptime(request.form['time'], '%H:%M').time()
+
+        # Either a raw RRULE or the simple repeat fields from the booking form
+        try:
+            if request.form.get('rule'):
+                rule = RecurrenceRule.parse(request.form['rule'])
+            else:
+                until = request.form.get('until')
+                rule = RecurrenceRule(
+                    request.form.get('repeat', 'WEEKLY').upper(),
+                    interval=request.form.get('interval', 1, type=int),
+                    count=request.form.get('count', type=int),
+                    until=datetime.strptime(until, '%Y-%m-%d').date() if until else None
+                )
+        except ValueError as e:
+            raise BookingError(str(e))
+
+        series, appointment_ids, skipped = reserve_series(
+            doctor,
+            rule,
+            start_date,
+            start_time,
+            duration,
+            skip_conflicts=request.form.get('skip_conflicts') == '1',
+            patient_id=request.form['patient_id'],
+            title=request.form.get('title'),
+            created_by_id=current_user.id
+        )
+        enqueue_calendar_sync_many(appointment_ids, current_user)
+        db.session.commit()
+        flash(f'Scheduled {len(appointment_ids)} recurring appointments'
+              + (f' ({len(skipped)} unavailable dates skipped)' if skipped else ''))
+        if wants_json:
+            return jsonify({
+                'series_id': series.id,
+                'created': len(appointment_ids),
+                'skipped': [day.isoformat() for day in skipped]
+            }), 201
+
+    except SeriesConflict as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': str(e), 'conflicts': [day.isoformat() for day in e.dates]}), e.status_code
+        flash(f"{e}: {', '.join(day.isoformat() for day in e.dates)}")
+    except BookingError as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': str(e)}), e.status_code
+        flash(str(e))
+    except Exception as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': f'Error scheduling appointment series: {str(e)}'}), 400
+        flash(f'Error scheduling appointment series: {str(e)}')
+
+    return redirect(url_for('appointment_list'))
+
 @app.route('/inventory')
 @login_required
 def inventory_list():
@@ -1121,8 +1358,10 @@ def add_inventory_item():
 
 @app.route('/inventory/<int:id>/batch/add', methods=['POST'])
 @login_required
-def add_inventory_batch():
+def add_inventory_batch(id):
     from models import InventoryBatch, InventoryTransaction
+    from utils.inventory import adjust_item_stock
+    from utils.reorder import close_received_lines
     try:
         batch = InventoryBatch(
             inventory_item_id=id,
@@ -1134,6 +1373,7 @@ def add_inventory_batch():
             remaining_quantity=int(request.form['quantity'])
         )
         db.session.add(batch)
+        db.session.flush()
 
         # Create a transaction record for the new batch
         transaction = InventoryTransaction(
@@ -1149,7 +1389,8 @@ def add_inventory_batch():
         db.session.add(transaction)
 
         # Update item's current stock
-        batch.item.current_stock += batch.quantity
+        adjust_item_stock(id, batch.quantity)
+        close_received_lines([id])
 
         db.session.commit()
         flash('Inventory batch added successfully')
@@ -1161,69 +1402,138 @@ def add_inventory_batch():
 @app.route('/inventory/transaction/add', methods=['POST'])
 @login_required
 def add_inventory_transaction():
-    from models import InventoryTransaction, InventoryItem, InventoryBatch
+    from utils.inventory import allocate_fefo, record_stock_movement
+    from utils.reorder import close_received_lines
     try:
-        item_id = request.form['inventory_item_id']
-        quantity = int(request.form['quantity'])
+        item_id = int(request.form['inventory_item_id'])
         transaction_type = request.form['transaction_type']
+        batch_id = request.form.get('batch_id', type=int)
+        details = {
+            'reference_number': request.form.get('reference_number'),
+            'department': request.form.get('department'),
+            'notes': request.form.get('notes')
+        }
 
-        # Adjust quantity sign based on transaction type
-        if transaction_type in ['consumed', 'expired']:
-            quantity = -abs(quantity)
-
-        transaction = InventoryTransaction(
-            inventory_item_id=item_id,
-            batch_id=request.form.get('batch_id'),
-            transaction_type=transaction_type,
-            quantity=quantity,
-            reference_number=request.form.get('reference_number'),
-            department=request.form.get('department'),
-            performed_by_id=current_user.id,
-            notes=request.form.get('notes')
-        )
-
-        # Update item's current stock
-        item = InventoryItem.query.get(item_id)
-        if item.current_stock + quantity < 0:
-            raise ValueError('Insufficient stock')
-
-        item.current_stock += quantity
-
-        # Update batch remaining quantity if batch specified
-        if transaction.batch_id:
-            batch = InventoryBatch.query.get(transaction.batch_id)
-            if batch.remaining_quantity + quantity < 0:
-                raise ValueError('Insufficient batch quantity')
-            batch.remaining_quantity += quantity
-
-        db.session.add(transaction)
+        # Stock checks and updates happen atomically in the database
+        if transaction_type == 'consumed' and not batch_id:
+            # No batch picked: issue from the batches that expire first
+            allocate_fefo(item_id, int(request.form['quantity']), current_user.id,
+                          allow_unbatched=True, **details)
+        else:
+            record_stock_movement(item_id, transaction_type, int(request.form['quantity']),
+                                  performed_by_id=current_user.id, batch_id=batch_id, **details)
+            if transaction_type == 'received':
+                close_received_lines([item_id])
+        # Reorders are raised by the periodic reorder evaluation, not per transaction
         db.session.commit()
-
-        # Check if reorder needed
-        if item.check_stock_status() == 'reorder':
-            create_automated_order(item)
-
         flash('Transaction recorded successfully')
     except Exception as e:
         db.session.rollback()
         flash(f'Error recording transaction: {str(e)}')
     return redirect(url_for('inventory_list'))
 
-def create_automated_order(item):
-    """Create an automated order for an item that needs reordering"""
-    from models import AutomatedOrder
+@app.route('/api/inventory/transactions/bulk', methods=['POST'])
+@login_required
+def api_inventory_bulk_transactions():
+    """Record many stock movements at once from a JSON list or a CSV upload; all or nothing"""
+    import csv
+    from io import StringIO
+    from models import InventoryItem
+    from utils.inventory import BulkMovementError, apply_movements, parse_movements
+    from utils.reorder import close_received_lines, evaluate_reorders
     try:
-        order = AutomatedOrder(
-            inventory_item_id=item.id,
-            quantity=item.reorder_quantity,
-            suggested_by='low_stock',
-            notes=f'Automated reorder triggered. Current stock: {item.current_stock}'
-        )
-        db.session.add(order)
+        if request.mimetype == 'text/csv':
+            rows = list(csv.DictReader(StringIO(request.get_data(as_text=True))))
+        elif 'file' in request.files:
+            rows = list(csv.DictReader(StringIO(request.files['file'].read().decode('utf-8-sig'))))
+        else:
+            payload = request.get_json(silent=True)
+            rows = payload.get('transactions') if isinstance(payload, dict) else payload
+            if not isinstance(rows, list):
+                raise BulkMovementError('Expected a JSON list of transactions or a CSV body', [])
+
+        movements = parse_movements(rows)
+        item_ids = apply_movements(movements, current_user.id)
+        close_received_lines({m['inventory_item_id'] for m in movements if m['transaction_type'] == 'received'})
+        db.session.commit()
+    except BulkMovementError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'errors': e.errors}), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Error recording transactions: {str(e)}'}), 400
+
+    # One batched reorder evaluation for every affected item rather than one per movement;
+    # the movements are already committed, so a failure here must not fail the request
+    try:
+        evaluate_reorders(item_ids)
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Reorder evaluation after bulk transactions failed: {str(e)}")
+    items = InventoryItem.query.filter(InventoryItem.id.in_(item_ids)).all()
+    return jsonify({
+        'recorded': len(rows),
+        'items': {item.id: item.current_stock for item in items}
+    }), 201
+
+@app.route('/api/inventory/<int:item_id>/batches')
+@login_required
+def api_inventory_batches(item_id):
+    """Batches that can be issued for an item, in the order FEFO allocation uses them"""
+    from utils.inventory import fefo_batches_query
+    batches = db.session.scalars(fefo_batches_query(item_id)).all()
+    return jsonify([{
+        'id': batch.id,
+        'batch_number': batch.batch_number,
+        'expiry_date': batch.expiry_date.isoformat(),
+        'remaining_quantity': batch.remaining_quantity
+    } for batch in batches])
+
+@app.route('/api/inventory/purchase-orders')
+@login_required
+def api_purchase_orders():
+    """Open purchase orders with their reorder lines"""
+    from models import AutomatedOrder, PurchaseOrder
+    status = request.args.get('status', 'pending')
+    orders = PurchaseOrder.query.options(
+        joinedload(PurchaseOrder.supplier),
+        selectinload(PurchaseOrder.lines).joinedload(AutomatedOrder.item)
+    ).filter_by(status=status).order_by(PurchaseOrder.created_at).all()
+    return jsonify([{
+        'id': order.id,
+        'supplier': order.supplier.name if order.supplier else None,
+        'status': order.status,
+        'expected_delivery': order.expected_delivery.isoformat() if order.expected_delivery else None,
+        'lines': [{
+            'item_id': line.inventory_item_id,
+            'item': line.item.name,
+            'quantity': line.quantity,
+            'status': line.status,
+            'notes': line.notes
+        } for line in order.lines]
+    } for order in orders])
+
+@app.route('/api/inventory/purchase-orders/<int:id>/status', methods=['POST'])
+@login_required
+def api_purchase_order_status(id):
+    """Approve, mark ordered, receive or cancel a purchase order together with its open lines"""
+    from models import PurchaseOrder
+    from utils.reorder import set_purchase_order_status
+    PurchaseOrder.query.get_or_404(id)
+    payload = request.get_json(silent=True) or request.form
+    try:
+        set_purchase_order_status(id, payload.get('status'), current_user.id)
         db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         db.session.rollback()
-        logging.error(f'Error creating automated order: {str(e)}')
+        return jsonify({'error': f'Error updating purchase order: {str(e)}'}), 400
+    return jsonify({'id': id, 'status': payload.get('status')})
+
+# Highest-demand items listed with their forecast on the analytics page
+FORECAST_TABLE_ROWS = 25
 
 @app.route('/inventory/analytics')
 @login_required
@@ -1254,10 +1564,36 @@ def inventory_analytics():
         InventoryTransaction.inventory_item_id
     ).all()
 
+    # Forecast demand and suggested reorder points for every active item in one pass
+    from models import Supplier
+    from utils.demand_forecast import FORECAST_HISTORY_DAYS, cached_forecast_reorder_points, forecast_stats
+    items = db.session.query(
+        InventoryItem.id, InventoryItem.name, InventoryItem.current_stock,
+        InventoryItem.minimum_stock, Supplier.lead_time_days
+    ).outerjoin(Supplier, Supplier.id == InventoryItem.supplier_id).filter(
+        InventoryItem.is_active.isnot(False)
+    ).all()
+    # Reused for a few minutes, so reloading the page does not refit every item
+    forecasts = cached_forecast_reorder_points({item.id: item.lead_time_days for item in items})
+    below_forecast = sum(
+        1 for item in items if (item.current_stock or 0) <= forecasts[item.id]['reorder_point']
+        and forecasts[item.id]['daily_demand'] > 0
+    )
+    forecast_rows = sorted(
+        (dict(forecasts[item.id], name=item.name, current_stock=item.current_stock or 0,
+              minimum_stock=item.minimum_stock or 0)
+         for item in items if forecasts[item.id]['daily_demand'] > 0),
+        key=lambda row: row['daily_demand'], reverse=True
+    )[:FORECAST_TABLE_ROWS]
+
     return render_template('inventory_analytics.html',
                          total_value=total_value,
                          expiring_summary=expiring_summary,
-                         consumption_data=consumption_data)
+                         consumption_data=consumption_data,
+                         forecast_rows=forecast_rows,
+                         below_forecast=below_forecast,
+                         forecast_history_days=FORECAST_HISTORY_DAYS,
+                         forecast_stats=forecast_stats)
 
 @app.route('/er/dashboard')
 @login_required
@@ -1265,17 +1601,20 @@ def er_dashboard():
     from models import Ward, Admission, TRIAGE_COLORS
     from datetime import datetime
 
-    # Get ER wards and their stats
-    er_wards = Ward.query.filter_by(is_er=True).all()
+    # Get ER wards with their beds and occupants in a fixed number of queries
+    er_wards = Ward.query.filter_by(is_er=True).options(
+        selectinload(Ward.beds).selectinload(Bed.patient)
+    ).all()
+
+    # Waiting list comes from the published queue snapshot; this view never writes
+    queue = admission_queue.snapshot(max_age=app.config['ER_QUEUE_SNAPSHOT_MAX_AGE'])
 
     # Get ER statistics
     er_stats = {
         'total_patients': Admission.query.filter_by(status='active').count(),
-        'available_beds': sum(ward.get_available_beds() for ward in er_wards),
-        'waiting_patients': Admission.query.filter_by(status='waiting').count(),
-        'avg_wait_time': db.session.query(
-            func.avg(Admission.estimated_wait_time)
-        ).filter_by(status='waiting').scalar() or 0
+        'available_beds': total_counts({ward.id for ward in er_wards})['free'],
+        'waiting_patients': len(queue),
+        'avg_wait_time': queue.avg_wait_time
     }
 
     # Get triage category counts
@@ -1288,26 +1627,24 @@ def er_dashboard():
         ).group_by(Admission.triage_category).all()
     )
 
-    # Get queue ordered by priority
-    queue = Admission.query.filter_by(status='waiting').order_by(
-        Admission.priority_score,
-        Admission.created_at
-    ).all()
-
-    # Update queue positions and wait times
-    for position, admission in enumerate(queue, 1):
-        admission.queue_position = position
-        admission.calculate_estimated_wait_time()
-    db.session.commit()
-
     return render_template('er_dashboard.html',
                          er_stats=er_stats,
                          er_wards=er_wards,
                          triage_counts=triage_counts,
-                         queue=queue,
+                         queue=queue.entries,
                          TRIAGE_COLORS=TRIAGE_COLORS,
                          now=datetime.utcnow())
 
+@app.route('/er/stream')
+@login_required
+def er_stream():
+    """Server-Sent Events feed of queue and bed changes for the ER board"""
+    # Browsers send the last event id they saw when reconnecting a stream that ended
+    subscription = er_broker.subscribe(request.headers.get('Last-Event-ID'))
+    return Response(er_broker.stream(subscription, max_seconds=app.config['ER_STREAM_MAX_SECONDS']),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/er/patients/add', methods=['POST'])
 @login_required
 def add_er_patient():
@@ -1341,10 +1678,14 @@ def add_er_patient():
         )
 
         db.session.add(admission)
+        db.session.flush()  # Sets created_at, which the score's wait time is measured from
+        # Score from the triage category now, so the queue places the patient by it immediately
+        admission.update_priority_score()
         db.session.commit()
 
-        # Update queue positions after adding new patient
-        AdmissionQueue.update_queue_positions()
+        # Add to the in-memory queue and persist the shifted positions
+        admission_queue.push(admission)
+        admission_queue.commit_changes()
 
         flash('Patient added to ER queue successfully')
     except Exception as e:
@@ -1365,8 +1706,10 @@ def update_triage(id):
 
         db.session.commit()
 
-        # Update queue positions after triage change
-        AdmissionQueue.update_queue_positions()
+        # Reposition in the in-memory queue and persist the shifted positions
+        admission_queue.sync(admission)
+        admission_queue.commit_changes()
+        bed_allocator.reprioritize(admission)
 
         flash('Triage category updated successfully')
     except Exception as e:
@@ -1422,5 +1765,81 @@ def update_supplier(id):
         flash(f'Error updating supplier: {str(e)}')
     return redirect(url_for('supplier_list'))
 
+@app.route('/api/er/aging-stats')
+@login_required
+def get_aging_stats():
+    return jsonify({
+        **aging_stats,
+        'last_run_at': aging_stats['last_run_at'].isoformat() if aging_stats['last_run_at'] else None,
+        'interval_seconds': app.config['PRIORITY_AGING_INTERVAL']
+    })
+
+@app.route('/api/calendar/sync-stats')
+@login_required
+def get_calendar_sync_stats():
+    from models import CalendarSyncJob
+    from utils.google_calendar import calendar_service_stats
+    return jsonify({
+        **sync_stats,
+        'last_run_at': sync_stats['last_run_at'].isoformat() if sync_stats['last_run_at'] else None,
+        'interval_seconds': app.config['CALENDAR_SYNC_INTERVAL'],
+        'queued': dict(db.session.query(CalendarSyncJob.status, func.count(CalendarSyncJob.id))
+                       .filter(CalendarSyncJob.status != 'done').group_by(CalendarSyncJob.status).all()),
+        'service_cache': calendar_service_stats
+    })
+
+@app.cli.command('rebalance-beds')
+def rebalance_beds_command():
+    """Assign every free bed to the highest-priority matching queued admission."""
+    assignments = bed_allocator.rebalance()
+    click.echo(f"Assigned {len(assignments)} beds")
+
+@app.cli.command('rebuild-admission-rollups')
+def rebuild_admission_rollups_command():
+    """Recompute the admission analytics rollups from the Admission table."""
+    from utils.admission_rollups import rebuild_admission_rollups
+    rows = rebuild_admission_rollups()
+    click.echo(f"Rebuilt {rows} admission rollup rows")
+
+@app.cli.command('age-priorities')
+@click.option('--loop', is_flag=True, help='Keep running every PRIORITY_AGING_INTERVAL seconds.')
+def age_priorities_command(loop):
+    """Re-age waiting admission priorities (run as a standalone worker with --loop)."""
+    import time
+    while True:
+        rows_updated = run_aging_tick(app)
+        click.echo(f"Aged {rows_updated} admissions in {aging_stats['last_duration_ms']}ms")
+        if not loop:
+            break
+        time.sleep(app.config['PRIORITY_AGING_INTERVAL'] or 300)
+
+@app.cli.command('sync-calendar')
+@click.option('--loop', is_flag=True, help='Keep running every CALENDAR_SYNC_INTERVAL seconds.')
+def sync_calendar_command(loop):
+    """Send queued appointment changes to Google Calendar (run as a standalone worker with --loop)."""
+    import time
+    while True:
+        processed = run_calendar_sync(app)
+        click.echo(f"Synced {processed} calendar changes in {sync_stats['last_duration_ms']}ms")
+        if not loop:
+            break
+        time.sleep(app.config['CALENDAR_SYNC_INTERVAL'] or 30)
+
+@app.cli.command('evaluate-reorders')
+@click.option('--loop', is_flag=True, help='Keep running every REORDER_EVALUATION_INTERVAL seconds.')
+def evaluate_reorders_command(loop):
+    """Raise reorder lines for low-stock items, consolidated into supplier purchase orders."""
+    import time
+    while True:
+        created = run_reorder_evaluation(app)
+        click.echo(f"Added {sum(created.values())} reorder lines to {len(created)} purchase orders "
+                   f"in {reorder_stats['last_duration_ms']}ms")
+        if not loop:
+            break
+        time.sleep(app.config['REORDER_EVALUATION_INTERVAL'] or 900)
+
 if __name__ == '__main__':
+    # Under the reloader only the restarted child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_schedulers()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,94 @@
+import argparse
+import random
+import sys
+import threading
+import time
+import uuid
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from app import app, db
+from models import InventoryItem, InventoryTransaction, User
+from utils.inventory import InsufficientStock, record_stock_movement
+
+def _consume(item_id, user_id, operations, max_quantity, seed, counts, lock):
+    rng = random.Random(seed)
+    local = {'ok': 0, 'insufficient': 0, 'errors': 0, 'consumed': 0}
+    with app.app_context():
+        for _ in range(operations):
+            quantity = rng.randint(1, max_quantity)
+            try:
+                record_stock_movement(item_id, 'consumed', quantity, performed_by_id=user_id,
+                                      department='benchmark')
+                db.session.commit()
+                local['ok'] += 1
+                local['consumed'] += quantity
+            except InsufficientStock:
+                db.session.rollback()
+                local['insufficient'] += 1
+            except OperationalError:
+                # e.g. SQLite giving up on a busy lock; nothing was applied
+                db.session.rollback()
+                local['errors'] += 1
+    with lock:
+        for key, value in local.items():
+            counts[key] += value
+
+def run_benchmark(threads, operations, initial_stock, max_quantity, keep):
+    """Hammer one item with parallel consumptions and check stock against the ledger"""
+    with app.app_context():
+        user = User.query.order_by(User.id).first()
+        if user is None:
+            print("Benchmark needs at least one user (see create_admin.py)")
+            return 1
+        item = InventoryItem(name='Stock benchmark item', category='supplies', sku=f'BENCH-{uuid.uuid4().hex[:12]}',
+                             unit='pieces', current_stock=0, minimum_stock=0, maximum_stock=initial_stock,
+                             reorder_quantity=0, is_active=False)
+        db.session.add(item)
+        db.session.flush()
+        record_stock_movement(item.id, 'received', initial_stock, performed_by_id=user.id, notes='Benchmark stock')
+        db.session.commit()
+        item_id, user_id = item.id, user.id
+
+    counts = {'ok': 0, 'insufficient': 0, 'errors': 0, 'consumed': 0}
+    lock = threading.Lock()
+    workers = [
+        threading.Thread(target=_consume, args=(item_id, user_id, operations, max_quantity, n, counts, lock))
+        for n in range(threads)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        stock = db.session.query(InventoryItem.current_stock).filter_by(id=item_id).scalar()
+        ledger = db.session.query(func.sum(InventoryTransaction.quantity)).filter_by(inventory_item_id=item_id).scalar()
+        if not keep:
+            InventoryTransaction.query.filter_by(inventory_item_id=item_id).delete()
+            InventoryItem.query.filter_by(id=item_id).delete()
+            db.session.commit()
+
+    total = threads * operations
+    print(f"{total} consumptions on {threads} threads in {elapsed:.2f}s ({total / elapsed:.0f}/s)")
+    print(f"  applied: {counts['ok']}, refused for insufficient stock: {counts['insufficient']}, "
+          f"lock errors: {counts['errors']}")
+    print(f"  final stock: {stock}, ledger sum: {ledger}, expected: {initial_stock - counts['consumed']}")
+    if stock != ledger or stock != initial_stock - counts['consumed'] or stock < 0:
+        print("FAILED: stock does not match the transaction ledger")
+        return 1
+    print("OK: stock matches the transaction ledger")
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent stock consumption benchmark for the inventory ledger')
+    parser.add_argument('--threads', type=int, default=16, help='Parallel workers')
+    parser.add_argument('--operations', type=int, default=250, help='Consumptions per worker')
+    parser.add_argument('--initial-stock', type=int, default=5000, help='Stock received before the run')
+    parser.add_argument('--max-quantity', type=int, default=3, help='Largest single consumption')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark item and its transactions')
+    args = parser.parse_args()
+    sys.exit(run_benchmark(args.threads, args.operations, args.initial_stock, args.max_quantity, args.keep))
@@ -0,0 +1,28 @@
+import argparse
+import sys
+
+from app import app
+from utils.parquet_export import (DEFAULT_EXPORT_DIR, EXPORT_BATCH_SIZE, EXPORT_TABLES,
+                                  ParquetExporter, ParquetExportError)
+
+def export_parquet(output_dir, tables, full, batch_size):
+    with app.app_context():
+        try:
+            exporter = ParquetExporter(output_dir, batch_size=batch_size)
+            summary = exporter.export(tables, full=full)
+        except ParquetExportError as e:
+            print(f"Export failed: {str(e)}")
+            return 1
+        for table, counts in summary.items():
+            print(f"{table}: {counts['rows']} rows in {counts['months']} monthly partitions")
+        return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export analytics tables to month-partitioned Parquet files')
+    parser.add_argument('--output', default=DEFAULT_EXPORT_DIR, help='Directory to write the dataset to')
+    parser.add_argument('--table', action='append', choices=EXPORT_TABLES, dest='tables',
+                        help='Table to export (repeatable, default: all)')
+    parser.add_argument('--full', action='store_true', help='Ignore the watermark and rewrite every partition')
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE, help='Rows per batch')
+    args = parser.parse_args()
+    sys.exit(export_parquet(args.output, args.tables or EXPORT_TABLES, args.full, args.batch_size))
@@ -0,0 +1,12 @@
+import os
+
+# Loaded automatically by `gunicorn main:app` from the project directory.
+#
+# Every open ER board keeps a Server-Sent Events connection (/er/stream),
+# so requests are served by threads: a stream occupies one thread, not a
+# whole sync worker. Streams end after ER_STREAM_MAX_SECONDS and browsers
+# reconnect, which keeps threads from being held indefinitely.
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
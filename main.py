@@ -1,4 +1,11 @@
-from app import app
+import os
+
+from app import app, start_background_schedulers
+
+# gunicorn imports this module; `python main.py` runs it, and under the
+# debug reloader only the restarted child process serves requests
+if __name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+    start_background_schedulers()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
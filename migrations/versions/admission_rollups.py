@@ -0,0 +1,54 @@
+"""Add admission analytics rollup tables
+
+Revision ID: admission_rollups
+Revises: patient_keyset_indexes
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'admission_rollups'
+down_revision = 'patient_keyset_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Importing the app runs db.create_all(), so `flask db upgrade` may find these already created
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('admission_rollup'):
+        _create_admission_rollup()
+    if not inspector.has_table('admission_reason_rollup'):
+        _create_admission_reason_rollup()
+    if 'ix_admission_reason_rollup_admissions' not in {
+            index['name'] for index in inspector.get_indexes('admission_reason_rollup')}:
+        op.create_index('ix_admission_reason_rollup_admissions', 'admission_reason_rollup', ['admissions'])
+    # Rollups are filled from existing admissions by `flask rebuild-admission-rollups`
+
+def _create_admission_rollup():
+    op.create_table('admission_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('granularity', sa.String(length=10), nullable=False),
+        sa.Column('bucket', sa.Date(), nullable=False),
+        sa.Column('priority_level', sa.String(length=20), nullable=False),
+        sa.Column('admitted', sa.Integer(), nullable=False),
+        sa.Column('discharged', sa.Integer(), nullable=False),
+        sa.Column('stay_seconds', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('granularity', 'bucket', 'priority_level', name='uq_admission_rollup_bucket')
+    )
+
+def _create_admission_reason_rollup():
+    op.create_table('admission_reason_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.Text(), nullable=False),
+        sa.Column('admissions', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('reason')
+    )
+
+def downgrade():
+    op.drop_index('ix_admission_reason_rollup_admissions', table_name='admission_reason_rollup')
+    op.drop_table('admission_reason_rollup')
+    op.drop_table('admission_rollup')
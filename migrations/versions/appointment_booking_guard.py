@@ -0,0 +1,51 @@
+"""Add appointment booking guards
+
+Revision ID: appointment_booking_guard
+Revises: admission_rollups
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'appointment_booking_guard'
+down_revision = 'admission_rollups'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Importing the app runs db.create_all(), so `flask db upgrade` may find parts of this already created
+    inspector = sa.inspect(op.get_bind())
+    if 'uq_appointment_doctor_start' not in {index['name'] for index in inspector.get_indexes('appointment')}:
+        _create_booking_index()
+    if not inspector.has_table('appointment_ledger'):
+        op.create_table('appointment_ledger',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('doctor_id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['doctor_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('doctor_id', 'date', name='uq_appointment_ledger_doctor_date')
+        )
+
+def _create_booking_index():
+    # Double bookings made before this guard would fail the unique index; keep the oldest
+    # live appointment per doctor and start time and cancel the rest
+    op.execute("""
+        UPDATE appointment SET status = 'Cancelled'
+        WHERE status != 'Cancelled' AND id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM appointment
+                WHERE status != 'Cancelled' GROUP BY doctor_id, date, time
+            ) AS oldest
+        )
+    """)
+    op.create_index('uq_appointment_doctor_start', 'appointment', ['doctor_id', 'date', 'time'], unique=True,
+                    sqlite_where=sa.text("status != 'Cancelled'"),
+                    postgresql_where=sa.text("status != 'Cancelled'"))
+
+def downgrade():
+    op.drop_table('appointment_ledger')
+    op.drop_index('uq_appointment_doctor_start', table_name='appointment')
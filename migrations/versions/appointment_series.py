@@ -0,0 +1,49 @@
+"""Add recurring appointment series
+
+Revision ID: appointment_series
+Revises: calendar_sync_jobs
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'appointment_series'
+down_revision = 'calendar_sync_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Importing the app runs db.create_all(), so `flask db upgrade` may find the series table already created
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('appointment_series'):
+        _create_appointment_series()
+    if 'series_id' not in {column['name'] for column in inspector.get_columns('appointment')}:
+        with op.batch_alter_table('appointment', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('series_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_appointment_series_id', 'appointment_series', ['series_id'], ['id'])
+
+def _create_appointment_series():
+    op.create_table('appointment_series',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('patient_id', sa.Integer(), nullable=False),
+        sa.Column('doctor_id', sa.Integer(), nullable=False),
+        sa.Column('rule', sa.String(length=200), nullable=False),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('time', sa.Time(), nullable=False),
+        sa.Column('duration', sa.Integer(), nullable=True),
+        sa.Column('title', sa.String(length=200), nullable=True),
+        sa.Column('created_by_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['patient_id'], ['patient.id'], ),
+        sa.ForeignKeyConstraint(['doctor_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['created_by_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+def downgrade():
+    with op.batch_alter_table('appointment', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_appointment_series_id', type_='foreignkey')
+        batch_op.drop_column('series_id')
+    op.drop_table('appointment_series')
@@ -0,0 +1,23 @@
+"""Add indexes for date-windowed appointment listings
+
+Revision ID: appointment_window_indexes
+Revises: appointment_series
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'appointment_window_indexes'
+down_revision = 'appointment_series'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_appointment_doctor_date_time', 'appointment', ['doctor_id', 'date', 'time'])
+    op.create_index('ix_appointment_date_time', 'appointment', ['date', 'time'])
+
+def downgrade():
+    op.drop_index('ix_appointment_date_time', table_name='appointment')
+    op.drop_index('ix_appointment_doctor_date_time', table_name='appointment')
@@ -0,0 +1,49 @@
+"""Add calendar sync job queue and user Google credentials
+
+Revision ID: calendar_sync_jobs
+Revises: appointment_booking_guard
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'calendar_sync_jobs'
+down_revision = 'appointment_booking_guard'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Importing the app runs db.create_all(), so `flask db upgrade` may find the job table already created
+    inspector = sa.inspect(op.get_bind())
+    if 'google_credentials' not in {column['name'] for column in inspector.get_columns('user')}:
+        op.add_column('user', sa.Column('google_credentials', sa.JSON(), nullable=True))
+    if inspector.has_table('calendar_sync_job'):
+        return
+    op.create_table('calendar_sync_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('appointment_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(length=10), nullable=False),
+        sa.Column('calendar_event_id', sa.String(length=100), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('claim_token', sa.String(length=36), nullable=True),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['appointment_id'], ['appointment.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_calendar_sync_job_due', 'calendar_sync_job', ['status', 'next_attempt_at'])
+    op.create_index('ix_calendar_sync_job_appointment', 'calendar_sync_job', ['appointment_id', 'status'])
+
+def downgrade():
+    op.drop_index('ix_calendar_sync_job_appointment', table_name='calendar_sync_job')
+    op.drop_index('ix_calendar_sync_job_due', table_name='calendar_sync_job')
+    op.drop_table('calendar_sync_job')
+    op.drop_column('user', 'google_credentials')
@@ -0,0 +1,21 @@
+"""Add FEFO index on inventory batches
+
+Revision ID: inventory_batch_fefo_index
+Revises: appointment_window_indexes
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'inventory_batch_fefo_index'
+down_revision = 'appointment_window_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_inventory_batch_fefo', 'inventory_batch', ['inventory_item_id', 'expiry_date'])
+
+def downgrade():
+    op.drop_index('ix_inventory_batch_fefo', table_name='inventory_batch')
@@ -0,0 +1,32 @@
+"""Add keyset pagination indexes to Patient table and make created_at NOT NULL
+
+Revision ID: patient_keyset_indexes
+Revises: 2d2c617ec968
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'patient_keyset_indexes'
+down_revision = '2d2c617ec968'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Keyset seeks compare against created_at, which never matches NULL; rows missing it
+    # get their last update time (or now) so no patient falls out of the listing
+    op.execute("UPDATE patient SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) WHERE created_at IS NULL")
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+    # Composite indexes backing the (name, id) and (created_at, id) orderings
+    op.create_index('ix_patient_name_id', 'patient', ['name', 'id'])
+    op.create_index('ix_patient_created_at_id', 'patient', ['created_at', 'id'])
+
+def downgrade():
+    op.drop_index('ix_patient_created_at_id', table_name='patient')
+    op.drop_index('ix_patient_name_id', table_name='patient')
+    with op.batch_alter_table('patient', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,67 @@
+"""Create the patient full-text search index
+
+Revision ID: patient_search_index
+Revises: reorder_purchase_orders
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'patient_search_index'
+down_revision = 'reorder_purchase_orders'
+branch_labels = None
+depends_on = None
+
+# Must match PG_TSVECTOR_SQL in utils/patient_search.py, which queries the index by this expression
+PG_TSVECTOR_SQL = ("to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(contact, '') || ' ' || "
+                   "coalesce(email, '') || ' ' || coalesce(insurance_number, ''))")
+
+BACKFILL_BATCH_SIZE = 1000
+
+def _backfill_fts5(bind):
+    insert = sa.text("INSERT INTO patient_search(rowid, name, contact, contact_digits, email, insurance_number) "
+                     "VALUES (:rowid, :name, :contact, :contact_digits, :email, :insurance_number)")
+    rows = bind.execute(sa.text("SELECT id, name, contact, email, insurance_number FROM patient ORDER BY id"))
+    while True:
+        batch = rows.fetchmany(BACKFILL_BATCH_SIZE)
+        if not batch:
+            break
+        bind.execute(insert, [{
+            'rowid': row.id,
+            'name': row.name or '',
+            'contact': row.contact or '',
+            'contact_digits': re.sub(r'\D', '', row.contact or ''),
+            'email': row.email or '',
+            'insurance_number': row.insurance_number or ''
+        } for row in batch])
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_patient_search_tsv ON patient USING GIN ({PG_TSVECTOR_SQL})")
+    elif bind.dialect.name == 'sqlite':
+        if bind.execute(sa.text("SELECT 1 FROM sqlite_master WHERE name = 'patient_search'")).first():
+            # Already created (and kept in sync) by an app version that built it at startup
+            return
+        try:
+            op.execute("CREATE VIRTUAL TABLE patient_search USING fts5("
+                       "name, contact, contact_digits, email, insurance_number, "
+                       "tokenize = 'unicode61 remove_diacritics 2')")
+        except sa.exc.OperationalError as e:
+            # SQLite built without FTS5; search falls back to LIKE
+            print(f"Skipping patient search index: {e}")
+            return
+        op.execute("CREATE VIRTUAL TABLE patient_search_vocab USING fts5vocab(patient_search, row)")
+        _backfill_fts5(bind)
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_patient_search_tsv")
+    elif bind.dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS patient_search_vocab")
+        op.execute("DROP TABLE IF EXISTS patient_search")
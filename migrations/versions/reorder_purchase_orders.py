@@ -0,0 +1,63 @@
+"""Consolidate automated reorders into supplier purchase orders
+
+Revision ID: reorder_purchase_orders
+Revises: inventory_batch_fefo_index
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'reorder_purchase_orders'
+down_revision = 'inventory_batch_fefo_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Importing the app runs db.create_all(), so `flask db upgrade` may find parts of this already created
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('purchase_order'):
+        _create_purchase_order()
+    if 'purchase_order_id' not in {column['name'] for column in inspector.get_columns('automated_order')}:
+        with op.batch_alter_table('automated_order', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('purchase_order_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_automated_order_purchase_order_id', 'purchase_order',
+                                        ['purchase_order_id'], ['id'])
+    if 'uq_automated_order_pending_item' not in {
+            index['name'] for index in inspector.get_indexes('automated_order')}:
+        _create_pending_item_index()
+
+def _create_purchase_order():
+    op.create_table('purchase_order',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('supplier_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('expected_delivery', sa.Date(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['supplier_id'], ['supplier.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+def _create_pending_item_index():
+    # Every qualifying transaction used to add another pending order; keep the oldest per item
+    op.execute("""
+        UPDATE automated_order SET status = 'cancelled'
+        WHERE status = 'pending' AND id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM automated_order
+                WHERE status = 'pending' GROUP BY inventory_item_id
+            ) AS oldest
+        )
+    """)
+    op.create_index('uq_automated_order_pending_item', 'automated_order', ['inventory_item_id'], unique=True,
+                    sqlite_where=sa.text("status = 'pending'"),
+                    postgresql_where=sa.text("status = 'pending'"))
+
+def downgrade():
+    op.drop_index('uq_automated_order_pending_item', table_name='automated_order')
+    with op.batch_alter_table('automated_order', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_automated_order_purchase_order_id', type_='foreignkey')
+        batch_op.drop_column('purchase_order_id')
+    op.drop_table('purchase_order')
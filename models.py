@@ -11,6 +11,10 @@ PRIORITY_LEVELS = {
     'non_urgent': 5    # Blue - Non-urgent
 }
 
+# Waiting patients gain one priority point per this many hours, up to the cap
+PRIORITY_AGING_HOURS_PER_POINT = 2
+MAX_PRIORITY_AGING_BOOST = 3
+
 TRIAGE_COLORS = {
     'immediate': 'red',
     'emergency': 'orange',
@@ -48,6 +52,7 @@ class User(UserMixin, db.Model):
     break_end_time = db.Column(db.Time)
     is_available = db.Column(db.Boolean, default=True)
     availability_notes = db.Column(db.Text)
+    google_credentials = db.Column(db.JSON)  # Authorized-user info for Google Calendar sync
     # Relationships
     appointments = db.relationship('Appointment', backref='doctor', lazy=True)
     prescriptions = db.relationship('Prescription', backref='doctor', lazy=True)
@@ -64,6 +69,11 @@ class User(UserMixin, db.Model):
 
 
 class Patient(db.Model):
+    __table_args__ = (
+        # Keyset pagination orders by (name, id) or (created_at, id)
+        db.Index('ix_patient_name_id', 'name', 'id'),
+        db.Index('ix_patient_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     age = db.Column(db.Integer, nullable=False)
@@ -77,7 +87,7 @@ class Patient(db.Model):
     emergency_contact_number = db.Column(db.String(20))
     insurance_provider = db.Column(db.String(100))
     insurance_number = db.Column(db.String(50))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Keyset sort key
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     # Relationships
     appointments = db.relationship('Appointment', backref='patient', lazy=True)
@@ -106,11 +116,16 @@ class Ward(db.Model):
 
     def get_available_beds(self):
         """Get number of available beds in the ward"""
-        return len([bed for bed in self.beds if not bed.occupied])
+        from utils.ward_occupancy import get_ward_counts
+        return get_ward_counts(self.id)['free']
 
     def get_next_available_bed(self):
         """Get the next available bed in the ward"""
-        return next((bed for bed in self.beds if not bed.occupied), None)
+        return Bed.query.filter(
+            Bed.ward_id == self.id,
+            Bed.occupied.isnot(True),
+            db.or_(Bed.status.is_(None), Bed.status == 'available')
+        ).order_by(Bed.number).first()
 
 class Bed(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -145,6 +160,7 @@ class Admission(db.Model):
     estimated_wait_time = db.Column(db.Integer)  # in minutes
     actual_wait_time = db.Column(db.Integer)  # in minutes
     queue_position = db.Column(db.Integer)  # Position in the waiting list
+    expected_duration = db.Column(db.Integer)  # Expected length of stay in days
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     # Update relationship to use back_populates
@@ -152,10 +168,12 @@ class Admission(db.Model):
 
     def update_priority_score(self):
         """Update priority score based on various factors"""
-        base_score = PRIORITY_LEVELS.get(self.triage_category, 4)
+        # Ward admissions have no triage category; fall back to their priority level
+        base_score = PRIORITY_LEVELS.get(self.triage_category or self.priority_level, 4)
         wait_time = (datetime.utcnow() - self.created_at).total_seconds() / 3600  # hours
-        # Priority increases (score decreases) with wait time
-        time_factor = min(wait_time / 2, 3)  # Max 3 point boost from wait time
+        # Priority increases (score decreases) with wait time, in whole points
+        # to match the integer column and the bulk aging UPDATE
+        time_factor = min(int(wait_time // PRIORITY_AGING_HOURS_PER_POINT), MAX_PRIORITY_AGING_BOOST)
         self.priority_score = max(1, base_score - time_factor)
 
     def calculate_estimated_wait_time(self, average_treatment_time=30):
@@ -163,6 +181,12 @@ class Admission(db.Model):
         if self.status != 'waiting':
             return 0
 
+        # Answer from the in-memory queue when the admission is tracked there
+        from utils.admission_queue import admission_queue
+        if self.id in admission_queue:
+            self.estimated_wait_time = admission_queue.estimated_wait_time(self.id)
+            return self.estimated_wait_time
+
         # Get all waiting patients with higher priority
         higher_priority = Admission.query.filter(
             Admission.status == 'waiting',
@@ -189,15 +213,30 @@ class AdmissionQueue(db.Model):
 
     @staticmethod
     def update_queue_positions():
-        """Update queue positions based on priority scores"""
-        waiting_admissions = (Admission.query
-                            .filter_by(status='waiting')
-                            .order_by(Admission.priority_score)
-                            .all())
+        """Persist queue positions and wait times from the in-memory admission queue"""
+        from utils.admission_queue import admission_queue
+        return admission_queue.flush_positions()
 
-        for position, admission in enumerate(waiting_admissions, 1):
-            admission.queue_position = position
-            admission.calculate_estimated_wait_time()
+
+class AdmissionRollup(db.Model):
+    """Admission counts pre-aggregated per day/month bucket and priority level"""
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # day, month
+    bucket = db.Column(db.Date, nullable=False)  # First day of the bucket
+    priority_level = db.Column(db.String(20), nullable=False)
+    admitted = db.Column(db.Integer, nullable=False, default=0)
+    discharged = db.Column(db.Integer, nullable=False, default=0)  # Counted in the bucket of the discharge date
+    stay_seconds = db.Column(db.BigInteger, nullable=False, default=0)  # Total length of stay of those discharges
+
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket', 'priority_level', name='uq_admission_rollup_bucket'),
+    )
+
+class AdmissionReasonRollup(db.Model):
+    """Number of admissions per admission reason"""
+    id = db.Column(db.Integer, primary_key=True)
+    reason = db.Column(db.Text, nullable=False, unique=True)
+    admissions = db.Column(db.Integer, nullable=False, default=0, index=True)
 
 
 class MedicalHistory(db.Model):
@@ -273,11 +312,22 @@ class Appointment(db.Model):
     duration = db.Column(db.Integer, default=30)  # Duration in minutes
     status = db.Column(db.String(20), nullable=False, default='Scheduled')
     calendar_event_id = db.Column(db.String(100))  # Google Calendar event ID
+    series_id = db.Column(db.Integer, db.ForeignKey('appointment_series.id'))  # Set for recurring appointments
     title = db.Column(db.String(200))
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # At most one live appointment per doctor and start time; cancelling frees the slot
+        db.Index('uq_appointment_doctor_start', 'doctor_id', 'date', 'time', unique=True,
+                 sqlite_where=db.text("status != 'Cancelled'"),
+                 postgresql_where=db.text("status != 'Cancelled'")),
+        # Date-window listings: per doctor, and across all doctors
+        db.Index('ix_appointment_doctor_date_time', 'doctor_id', 'date', 'time'),
+        db.Index('ix_appointment_date_time', 'date', 'time'),
+    )
+
     @property
     def start_time(self):
         """Combine date and time into datetime object"""
@@ -301,6 +351,65 @@ class Appointment(db.Model):
             update_calendar_event(calendar_service, self.calendar_event_id, self)
 
 
+class AppointmentSeries(db.Model):
+    """Recurring appointments generated from one recurrence rule, e.g. weekly dialysis"""
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    rule = db.Column(db.String(200), nullable=False)  # RRULE subset, see utils.recurrence
+    start_date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    duration = db.Column(db.Integer, default=30)  # Duration in minutes
+    title = db.Column(db.String(200))
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    appointments = db.relationship('Appointment', backref='series', lazy=True)
+
+    @property
+    def recurrence(self):
+        from utils.recurrence import RecurrenceRule
+        return RecurrenceRule.parse(self.rule)
+
+    def occurrences(self):
+        """Dates of the series, generated lazily from the rule"""
+        return self.recurrence.occurrences(self.start_date)
+
+class AppointmentLedger(db.Model):
+    """Booking version per doctor and day; every reservation bumps it so concurrent ones conflict"""
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'date', name='uq_appointment_ledger_doctor_date'),
+    )
+
+class CalendarSyncJob(db.Model):
+    """Pending Google Calendar change for an appointment, drained by the calendar sync worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Whose calendar to write to
+    action = db.Column(db.String(10), nullable=False)  # upsert, delete
+    calendar_event_id = db.Column(db.String(100))  # Event to delete, captured when the delete was queued
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(36))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    appointment = db.relationship('Appointment')
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.Index('ix_calendar_sync_job_due', 'status', 'next_attempt_at'),
+        db.Index('ix_calendar_sync_job_appointment', 'appointment_id', 'status'),
+    )
+
 class LabTestCategory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -381,6 +490,11 @@ class InventoryBatch(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        # First-expiry-first-out allocation walks an item's batches in expiry order
+        db.Index('ix_inventory_batch_fefo', 'inventory_item_id', 'expiry_date'),
+    )
+
     def is_expired(self):
         """Check if batch is expired"""
         return self.expiry_date <= date.today()
@@ -402,17 +516,37 @@ class InventoryTransaction(db.Model):
     notes = db.Column(db.Text)
     unit_cost = db.Column(db.Numeric(10, 2))  # Cost at time of transaction
 
+class PurchaseOrder(db.Model):
+    """Reorder lines for one supplier, consolidated by the reorder evaluator"""
+    id = db.Column(db.Integer, primary_key=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'))  # None for items without a supplier
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, approved, ordered, received, cancelled
+    expected_delivery = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    supplier = db.relationship('Supplier', backref='purchase_orders')
+    lines = db.relationship('AutomatedOrder', backref='purchase_order', lazy=True)
+
 class AutomatedOrder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     inventory_item_id = db.Column(db.Integer, db.ForeignKey('inventory_item.id'), nullable=False)
+    purchase_order_id = db.Column(db.Integer, db.ForeignKey('purchase_order.id'))
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
     quantity = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, approved, ordered, received
+    status = db.Column(db.String(20), default='pending')  # pending, approved, ordered, received, cancelled
     suggested_by = db.Column(db.String(50))  # low_stock, expiry, usage_pattern
     approved_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    item = db.relationship('InventoryItem')
+
+    __table_args__ = (
+        # At most one pending reorder per item, however many evaluators run at once
+        db.Index('uq_automated_order_pending_item', 'inventory_item_id', unique=True,
+                 sqlite_where=db.text("status = 'pending'"),
+                 postgresql_where=db.text("status = 'pending'")),
+    )
 
 # Add after the existing models
 class Ambulance(db.Model):
@@ -3,7 +3,8 @@ from flask import Blueprint, flash, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
 from app import db
 from models import Appointment, User, Patient
-from utils.google_calendar import create_calendar_service, get_oauth_flow
+from utils.google_calendar import get_oauth_flow
+from utils.calendar_sync import enqueue_calendar_sync
 
 appointments = Blueprint('appointments', __name__)
 
@@ -41,16 +42,11 @@ def new_appointment():
         )
 
         try:
-            # Create the appointment in the database
+            # Create the appointment and queue its calendar event in one transaction
             db.session.add(appointment)
+            enqueue_calendar_sync(appointment, 'upsert', current_user)
             db.session.commit()
 
-            # Sync with Google Calendar if credentials are available
-            if current_user.google_credentials:
-                service = create_calendar_service(current_user.google_credentials)
-                appointment.sync_with_calendar(service)
-                db.session.commit()
-
             flash('Appointment created successfully!', 'success')
             return redirect(url_for('appointments.list_appointments'))
         except Exception as e:
@@ -75,11 +71,8 @@ def edit_appointment(id):
         appointment.description = request.form.get('description')
 
         try:
-            # Update the appointment in Google Calendar if synchronized
-            if appointment.calendar_event_id and current_user.google_credentials:
-                service = create_calendar_service(current_user.google_credentials)
-                appointment.sync_with_calendar(service)
-
+            # Queue the calendar update; the sync worker sends it
+            enqueue_calendar_sync(appointment, 'upsert', current_user)
             db.session.commit()
             flash('Appointment updated successfully!', 'success')
             return redirect(url_for('appointments.list_appointments'))
@@ -102,13 +95,8 @@ def cancel_appointment(id):
     appointment.status = 'Cancelled'
 
     try:
-        # Delete the event from Google Calendar if synchronized
-        if appointment.calendar_event_id and current_user.google_credentials:
-            service = create_calendar_service(current_user.google_credentials)
-            service.events().delete(calendarId='primary', 
-                                 eventId=appointment.calendar_event_id).execute()
-            appointment.calendar_event_id = None
-
+        # Queue removal of the calendar event; the sync worker sends it
+        enqueue_calendar_sync(appointment, 'delete', current_user)
         db.session.commit()
         flash('Appointment cancelled successfully!', 'success')
     except Exception as e:
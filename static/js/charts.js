@@ -1,53 +1,105 @@
-// Initialize dashboard charts
-function initDashboardCharts() {
-    // Patient Statistics Chart
-    const patientCtx = document.getElementById('patientStats').getContext('2d');
-    new Chart(patientCtx, {
-        type: 'line',
-        data: {
-            labels: ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun'],
-            datasets: [{
-                label: 'Patient Admissions',
-                data: [65, 59, 80, 81, 56, 55],
-                borderColor: '#0d6efd',
-                tension: 0.1
-            }]
-        },
-        options: {
-            responsive: true,
-            plugins: {
-                legend: {
-                    position: 'top',
+// Initialize dashboard charts from /api/dashboard/metrics
+function initDashboardCharts(metricsUrl) {
+    // The browser revalidates with the ETag, so repeat loads are a cheap 304
+    fetch(metricsUrl, { credentials: 'same-origin', cache: 'no-cache' })
+        .then(response => response.json())
+        .then(metrics => {
+            // Patient Statistics Chart
+            const patientCtx = document.getElementById('patientStats').getContext('2d');
+            new Chart(patientCtx, {
+                type: 'line',
+                data: {
+                    labels: metrics.admissions_per_month.labels,
+                    datasets: [{
+                        label: 'Patient Admissions',
+                        data: metrics.admissions_per_month.data,
+                        borderColor: '#0d6efd',
+                        tension: 0.1
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    plugins: {
+                        legend: {
+                            position: 'top',
+                        }
+                    }
                 }
-            }
-        }
-    });
+            });
 
-    // Bed Occupancy Chart
-    const bedCtx = document.getElementById('bedOccupancy').getContext('2d');
-    new Chart(bedCtx, {
-        type: 'doughnut',
-        data: {
-            labels: ['Occupied', 'Available'],
-            datasets: [{
-                data: [75, 25],
-                backgroundColor: ['#dc3545', '#198754']
-            }]
-        },
-        options: {
-            responsive: true,
-            plugins: {
-                legend: {
-                    position: 'bottom'
+            // Bed Occupancy Chart
+            const bedCtx = document.getElementById('bedOccupancy').getContext('2d');
+            const beds = metrics.bed_occupancy;
+            new Chart(bedCtx, {
+                type: 'doughnut',
+                data: {
+                    labels: ['Occupied', 'Available', 'Maintenance', 'Reserved'],
+                    datasets: [{
+                        data: [beds.occupied, beds.free, beds.maintenance, beds.reserved],
+                        backgroundColor: ['#dc3545', '#198754', '#ffc107', '#0dcaf0']
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    plugins: {
+                        legend: {
+                            position: 'bottom'
+                        }
+                    }
                 }
+            });
+
+            // Appointment Load Chart
+            const appointmentCanvas = document.getElementById('appointmentLoad');
+            if (appointmentCanvas) {
+                new Chart(appointmentCanvas.getContext('2d'), {
+                    type: 'bar',
+                    data: {
+                        labels: metrics.appointment_load.labels,
+                        datasets: [{
+                            label: 'Booked Appointments',
+                            data: metrics.appointment_load.data,
+                            backgroundColor: '#6f42c1'
+                        }]
+                    },
+                    options: {
+                        responsive: true,
+                        scales: {
+                            y: { beginAtZero: true, ticks: { precision: 0 } }
+                        }
+                    }
+                });
+            }
+
+            // Staff by role
+            const staffCanvas = document.getElementById('staffByRole');
+            if (staffCanvas) {
+                new Chart(staffCanvas.getContext('2d'), {
+                    type: 'pie',
+                    data: {
+                        labels: Object.keys(metrics.staff_by_role),
+                        datasets: [{
+                            data: Object.values(metrics.staff_by_role)
+                        }]
+                    },
+                    options: {
+                        responsive: true,
+                        plugins: {
+                            legend: {
+                                position: 'bottom'
+                            }
+                        }
+                    }
+                });
             }
-        }
-    });
+        })
+        .catch(error => console.error('Error loading dashboard metrics:', error));
 }
 
 // Initialize charts when DOM is loaded
 document.addEventListener('DOMContentLoaded', function() {
-    if (document.getElementById('patientStats')) {
-        initDashboardCharts();
+    const patientStats = document.getElementById('patientStats');
+    if (patientStats) {
+        initDashboardCharts(patientStats.dataset.metricsUrl);
     }
 });
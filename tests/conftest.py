@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+# The app builds its schema on import, so point it at a scratch database first
+_db_dir = tempfile.mkdtemp(prefix='hospital-tracker-tests-')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ['RUN_BACKGROUND_SCHEDULERS'] = '0'
+os.environ['PRIORITY_AGING_INTERVAL'] = '0'
+os.environ['CALENDAR_SYNC_INTERVAL'] = '0'
+os.environ['REORDER_EVALUATION_INTERVAL'] = '0'
+
+from app import app as flask_app  # noqa: E402
+from extensions import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture
+def user(app):
+    from models import User
+    user = User(username='tester', email='tester@example.com', name='Tester', role='admin',
+                password_hash=generate_password_hash('secret'))
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    client.post('/login', data={'username': 'tester', 'password': 'secret'})
+    return client
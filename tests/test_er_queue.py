@@ -0,0 +1,25 @@
+from models import Admission
+from utils.admission_queue import admission_queue
+
+
+def _add_er_patient(client, name, triage_category):
+    return client.post('/er/patients/add', data={
+        'name': name,
+        'age': 40,
+        'gender': 'F',
+        'triage_category': triage_category,
+        'chief_complaint': 'Chest pain'
+    })
+
+
+def test_new_er_patient_is_queued_by_triage_category(client):
+    admission_queue.rebuild()
+    _add_er_patient(client, 'Walk In', 'non_urgent')
+    _add_er_patient(client, 'Cardiac Arrest', 'immediate')
+
+    walk_in = Admission.query.filter_by(triage_category='non_urgent').one()
+    critical = Admission.query.filter_by(triage_category='immediate').one()
+
+    assert critical.priority_score == 1
+    assert walk_in.priority_score == 5
+    assert admission_queue.position(critical.id) < admission_queue.position(walk_in.id)
@@ -0,0 +1,71 @@
+import pytest
+
+from extensions import db
+from utils.pagination import keyset_paginate
+from utils.patient_chart import CHART_SECTIONS, _section_spec, load_chart_section
+
+
+@pytest.fixture
+def patient(app, user):
+    from models import Patient
+    patient = Patient(name='Paged Patient', age=50, gender='M', contact='555-987-6543')
+    db.session.add(patient)
+    db.session.commit()
+    return patient
+
+
+def _add_entries(section, patient, user, count):
+    from models import (Admission, LabTest, LabTestCategory, MedicalHistory, PatientAllergy,
+                        PatientDocument, Prescription, VitalSign)
+    category = LabTestCategory(name='Haematology')
+    db.session.add(category)
+    db.session.flush()
+    factories = {
+        'admissions': lambda n: Admission(patient_id=patient.id, attending_doctor_id=user.id,
+                                          admission_reason=f'Reason {n}', status='discharged'),
+        'vital_signs': lambda n: VitalSign(patient_id=patient.id, heart_rate=60 + n),
+        'allergies': lambda n: PatientAllergy(patient_id=patient.id, allergen=f'Allergen {n}'),
+        'medical_history': lambda n: MedicalHistory(patient_id=patient.id, condition=f'Condition {n}'),
+        'documents': lambda n: PatientDocument(patient_id=patient.id, document_type='lab_report',
+                                               title=f'Document {n}', file_path=f'uploads/{n}.pdf'),
+        'prescriptions': lambda n: Prescription(patient_id=patient.id, doctor_id=user.id,
+                                                diagnosis=f'Diagnosis {n}'),
+        'lab_tests': lambda n: LabTest(patient_id=patient.id, doctor_id=user.id, category_id=category.id,
+                                      notes=f'Test {n}')
+    }
+    entries = [factories[section](n) for n in range(count)]
+    db.session.add_all(entries)
+    db.session.commit()
+    return {entry.id for entry in entries}
+
+
+@pytest.mark.parametrize('section', CHART_SECTIONS)
+def test_chart_section_pages_through_every_entry(patient, user, section):
+    expected = _add_entries(section, patient, user, 7)
+
+    seen, cursor = [], None
+    while True:
+        page = load_chart_section(patient.id, section, cursor=cursor, limit=3)
+        seen.extend(entry.id for entry in page.items)
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+
+    assert len(seen) == len(expected)
+    assert set(seen) == expected
+
+
+@pytest.mark.parametrize('section', CHART_SECTIONS)
+def test_chart_section_sort_columns_are_accepted(patient, section):
+    model, columns, _ = _section_spec(section)
+
+    page = keyset_paginate(model.query.filter(model.patient_id == patient.id), columns, descending=True)
+
+    assert page.items == []
+
+
+def test_nullable_sort_column_is_rejected(app):
+    from models import PatientAllergy
+
+    with pytest.raises(ValueError, match='non-nullable'):
+        keyset_paginate(PatientAllergy.query, [PatientAllergy.created_at, PatientAllergy.id])
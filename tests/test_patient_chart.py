@@ -0,0 +1,53 @@
+import pytest
+
+from extensions import db
+from utils.patient_chart import CHART_SECTIONS
+
+
+@pytest.fixture
+def patient(app, user):
+    from models import (MedicalHistory, Patient, PatientAllergy, PatientDocument,
+                        Prescription, VitalSign)
+    patient = Patient(name='Jane Roe', age=40, gender='F', contact='555-123-4567', email='jane@example.com')
+    db.session.add(patient)
+    db.session.flush()
+    db.session.add_all([
+        PatientAllergy(patient_id=patient.id, allergen='Penicillin', severity='severe'),
+        MedicalHistory(patient_id=patient.id, condition='Asthma', status='chronic'),
+        PatientDocument(patient_id=patient.id, document_type='lab_report', title='Blood panel',
+                        file_path='uploads/blood-panel.pdf', uploaded_by_id=user.id),
+        Prescription(patient_id=patient.id, doctor_id=user.id, diagnosis='Bronchitis'),
+        VitalSign(patient_id=patient.id, heart_rate=72, recorded_by_id=user.id)
+    ])
+    db.session.commit()
+    return patient
+
+
+def test_patient_detail_renders(client, patient):
+    response = client.get(f'/patients/{patient.id}')
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    for text in ('Jane Roe', 'Penicillin', 'Asthma', 'Blood panel', 'Bronchitis'):
+        assert text in page
+
+
+def test_patient_detail_renders_with_empty_chart(client, app):
+    from models import Patient
+    patient = Patient(name='New Patient', age=30, gender='M', contact='555-000-0000')
+    db.session.add(patient)
+    db.session.commit()
+
+    assert client.get(f'/patients/{patient.id}').status_code == 200
+
+
+def test_patient_detail_missing_patient(client):
+    assert client.get('/patients/999999').status_code == 404
+
+
+@pytest.mark.parametrize('section', CHART_SECTIONS)
+def test_chart_section_api(client, patient, section):
+    response = client.get(f'/api/patients/{patient.id}/chart/{section}')
+
+    assert response.status_code == 200
+    assert response.json['section'] == section
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import text
+
+from extensions import db
+from utils import patient_search
+from utils.patient_search import detect_search_backend, search_patients
+
+
+@pytest.fixture
+def patients(app):
+    from models import Patient
+    jane = Patient(name='Jane Roe', age=40, gender='F', contact='(555) 123-4567', email='jane@example.com')
+    john = Patient(name='John Doe', age=52, gender='M', contact='555.987.6543', email='john@example.com')
+    db.session.add_all([jane, john])
+    db.session.commit()
+    return jane, john
+
+
+@pytest.mark.parametrize('query', ['5551234567', '555 123 4567', '555-123-4567', '1234567'])
+def test_like_search_finds_phone_numbers_typed_any_way(patients, query):
+    jane, _ = patients
+
+    assert detect_search_backend() == 'like'
+    assert search_patients(query) == [jane]
+
+
+def test_like_search_by_name(patients):
+    jane, john = patients
+
+    assert search_patients('john') == [john]
+    assert search_patients('roe') == [jane]
+
+
+def test_backend_switches_to_fts5_once_the_index_exists(app):
+    assert detect_search_backend() == 'like'
+    db.session.execute(text("CREATE VIRTUAL TABLE patient_search USING fts5("
+                            "name, contact, contact_digits, email, insurance_number)"))
+    db.session.commit()
+    try:
+        assert detect_search_backend() == 'fts5'
+    finally:
+        db.session.execute(text("DROP TABLE patient_search"))
+        db.session.commit()
+        patient_search._backend['name'] = None
@@ -0,0 +1,353 @@
+import logging
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+
+from sqlalchemy import update
+
+from extensions import db
+from utils.er_events import er_broker, publish_queue_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Average minutes spent treating one patient, used for wait estimates
+AVERAGE_TREATMENT_TIME = 30
+
+# Number of rows written per executemany when persisting queue positions
+POSITION_FLUSH_BATCH_SIZE = 500
+
+# Seconds a published ER board snapshot stays valid when the queue does not change
+DEFAULT_SNAPSHOT_MAX_AGE = 60
+
+
+class IndexedHeap:
+    """Binary min-heap with a key -> slot index so entries can be updated or removed in O(log n)"""
+
+    def __init__(self):
+        self._heap = []   # list of (sort_key, item_id)
+        self._index = {}  # item_id -> position in self._heap
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item_id):
+        return item_id in self._index
+
+    def get_key(self, item_id):
+        """Return the sort key currently stored for an item"""
+        return self._heap[self._index[item_id]][0]
+
+    def push(self, item_id, sort_key):
+        """Insert an item, or move it if it is already present"""
+        if item_id in self._index:
+            pos = self._index[item_id]
+            old_key = self._heap[pos][0]
+            self._heap[pos] = (sort_key, item_id)
+            if sort_key < old_key:
+                self._sift_up(pos)
+            else:
+                self._sift_down(pos)
+            return
+        self._heap.append((sort_key, item_id))
+        self._index[item_id] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def remove(self, item_id):
+        """Remove an item, returning its sort key or None if absent"""
+        pos = self._index.pop(item_id, None)
+        if pos is None:
+            return None
+        removed_key = self._heap[pos][0]
+        last = self._heap.pop()
+        if pos < len(self._heap):
+            self._heap[pos] = last
+            self._index[last[1]] = pos
+            self._sift_up(pos)
+            self._sift_down(self._index[last[1]])
+        return removed_key
+
+    def peek(self):
+        """Return (sort_key, item_id) of the smallest entry without removing it"""
+        return self._heap[0] if self._heap else None
+
+    def pop(self):
+        """Remove and return (sort_key, item_id) of the smallest entry"""
+        if not self._heap:
+            return None
+        top = self._heap[0]
+        self.remove(top[1])
+        return top
+
+    def clear(self):
+        self._heap.clear()
+        self._index.clear()
+
+    def _swap(self, i, j):
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._index[self._heap[i][1]] = i
+        self._index[self._heap[j][1]] = j
+
+    def _sift_up(self, pos):
+        while pos > 0:
+            parent = (pos - 1) // 2
+            if self._heap[pos] < self._heap[parent]:
+                self._swap(pos, parent)
+                pos = parent
+            else:
+                break
+
+    def _sift_down(self, pos):
+        size = len(self._heap)
+        while True:
+            smallest = pos
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < size and self._heap[child] < self._heap[smallest]:
+                    smallest = child
+            if smallest == pos:
+                break
+            self._swap(pos, smallest)
+            pos = smallest
+
+
+def queue_sort_key(admission):
+    """Ordering used for the waiting list: priority score, then arrival time, then id"""
+    return (admission.priority_score,
+            admission.created_at or datetime.min,
+            admission.id)
+
+
+class QueueSnapshot:
+    """Immutable, render-ready copy of the waiting list served to the ER board"""
+
+    def __init__(self, entries, version):
+        self.entries = entries
+        self.version = version
+        self.built_at = datetime.utcnow()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def avg_wait_time(self):
+        if not self.entries:
+            return 0
+        return round(sum(e['estimated_wait_time'] for e in self.entries) / len(self.entries))
+
+    def age_seconds(self):
+        return (datetime.utcnow() - self.built_at).total_seconds()
+
+
+class AdmissionPriorityQueue:
+    """In-memory view of all waiting admissions.
+
+    The indexed heap gives O(log n) insert/update/remove and access to the
+    next patient; a parallel sorted key list answers rank queries (queue
+    position, number of higher-priority patients) with a binary search.
+    Positions are written back to the database in batches by flush_positions().
+    """
+
+    def __init__(self, average_treatment_time=AVERAGE_TREATMENT_TIME):
+        self.average_treatment_time = average_treatment_time
+        self._heap = IndexedHeap()
+        self._ranked = []      # sorted list of sort keys
+        self._persisted = {}   # admission_id -> (queue_position, estimated_wait_time) last written
+        self._version = 0      # bumped on every change to the queue
+        self._snapshot = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, admission_id):
+        return admission_id in self._heap
+
+    def rebuild(self):
+        """Reload the queue from all waiting admissions in the database"""
+        from models import Admission
+
+        rows = db.session.query(
+            Admission.id,
+            Admission.priority_score,
+            Admission.created_at,
+            Admission.queue_position,
+            Admission.estimated_wait_time
+        ).filter(Admission.status == 'waiting').all()
+
+        with self._lock:
+            self._heap.clear()
+            self._ranked = []
+            self._persisted = {}
+            for admission_id, score, created_at, position, wait in rows:
+                key = (score, created_at or datetime.min, admission_id)
+                self._heap.push(admission_id, key)
+                self._ranked.append(key)
+                self._persisted[admission_id] = (position, wait)
+            self._ranked.sort()
+            self._version += 1
+        logger.debug(f"Admission queue rebuilt with {len(rows)} waiting admissions")
+
+    def sync(self, admission):
+        """Add, move or drop an admission depending on its current status"""
+        if admission.status == 'waiting':
+            self.push(admission)
+        else:
+            self.discard(admission.id)
+
+    def push(self, admission):
+        """Insert a waiting admission or reposition it after its priority changed"""
+        key = queue_sort_key(admission)
+        with self._lock:
+            if admission.id in self._heap:
+                old_key = self._heap.get_key(admission.id)
+                del self._ranked[bisect_left(self._ranked, old_key)]
+            self._heap.push(admission.id, key)
+            insort(self._ranked, key)
+            self._version += 1
+
+    def discard(self, admission_id):
+        """Drop an admission from the queue (admitted to a bed or discharged)"""
+        with self._lock:
+            old_key = self._heap.remove(admission_id)
+            if old_key is not None:
+                del self._ranked[bisect_left(self._ranked, old_key)]
+                self._version += 1
+            self._persisted.pop(admission_id, None)
+
+    def peek(self):
+        """Return the id of the highest-priority waiting admission"""
+        with self._lock:
+            top = self._heap.peek()
+            return top[1] if top else None
+
+    def position(self, admission_id):
+        """1-based queue position of an admission, or None if it is not waiting"""
+        with self._lock:
+            if admission_id not in self._heap:
+                return None
+            return bisect_left(self._ranked, self._heap.get_key(admission_id)) + 1
+
+    def estimated_wait_time(self, admission_id):
+        """Estimated wait in minutes, based on patients with a strictly better score"""
+        with self._lock:
+            if admission_id not in self._heap:
+                return 0
+            score = self._heap.get_key(admission_id)[0]
+            higher_priority = bisect_left(self._ranked, (score,))
+            return (higher_priority + 1) * self.average_treatment_time
+
+    def ordered_ids(self):
+        """Admission ids in queue order"""
+        with self._lock:
+            return [key[2] for key in self._ranked]
+
+    def _ranked_positions(self):
+        """Yield (admission_id, queue_position, estimated_wait_time) in queue order in one pass"""
+        higher_priority = 0
+        previous_score = None
+        for position, key in enumerate(self._ranked, 1):
+            if key[0] != previous_score:
+                higher_priority = position - 1
+                previous_score = key[0]
+            yield key[2], position, (higher_priority + 1) * self.average_treatment_time
+
+    def flush_positions(self, batch_size=POSITION_FLUSH_BATCH_SIZE):
+        """Persist queue_position and estimated_wait_time for rows that changed.
+
+        Returns the number of admissions updated.
+        """
+        from models import Admission
+
+        with self._lock:
+            changes = []
+            for admission_id, position, wait in self._ranked_positions():
+                if self._persisted.get(admission_id) != (position, wait):
+                    changes.append({
+                        'id': admission_id,
+                        'queue_position': position,
+                        'estimated_wait_time': wait
+                    })
+            if not changes:
+                return 0
+
+            try:
+                for start in range(0, len(changes), batch_size):
+                    db.session.execute(update(Admission), changes[start:start + batch_size])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error persisting admission queue positions: {str(e)}")
+                return 0
+
+            for change in changes:
+                self._persisted[change['id']] = (change['queue_position'],
+                                                 change['estimated_wait_time'])
+        return len(changes)
+
+    def commit_changes(self):
+        """Persist shifted positions and push the new queue to connected ER viewers"""
+        updated = self.flush_positions()
+        if er_broker.subscriber_count:
+            self.publish()
+        return updated
+
+    def snapshot(self, max_age=DEFAULT_SNAPSHOT_MAX_AGE):
+        """Return the published ER board snapshot.
+
+        A new snapshot is only built when the queue changed since the last one
+        or when the current one is older than max_age seconds; otherwise the
+        cached copy is returned without touching the database.
+        """
+        current = self._snapshot
+        if (current is not None and current.version == self._version
+                and current.age_seconds() < max_age):
+            return current
+        return self.publish()
+
+    def publish(self):
+        """Build a fresh snapshot with a single joined read and push its delta to ER viewers"""
+        from models import Admission, Patient
+
+        with self._lock:
+            version = self._version
+            ranked = list(self._ranked_positions())
+
+        rows = {}
+        if ranked:
+            query = db.session.query(
+                Admission.id,
+                Admission.patient_id,
+                Patient.name,
+                Admission.triage_category,
+                Admission.chief_complaint,
+                Admission.status,
+                Admission.created_at
+            ).join(Patient, Patient.id == Admission.patient_id).filter(
+                Admission.status == 'waiting'
+            )
+            rows = {row.id: row for row in query}
+
+        entries = []
+        for admission_id, position, wait in ranked:
+            row = rows.get(admission_id)
+            if row is None:
+                continue
+            entries.append({
+                'id': row.id,
+                'patient_id': row.patient_id,
+                'patient_name': row.name,
+                'triage_category': row.triage_category,
+                'chief_complaint': row.chief_complaint,
+                'status': row.status,
+                'created_at': row.created_at,
+                'queue_position': position,
+                'estimated_wait_time': wait
+            })
+
+        snapshot = QueueSnapshot(entries, version)
+        previous, self._snapshot = self._snapshot, snapshot
+        publish_queue_snapshot(previous, snapshot)
+        return snapshot
+
+
+# Process-wide queue instance, rebuilt from the database at startup
+admission_queue = AdmissionPriorityQueue()
@@ -0,0 +1,250 @@
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import delete, event, func, insert, inspect, literal_column, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('day', 'month')
+
+# Months shown in the analytics trend chart
+TREND_MONTHS = 12
+
+TOP_REASONS = 10
+
+
+def bucket_start(value, granularity):
+    """First day of the day/month bucket containing value"""
+    if granularity == 'month':
+        return date(value.year, value.month, 1)
+    return date(value.year, value.month, value.day)
+
+
+def date_bucket(column, granularity, dialect):
+    """SQL expression truncating a datetime column to its day/month bucket on any supported dialect"""
+    if dialect == 'postgresql':
+        return func.date_trunc(granularity, column)
+    pattern = '%Y-%m-01' if granularity == 'month' else '%Y-%m-%d'
+    if dialect == 'sqlite':
+        return func.strftime(pattern, column)
+    if dialect in ('mysql', 'mariadb'):
+        return func.date_format(column, pattern)
+    raise ValueError(f'Date bucketing is not supported on {dialect}')
+
+
+def seconds_between(start, end, dialect):
+    """SQL expression for the number of seconds from start to end on any supported dialect"""
+    if dialect == 'postgresql':
+        return func.extract('epoch', end - start)
+    if dialect == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 86400
+    if dialect in ('mysql', 'mariadb'):
+        return func.timestampdiff(literal_column('SECOND'), start, end)
+    raise ValueError(f'Date arithmetic is not supported on {dialect}')
+
+
+def _as_date(value):
+    """Bucket values come back as datetimes on Postgres and strings elsewhere"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _increment(connection, table, keys, increments):
+    """Atomically add increments to the row identified by keys, creating it if needed"""
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        upsert = (sqlite_insert if dialect == 'sqlite' else pg_insert)(table).values(**keys, **increments)
+        connection.execute(upsert.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + upsert.excluded[name] for name in increments}
+        ))
+        return
+    updated = connection.execute(
+        update(table)
+        .where(*[table.c[name] == value for name, value in keys.items()])
+        .values({name: table.c[name] + value for name, value in increments.items()})
+    ).rowcount
+    if not updated:
+        connection.execute(insert(table).values(**keys, **increments))
+
+
+def _record(connection, when, priority_level, **increments):
+    from models import AdmissionRollup
+
+    for granularity in GRANULARITIES:
+        _increment(connection, AdmissionRollup.__table__, {
+            'granularity': granularity,
+            'bucket': bucket_start(when, granularity),
+            'priority_level': priority_level or 'standard'
+        }, increments)
+
+
+# Admission columns the rollups are grouped or filtered by; changing any of
+# them moves the admission's counts from one rollup row to another
+ROLLUP_COLUMNS = ('admission_date', 'priority_level', 'admission_reason', 'status', 'discharge_date')
+
+
+# Rollups are updated in the same transaction as the admission change, so
+# they can never drift from the admissions they summarize.
+
+def _apply(connection, values, sign):
+    """Add (sign=1) or remove (sign=-1) one admission's contribution to every rollup"""
+    from models import AdmissionReasonRollup
+
+    _record(connection, values['admission_date'], values['priority_level'], admitted=sign)
+    if values['admission_reason']:
+        _increment(connection, AdmissionReasonRollup.__table__,
+                   {'reason': values['admission_reason']}, {'admissions': sign})
+    # Historical admissions may be entered already discharged
+    if values['status'] == 'discharged' and values['discharge_date']:
+        stay = max(0, int((values['discharge_date'] - values['admission_date']).total_seconds()))
+        _record(connection, values['discharge_date'], values['priority_level'],
+                discharged=sign, stay_seconds=sign * stay)
+
+
+def _current_values(target):
+    values = {name: getattr(target, name) for name in ROLLUP_COLUMNS}
+    values['admission_date'] = values['admission_date'] or datetime.utcnow()
+    return values
+
+
+def _previous_values(target):
+    """Rollup column values before this flush, or None if none of them changed"""
+    state = inspect(target)
+    values, changed = {}, False
+    for name in ROLLUP_COLUMNS:
+        history = state.attrs[name].history
+        if history.has_changes():
+            changed = True
+            values[name] = history.deleted[0] if history.deleted else None
+        else:
+            values[name] = getattr(target, name)
+    return values if changed else None
+
+
+def _admission_inserted(mapper, connection, target):
+    _apply(connection, _current_values(target), 1)
+
+
+def _admission_updated(mapper, connection, target):
+    previous = _previous_values(target)
+    if previous is None:
+        return
+    if previous['admission_date'] is None:
+        previous['admission_date'] = target.admission_date
+    _apply(connection, previous, -1)
+    _apply(connection, _current_values(target), 1)
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def register_rollup_listeners():
+    from models import Admission
+
+    event.listen(Admission, 'after_insert', _admission_inserted)
+    event.listen(Admission, 'after_update', _admission_updated)
+    # active_history loads the old value of an unloaded column before it is overwritten,
+    # so _previous_values can always take it back out of the right rollup row
+    for name in ROLLUP_COLUMNS:
+        event.listen(getattr(Admission, name), 'set', _load_previous_value, active_history=True, retval=True)
+
+
+def rebuild_admission_rollups():
+    """Recompute every rollup from the Admission table with grouped queries"""
+    from models import Admission, AdmissionReasonRollup, AdmissionRollup
+
+    dialect = db.engine.dialect.name
+    rows = {}
+    for granularity in GRANULARITIES:
+        admitted_bucket = date_bucket(Admission.admission_date, granularity, dialect)
+        for bucket, priority_level, count in db.session.query(
+            admitted_bucket, Admission.priority_level, func.count(Admission.id)
+        ).group_by(admitted_bucket, Admission.priority_level):
+            key = (granularity, _as_date(bucket), priority_level or 'standard')
+            rows.setdefault(key, {'admitted': 0, 'discharged': 0, 'stay_seconds': 0})['admitted'] += count
+
+        discharged_bucket = date_bucket(Admission.discharge_date, granularity, dialect)
+        for bucket, priority_level, count, stay in db.session.query(
+            discharged_bucket, Admission.priority_level, func.count(Admission.id),
+            func.sum(seconds_between(Admission.admission_date, Admission.discharge_date, dialect))
+        ).filter(
+            Admission.status == 'discharged',
+            Admission.discharge_date.isnot(None)
+        ).group_by(discharged_bucket, Admission.priority_level):
+            key = (granularity, _as_date(bucket), priority_level or 'standard')
+            entry = rows.setdefault(key, {'admitted': 0, 'discharged': 0, 'stay_seconds': 0})
+            entry['discharged'] += count
+            entry['stay_seconds'] += max(0, int(round(stay or 0)))
+
+    reasons = db.session.query(
+        Admission.admission_reason, func.count(Admission.id)
+    ).filter(Admission.admission_reason.isnot(None)).group_by(Admission.admission_reason).all()
+
+    try:
+        db.session.execute(delete(AdmissionRollup))
+        db.session.execute(delete(AdmissionReasonRollup))
+        if rows:
+            db.session.execute(insert(AdmissionRollup), [
+                {'granularity': g, 'bucket': b, 'priority_level': p, **counts}
+                for (g, b, p), counts in rows.items()
+            ])
+        if reasons:
+            db.session.execute(insert(AdmissionReasonRollup), [
+                {'reason': reason, 'admissions': count} for reason, count in reasons
+            ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info(f"Rebuilt {len(rows)} admission rollups and {len(reasons)} reason counts")
+    return len(rows)
+
+
+def ensure_admission_rollups():
+    """Backfill the rollups once when upgrading a database that already has admissions"""
+    from models import Admission, AdmissionRollup
+
+    if db.session.query(AdmissionRollup.id).first() is None \
+            and db.session.query(Admission.id).first() is not None:
+        rebuild_admission_rollups()
+
+
+def get_admission_analytics():
+    """Average stay, priority mix, monthly trend and common reasons from the pre-aggregated rows"""
+    from models import AdmissionReasonRollup, AdmissionRollup
+
+    monthly = db.session.query(
+        AdmissionRollup.bucket, AdmissionRollup.priority_level, AdmissionRollup.admitted,
+        AdmissionRollup.discharged, AdmissionRollup.stay_seconds
+    ).filter(AdmissionRollup.granularity == 'month').all()
+
+    by_priority = {}
+    by_month = {}
+    discharged = stay_seconds = 0
+    for bucket, priority_level, admitted_count, discharged_count, stay in monthly:
+        by_priority[priority_level] = by_priority.get(priority_level, 0) + admitted_count
+        by_month[bucket] = by_month.get(bucket, 0) + admitted_count
+        discharged += discharged_count
+        stay_seconds += stay
+
+    common_reasons = db.session.query(
+        AdmissionReasonRollup.reason.label('admission_reason'),
+        AdmissionReasonRollup.admissions.label('count')
+    ).order_by(AdmissionReasonRollup.admissions.desc()).limit(TOP_REASONS).all()
+
+    return {
+        'avg_stay': stay_seconds / discharged / 86400 if discharged else 0,
+        'priority_distribution': sorted(by_priority.items()),
+        'monthly_trends': [(bucket, count) for bucket, count in sorted(by_month.items(), reverse=True)
+                           if count][:TREND_MONTHS],
+        'common_reasons': common_reasons
+    }
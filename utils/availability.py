@@ -0,0 +1,170 @@
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from extensions import db
+
+# Default appointment length, matching Appointment.duration
+DEFAULT_SLOT_MINUTES = 30
+
+# Offered slots start on this grid (minutes past the start of working hours)
+SLOT_STEP_MINUTES = 15
+
+# Longest date range a multi-doctor availability search may cover
+MAX_SEARCH_DAYS = 31
+
+# Appointments in these states do not occupy the doctor
+INACTIVE_STATUSES = ('Cancelled',)
+
+
+def subtract_intervals(free, busy):
+    """Remove busy (start, end) ranges from sorted, disjoint free ranges in one linear merge"""
+    busy = sorted(busy)
+    result = []
+    i = 0
+    for start, end in free:
+        # Skip busy ranges that finish before this free range begins
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        cursor = start
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            busy_start, busy_end = busy[j]
+            if busy_start > cursor:
+                result.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            j += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+class DaySchedule:
+    """A doctor's free time on one day as sorted, disjoint (start, end) intervals.
+
+    Built once from working hours minus breaks minus booked appointments;
+    lookups bisect the interval starts, so finding the next free slots
+    costs O(log n) plus the number of slots returned.
+    """
+
+    def __init__(self, day, origin, free):
+        self.day = day
+        self.origin = origin  # Start of working hours; slots are aligned to it
+        self.free = free
+        self._starts = [start for start, _ in free]
+
+    @classmethod
+    def build(cls, doctor, day, booked=()):
+        """Schedule for doctor on day, or None if they do not work that day"""
+        if not doctor.work_start_time or not doctor.work_end_time:
+            return None
+        working_days = doctor.working_days.split(',') if doctor.working_days else []
+        if day.strftime('%a') not in working_days:
+            return None
+
+        start = datetime.combine(day, doctor.work_start_time)
+        end = datetime.combine(day, doctor.work_end_time)
+        busy = list(booked)
+        if doctor.break_start_time and doctor.break_end_time:
+            busy.append((datetime.combine(day, doctor.break_start_time),
+                         datetime.combine(day, doctor.break_end_time)))
+        free = subtract_intervals([(start, end)], busy) if start < end else []
+        return cls(day, start, free)
+
+    def _interval_at(self, moment):
+        """Index of the first free interval that ends after moment"""
+        i = bisect_right(self._starts, moment) - 1
+        if i < 0 or self.free[i][1] <= moment:
+            i += 1
+        return i
+
+    def is_free(self, start, end):
+        """Whether [start, end) lies entirely inside one free interval"""
+        i = bisect_right(self._starts, start) - 1
+        return i >= 0 and self.free[i][1] >= end
+
+    def next_free_slots(self, count=None, length=DEFAULT_SLOT_MINUTES, after=None, step=SLOT_STEP_MINUTES):
+        """Up to count free slot start times of the given length, starting no earlier than after"""
+        duration = timedelta(minutes=length)
+        step_seconds = step * 60
+        slots = []
+        i = self._interval_at(after) if after else 0
+        while i < len(self.free) and (count is None or len(slots) < count):
+            start, end = self.free[i]
+            if after and after > start:
+                start = after
+            # Round up to the slot grid
+            offset = (start - self.origin).total_seconds()
+            slot = self.origin + timedelta(seconds=-(-offset // step_seconds) * step_seconds)
+            while slot + duration <= end and (count is None or len(slots) < count):
+                slots.append(slot)
+                slot += timedelta(minutes=step)
+            i += 1
+        return slots
+
+
+def load_booked_intervals(doctor_ids, start_day, end_day):
+    """{(doctor_id, date): [(start, end), ...]} for all active appointments in one query"""
+    from models import Appointment
+
+    rows = db.session.query(
+        Appointment.doctor_id, Appointment.date, Appointment.time, Appointment.duration
+    ).filter(
+        Appointment.doctor_id.in_(doctor_ids),
+        Appointment.date.between(start_day, end_day),
+        Appointment.status.notin_(INACTIVE_STATUSES)
+    ).all()
+
+    booked = defaultdict(list)
+    for doctor_id, day, start_time, duration in rows:
+        start = datetime.combine(day, start_time)
+        booked[(doctor_id, day)].append((start, start + timedelta(minutes=duration or DEFAULT_SLOT_MINUTES)))
+    return booked
+
+
+def doctor_day_schedule(doctor, day, exclude_appointment_id=None):
+    """Free-time schedule for one doctor and day, reading their appointments in one query"""
+    from models import Appointment
+
+    query = db.session.query(Appointment.time, Appointment.duration).filter(
+        Appointment.doctor_id == doctor.id,
+        Appointment.date == day,
+        Appointment.status.notin_(INACTIVE_STATUSES)
+    )
+    if exclude_appointment_id is not None:
+        query = query.filter(Appointment.id != exclude_appointment_id)
+    booked = []
+    for start_time, duration in query:
+        start = datetime.combine(day, start_time)
+        booked.append((start, start + timedelta(minutes=duration or DEFAULT_SLOT_MINUTES)))
+    return DaySchedule.build(doctor, day, booked)
+
+
+def search_free_slots(doctors, start_day, end_day, length=DEFAULT_SLOT_MINUTES, limit=20, after=None):
+    """Earliest free slots across several doctors and days, as (start, doctor) pairs.
+
+    All appointments in the range are read with a single query and each
+    doctor's days are scanned once, stopping as soon as that doctor has
+    contributed limit slots; the per-doctor streams are then merged by
+    start time.
+    """
+    doctors = list(doctors)
+    if not doctors or start_day > end_day:
+        return []
+    booked = load_booked_intervals([doctor.id for doctor in doctors], start_day, end_day)
+
+    per_doctor = []
+    for doctor in doctors:
+        slots = []
+        day = start_day
+        while day <= end_day and len(slots) < limit:
+            schedule = DaySchedule.build(doctor, day, booked.get((doctor.id, day), ()))
+            if schedule is not None:
+                slots.extend((slot, doctor.id) for slot in
+                             schedule.next_free_slots(limit - len(slots), length=length, after=after))
+            day += timedelta(days=1)
+        per_doctor.append(slots)
+
+    by_id = {doctor.id: doctor for doctor in doctors}
+    return [(slot, by_id[doctor_id]) for slot, doctor_id in heapq.merge(*per_doctor)][:limit]
@@ -0,0 +1,204 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, or_, select, update
+
+from extensions import db
+from utils.admission_queue import IndexedHeap, admission_queue, queue_sort_key
+from utils.er_events import publish_bed_change
+
+logger = logging.getLogger(__name__)
+
+
+class BedAllocator:
+    """Matches free beds to waiting admissions per ward type.
+
+    Free beds and queued admissions are kept in one indexed heap per
+    ward_type, so the next bed and the highest-priority patient needing
+    that ward type are both found in O(log n). Assignments are written
+    with conditional UPDATEs so a bed or admission taken by another
+    worker in the meantime is skipped rather than double-booked.
+    """
+
+    def __init__(self):
+        self._free_beds = defaultdict(IndexedHeap)  # ward_type -> bed ids keyed by (ward_id, number)
+        self._waiting = defaultdict(IndexedHeap)    # ward_type -> admission ids keyed by queue order
+        self._bed_types = {}                        # bed_id -> ward_type
+        self._admission_types = {}                  # admission_id -> ward_type
+        self._lock = threading.RLock()
+
+    def rebuild(self):
+        """Reload free beds and queued admissions from the database"""
+        from models import Admission, AdmissionQueue, Bed, Ward
+
+        beds = db.session.query(
+            Bed.id, Bed.ward_id, Bed.number, Ward.ward_type
+        ).join(Ward, Ward.id == Bed.ward_id).filter(
+            Bed.occupied.isnot(True),
+            or_(Bed.status.is_(None), Bed.status == 'available')
+        ).all()
+
+        waiting = db.session.query(
+            Admission, AdmissionQueue.ward_type_needed
+        ).join(AdmissionQueue, AdmissionQueue.admission_id == Admission.id).filter(
+            Admission.status == 'waiting'
+        ).all()
+
+        with self._lock:
+            self._free_beds.clear()
+            self._waiting.clear()
+            self._bed_types = {}
+            self._admission_types = {}
+            for bed_id, ward_id, number, ward_type in beds:
+                self._free_beds[ward_type].push(bed_id, (ward_id, number, bed_id))
+                self._bed_types[bed_id] = ward_type
+            for admission, ward_type in waiting:
+                self._waiting[ward_type].push(admission.id, queue_sort_key(admission))
+                self._admission_types[admission.id] = ward_type
+        logger.debug(f"Bed allocator rebuilt with {len(beds)} free beds and {len(waiting)} queued admissions")
+
+    def admission_waiting(self, admission, ward_type):
+        """Track a queued admission, or reposition it after its priority changed"""
+        with self._lock:
+            previous_type = self._admission_types.get(admission.id)
+            if previous_type and previous_type != ward_type:
+                self._waiting[previous_type].remove(admission.id)
+            self._waiting[ward_type].push(admission.id, queue_sort_key(admission))
+            self._admission_types[admission.id] = ward_type
+
+    def reprioritize(self, admission):
+        """Reposition an already tracked admission; no-op for admissions without a queue entry"""
+        with self._lock:
+            ward_type = self._admission_types.get(admission.id)
+            if ward_type:
+                self._waiting[ward_type].push(admission.id, queue_sort_key(admission))
+
+    def admission_removed(self, admission_id):
+        with self._lock:
+            ward_type = self._admission_types.pop(admission_id, None)
+            if ward_type:
+                self._waiting[ward_type].remove(admission_id)
+
+    def bed_taken(self, bed_id):
+        with self._lock:
+            ward_type = self._bed_types.pop(bed_id, None)
+            if ward_type:
+                self._free_beds[ward_type].remove(bed_id)
+
+    def bed_freed(self, bed):
+        """Register a bed that became available and hand it to the next matching patient.
+
+        Returns the list of (admission_id, bed_id) assignments made.
+        """
+        if bed.occupied or (bed.status or 'available') != 'available':
+            self.bed_taken(bed.id)
+            return []
+        ward_type = bed.ward.ward_type
+        with self._lock:
+            self._free_beds[ward_type].push(bed.id, (bed.ward_id, bed.number, bed.id))
+            self._bed_types[bed.id] = ward_type
+        return self.allocate([ward_type])
+
+    def rebalance(self):
+        """Bulk mode for shift changes: reload everything and fill every free bed possible"""
+        self.rebuild()
+        with self._lock:
+            ward_types = list(self._free_beds)
+        return self.allocate(ward_types)
+
+    def allocate(self, ward_types):
+        """Assign free beds to the highest-priority waiting admissions and commit once"""
+        assignments = []
+        try:
+            with self._lock:
+                for ward_type in ward_types:
+                    assignments.extend(self._drain(ward_type))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error allocating beds: {str(e)}")
+            self.rebuild()
+            return []
+
+        if assignments:
+            self._announce(assignments)
+        return assignments
+
+    def _drain(self, ward_type):
+        from models import Admission, AdmissionQueue, Bed
+
+        beds = self._free_beds[ward_type]
+        waiting = self._waiting[ward_type]
+        assignments = []
+        while beds and waiting:
+            bed_id = beds.peek()[1]
+            admission_key, admission_id = waiting.peek()
+
+            claimed = db.session.execute(
+                update(Bed)
+                .where(Bed.id == bed_id, Bed.occupied.isnot(True),
+                       or_(Bed.status.is_(None), Bed.status == 'available'))
+                .values(
+                    occupied=True,
+                    status='occupied',
+                    patient_id=select(Admission.patient_id)
+                    .where(Admission.id == admission_id)
+                    .scalar_subquery()
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not claimed:
+                # Taken, or put into maintenance or reserved, elsewhere since we last looked
+                self.bed_taken(bed_id)
+                continue
+
+            waited = datetime.utcnow() - admission_key[1]
+            activated = db.session.execute(
+                update(Admission)
+                .where(Admission.id == admission_id, Admission.status == 'waiting')
+                .values(
+                    status='active',
+                    bed_id=bed_id,
+                    queue_position=None,
+                    estimated_wait_time=0,
+                    actual_wait_time=int(waited.total_seconds() // 60)
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not activated:
+                # Admission left the queue elsewhere; give the bed back and try the next patient
+                db.session.execute(
+                    update(Bed).where(Bed.id == bed_id)
+                    .values(occupied=False, status='available', patient_id=None)
+                    .execution_options(synchronize_session=False)
+                )
+                self.admission_removed(admission_id)
+                continue
+
+            db.session.execute(
+                delete(AdmissionQueue)
+                .where(AdmissionQueue.admission_id == admission_id)
+                .execution_options(synchronize_session=False)
+            )
+            self.bed_taken(bed_id)
+            self.admission_removed(admission_id)
+            assignments.append((admission_id, bed_id))
+        return assignments
+
+    def _announce(self, assignments):
+        from models import Bed
+
+        for admission_id, _ in assignments:
+            admission_queue.discard(admission_id)
+        admission_queue.commit_changes()
+
+        db.session.expire_all()
+        for bed in Bed.query.filter(Bed.id.in_([bed_id for _, bed_id in assignments])):
+            publish_bed_change(bed)
+        logger.info(f"Bed allocator assigned {len(assignments)} beds")
+
+
+# Process-wide allocator, rebuilt from the database at startup
+bed_allocator = BedAllocator()
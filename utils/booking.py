@@ -0,0 +1,185 @@
+import logging
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from utils.availability import DEFAULT_SLOT_MINUTES, DaySchedule, doctor_day_schedule, load_booked_intervals
+from utils.recurrence import MAX_SERIES_OCCURRENCES
+
+logger = logging.getLogger(__name__)
+
+
+class BookingError(Exception):
+    """A booking request that cannot be satisfied as asked"""
+    status_code = 400
+
+
+class BookingConflict(BookingError):
+    """The requested time was taken, possibly by a concurrent booking; safe to retry"""
+    status_code = 409
+
+
+class SeriesConflict(BookingConflict):
+    """Some dates of a recurring series cannot be booked; dates lists them"""
+
+    def __init__(self, message, dates):
+        super().__init__(message)
+        self.dates = dates
+
+
+def _bump_ledger(doctor_id, day, version):
+    """Advance the doctor-day version from the value read earlier; False if someone else got there first"""
+    from models import AppointmentLedger
+
+    if version is None:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(AppointmentLedger).values(doctor_id=doctor_id, date=day, version=1))
+            return True
+        except IntegrityError:
+            return False
+    return db.session.execute(
+        update(AppointmentLedger)
+        .where(AppointmentLedger.doctor_id == doctor_id,
+               AppointmentLedger.date == day,
+               AppointmentLedger.version == version)
+        .values(version=version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def reserve_appointment(doctor, day, start_time, duration=DEFAULT_SLOT_MINUTES, **fields):
+    """Atomically book [start, start + duration) with doctor and return the pending Appointment.
+
+    Optimistic, per doctor and day: the ledger version is read before the
+    day's appointments, and the booking only goes through if that version
+    is unchanged when it is bumped. A concurrent booking for the same
+    doctor-day makes one of the two raise BookingConflict; bookings for
+    other doctors or days never contend. The partial unique index on
+    (doctor_id, date, time) backs this up at the database level.
+    The caller commits.
+    """
+    from models import Appointment, AppointmentLedger
+
+    start = datetime.combine(day, start_time)
+    end = start + timedelta(minutes=duration)
+
+    working = DaySchedule.build(doctor, day)
+    if working is None:
+        raise BookingError('Doctor is not available on this day')
+    if not working.is_free(start, end):
+        raise BookingError("The requested time is outside the doctor's working hours")
+
+    version = db.session.execute(
+        select(AppointmentLedger.version)
+        .where(AppointmentLedger.doctor_id == doctor.id, AppointmentLedger.date == day)
+    ).scalar()
+
+    schedule = doctor_day_schedule(doctor, day)
+    if not schedule.is_free(start, end):
+        raise BookingConflict('This time slot is already booked')
+
+    if not _bump_ledger(doctor.id, day, version):
+        raise BookingConflict('The schedule changed while booking; please pick the slot again')
+
+    appointment = Appointment(doctor_id=doctor.id, date=day, time=start_time, duration=duration, **fields)
+    db.session.add(appointment)
+    try:
+        with db.session.begin_nested():
+            db.session.flush()
+    except IntegrityError:
+        raise BookingConflict('This time slot is already booked')
+    return appointment
+
+
+def _bump_ledgers(doctor_id, versions, days):
+    """_bump_ledger for many days in two statements; False if any of them changed since read"""
+    from models import AppointmentLedger
+
+    existing = {day: versions[day] for day in days if day in versions}
+    if existing:
+        updated = db.session.execute(
+            update(AppointmentLedger)
+            .where(AppointmentLedger.doctor_id == doctor_id,
+                   AppointmentLedger.date.in_(list(existing)),
+                   AppointmentLedger.version == case(existing, value=AppointmentLedger.date))
+            .values(version=AppointmentLedger.version + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated != len(existing):
+            return False
+    missing = [day for day in days if day not in versions]
+    if missing:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(AppointmentLedger), [
+                    {'doctor_id': doctor_id, 'date': day, 'version': 1} for day in missing
+                ])
+        except IntegrityError:
+            return False
+    return True
+
+
+def reserve_series(doctor, rule, start_date, start_time, duration=DEFAULT_SLOT_MINUTES,
+                   skip_conflicts=False, **fields):
+    """Book every occurrence of rule in one go and return (series, appointment_ids, skipped_dates).
+
+    The same optimistic scheme as reserve_appointment, applied to all of
+    the series' days at once: ledger versions and existing appointments
+    are each read with one query, conflicts are checked in memory, and the
+    ledger bump and the appointments are written as bulk statements. Dates
+    that are taken or outside working hours raise SeriesConflict, unless
+    skip_conflicts is set, in which case they are left out.
+    The caller commits.
+    """
+    from models import Appointment, AppointmentLedger, AppointmentSeries
+
+    days = list(islice(rule.occurrences(start_date), MAX_SERIES_OCCURRENCES + 1))
+    if not days:
+        raise BookingError('The recurrence rule produces no dates')
+    if len(days) > MAX_SERIES_OCCURRENCES:
+        raise BookingError(f'A series may have at most {MAX_SERIES_OCCURRENCES} appointments')
+
+    versions = dict(db.session.execute(
+        select(AppointmentLedger.date, AppointmentLedger.version)
+        .where(AppointmentLedger.doctor_id == doctor.id, AppointmentLedger.date.in_(days))
+    ).all())
+    booked = load_booked_intervals([doctor.id], days[0], days[-1])
+
+    free, skipped = [], []
+    for day in days:
+        start = datetime.combine(day, start_time)
+        schedule = DaySchedule.build(doctor, day, booked.get((doctor.id, day), ()))
+        if schedule is not None and schedule.is_free(start, start + timedelta(minutes=duration)):
+            free.append(day)
+        else:
+            skipped.append(day)
+    if skipped and not skip_conflicts:
+        raise SeriesConflict(f'{len(skipped)} of {len(days)} dates are not available', skipped)
+    if not free:
+        raise BookingError('None of the dates in this series are available')
+
+    if not _bump_ledgers(doctor.id, versions, free):
+        raise BookingConflict('The schedule changed while booking; please try again')
+
+    series = AppointmentSeries(doctor_id=doctor.id, rule=str(rule), start_date=start_date,
+                               time=start_time, duration=duration, **fields)
+    db.session.add(series)
+    db.session.flush()
+
+    row = {'doctor_id': doctor.id, 'patient_id': series.patient_id, 'series_id': series.id,
+           'time': start_time, 'duration': duration, 'title': series.title, 'status': 'Scheduled'}
+    try:
+        with db.session.begin_nested():
+            appointment_ids = db.session.scalars(
+                insert(Appointment).returning(Appointment.id),
+                [dict(row, date=day) for day in free]
+            ).all()
+    except IntegrityError:
+        raise BookingConflict('Some of these slots were just booked; please try again')
+    logger.info(f"Booked series {series.id} with {len(appointment_ids)} appointments "
+                f"({len(skipped)} dates skipped)")
+    return series, appointment_ids, skipped
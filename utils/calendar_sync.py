@@ -0,0 +1,364 @@
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.orm import aliased, joinedload, selectinload
+
+from extensions import db
+from utils.google_calendar import appointment_event_body, calendar_service_cache, get_calendar_service
+
+logger = logging.getLogger(__name__)
+
+# Google accepts at most 50 calls in one batch HTTP request
+CALENDAR_BATCH_SIZE = 50
+
+# Jobs claimed by one worker pass, across all users
+DRAIN_LIMIT = 500
+
+# Default seconds between background sync passes; 0 disables the thread
+DEFAULT_SYNC_INTERVAL = 30
+
+# Retries back off exponentially from the base delay up to the cap, with jitter
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+MAX_SYNC_ATTEMPTS = 8
+
+# A job left 'processing' this long belonged to a worker that died; it is claimed again
+CLAIM_TIMEOUT_SECONDS = 600
+
+# Completed jobs are deleted after this many days; failed ones are kept for inspection
+DONE_JOB_RETENTION_DAYS = 7
+
+# Google's answers for an event that no longer exists
+GONE_STATUSES = (404, 410)
+
+# Runtime metrics of the sync worker in this process
+sync_stats = {
+    'passes': 0,
+    'last_run_at': None,
+    'last_duration_ms': None,
+    'synced': 0,
+    'retried': 0,
+    'failed': 0,
+    'batches': 0,
+    'purged': 0
+}
+
+
+def enqueue_calendar_sync(appointment, action, user):
+    """Record a calendar change for appointment in the caller's transaction.
+
+    action is 'upsert' (create or update the event) or 'delete'. A change
+    still waiting in the queue for the same appointment and calendar is
+    rewritten rather than duplicated, so the worker only sends the latest
+    intent. A delete is queued even before the event exists if its create
+    is still being sent. Returns the job, or None when nothing needs sending.
+    """
+    from models import CalendarSyncJob
+
+    if user is None or not user.google_credentials:
+        return None
+    if appointment.id is None:
+        db.session.flush()
+
+    unfinished = CalendarSyncJob.query.filter(
+        CalendarSyncJob.appointment_id == appointment.id,
+        CalendarSyncJob.user_id == user.id,
+        CalendarSyncJob.status.in_(('pending', 'processing'))
+    ).all()
+    job = next((queued for queued in unfinished if queued.status == 'pending'), None)
+    in_flight = any(queued.status == 'processing' for queued in unfinished)
+
+    if action == 'delete' and not appointment.calendar_event_id and not in_flight:
+        # The event was never created, so a queued create can simply be dropped
+        if job is not None and job.action == 'upsert':
+            db.session.delete(job)
+            return None
+        if job is None:
+            return None
+
+    if job is None:
+        job = CalendarSyncJob(appointment_id=appointment.id, user_id=user.id)
+        db.session.add(job)
+    if action == 'delete':
+        # A create still in flight has no event id yet; the worker looks it up
+        # on the appointment when the delete is sent, after the create finished
+        job.calendar_event_id = appointment.calendar_event_id or (
+            job.calendar_event_id if job.action == 'delete' else None)
+    else:
+        job.calendar_event_id = None
+    job.action = action
+    job.next_attempt_at = datetime.utcnow()
+    return job
+
+
+def enqueue_calendar_sync_many(appointment_ids, user):
+    """Queue calendar events for newly created appointments with one bulk insert"""
+    from models import CalendarSyncJob
+
+    if user is None or not user.google_credentials or not appointment_ids:
+        return 0
+    db.session.execute(insert(CalendarSyncJob), [
+        {'appointment_id': appointment_id, 'user_id': user.id, 'action': 'upsert'}
+        for appointment_id in appointment_ids
+    ])
+    return len(appointment_ids)
+
+
+def retry_delay(attempts):
+    """Backoff before retry number attempts: exponential, capped, with equal jitter"""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def _error_status(error):
+    response = getattr(error, 'resp', None)
+    try:
+        return int(getattr(response, 'status', None))
+    except (TypeError, ValueError):
+        return None
+
+
+def default_service_factory(user):
+    """Calendar service for user: the in-memory fake when CALENDAR_SYNC_FAKE is set, else Google"""
+    if current_app.config.get('CALENDAR_SYNC_FAKE'):
+        from utils.fake_calendar import fake_calendar_service
+        return fake_calendar_service
+    return get_calendar_service(user)
+
+
+def save_refreshed_credentials(user):
+    """Store the access token a cached service refreshed, so other processes can reuse it"""
+    if current_app.config.get('CALENDAR_SYNC_FAKE') or not user.google_credentials:
+        return
+    refreshed = calendar_service_cache.refreshed_credentials(user.id, user.google_credentials)
+    if refreshed:
+        user.google_credentials = refreshed
+
+
+class CalendarSyncWorker:
+    """Drains the calendar sync queue with one batch HTTP request per user and chunk"""
+
+    def __init__(self, service_factory=None):
+        self.service_factory = service_factory or default_service_factory
+
+    def claim(self, limit=DRAIN_LIMIT):
+        """Mark up to limit due jobs as ours with one conditional UPDATE and return them"""
+        from models import Appointment, CalendarSyncJob
+
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+        claimable = or_(
+            and_(CalendarSyncJob.status == 'pending', CalendarSyncJob.next_attempt_at <= now),
+            and_(CalendarSyncJob.status == 'processing', CalendarSyncJob.claimed_at < stale)
+        )
+        # Never run two changes for one appointment at once, or a delete could overtake its create
+        in_flight = aliased(CalendarSyncJob)
+        busy = select(in_flight.appointment_id).where(
+            in_flight.status == 'processing', in_flight.claimed_at >= stale
+        )
+        due = select(CalendarSyncJob.id).where(
+            claimable, CalendarSyncJob.appointment_id.notin_(busy)
+        ).order_by(CalendarSyncJob.next_attempt_at, CalendarSyncJob.id).limit(limit)
+
+        token = str(uuid.uuid4())
+        try:
+            claimed = db.session.execute(
+                update(CalendarSyncJob)
+                .where(CalendarSyncJob.id.in_(due), claimable)
+                .values(status='processing', claim_token=token, claimed_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if not claimed:
+            return []
+
+        return CalendarSyncJob.query.options(
+            selectinload(CalendarSyncJob.user),
+            selectinload(CalendarSyncJob.appointment).options(
+                joinedload(Appointment.patient), joinedload(Appointment.doctor)
+            )
+        ).filter_by(claim_token=token).order_by(CalendarSyncJob.id).all()
+
+    def drain(self, limit=DRAIN_LIMIT, batch_size=CALENDAR_BATCH_SIZE):
+        """Send every due change and record the outcomes; returns the number of jobs processed"""
+        jobs = self.claim(limit)
+        by_user = {}
+        for job in jobs:
+            by_user.setdefault(job.user_id, []).append(job)
+
+        batch_size = max(1, min(batch_size, CALENDAR_BATCH_SIZE))
+        for user_jobs in by_user.values():
+            try:
+                service = self.service_factory(user_jobs[0].user)
+            except Exception as e:
+                logger.error(f"Could not open calendar for user {user_jobs[0].user_id}: {str(e)}")
+                for job in user_jobs:
+                    self._failed(job, e)
+                db.session.commit()
+                continue
+            for start in range(0, len(user_jobs), batch_size):
+                self._send_batch(service, user_jobs[start:start + batch_size])
+                db.session.commit()
+            save_refreshed_credentials(user_jobs[0].user)
+            db.session.commit()
+        return len(jobs)
+
+    def _send_batch(self, service, jobs):
+        results = {}
+
+        def collect(request_id, response, exception):
+            results[request_id] = (response, exception)
+
+        batch = service.new_batch_http_request(callback=collect)
+        requests = {}
+        for job in jobs:
+            request = self._build_request(service, job)
+            if request is None:
+                self._done(job)
+                continue
+            requests[str(job.id)] = job
+            batch.add(request, request_id=str(job.id))
+        if not requests:
+            return
+
+        try:
+            batch.execute()
+            sync_stats['batches'] += 1
+        except Exception as e:
+            logger.warning(f"Calendar batch of {len(requests)} changes failed: {str(e)}")
+            for job in requests.values():
+                self._failed(job, e)
+            return
+
+        for request_id, job in requests.items():
+            response, error = results.get(request_id, (None, RuntimeError('No response in batch')))
+            if error is None:
+                self._succeeded(job, response)
+            else:
+                self._request_failed(job, error)
+
+    def _build_request(self, service, job):
+        """The Calendar API call for job, or None if there is nothing left to do"""
+        appointment = job.appointment
+        if job.action == 'delete':
+            event_id = job.calendar_event_id or (appointment.calendar_event_id if appointment else None)
+            if not event_id:
+                return None
+            return service.events().delete(calendarId='primary', eventId=event_id)
+        if appointment is None:
+            return None
+        body = appointment_event_body(appointment, reminders=not appointment.calendar_event_id)
+        if appointment.calendar_event_id:
+            return service.events().update(calendarId='primary', eventId=appointment.calendar_event_id,
+                                           body=body)
+        return service.events().insert(calendarId='primary', body=body)
+
+    def _succeeded(self, job, response):
+        appointment = job.appointment
+        if appointment is not None:
+            if job.action == 'upsert':
+                if response and response.get('id'):
+                    appointment.calendar_event_id = response['id']
+            elif not job.calendar_event_id or appointment.calendar_event_id == job.calendar_event_id:
+                # Leave alone an event created since, e.g. by re-booking the appointment
+                appointment.calendar_event_id = None
+        self._done(job)
+
+    def _request_failed(self, job, error):
+        status = _error_status(error)
+        if status in GONE_STATUSES:
+            if job.action == 'delete':
+                # Already gone from the calendar, which is what we wanted
+                self._succeeded(job, None)
+                return
+            if job.appointment is not None and job.appointment.calendar_event_id:
+                # Deleted on Google's side; the retry creates it afresh
+                job.appointment.calendar_event_id = None
+        self._failed(job, error, permanent=status == 400)
+
+    def _done(self, job):
+        job.status = 'done'
+        job.claim_token = None
+        job.last_error = None
+        sync_stats['synced'] += 1
+
+    def _failed(self, job, error, permanent=False):
+        job.attempts += 1
+        job.claim_token = None
+        job.last_error = str(error)[:500]
+        if permanent or job.attempts >= MAX_SYNC_ATTEMPTS:
+            job.status = 'failed'
+            sync_stats['failed'] += 1
+            logger.error(f"Giving up on calendar {job.action} for appointment {job.appointment_id} "
+                         f"after {job.attempts} attempts: {job.last_error}")
+        else:
+            job.status = 'pending'
+            job.next_attempt_at = datetime.utcnow() + retry_delay(job.attempts)
+            sync_stats['retried'] += 1
+
+
+calendar_sync_worker = CalendarSyncWorker()
+
+
+def purge_done_jobs(retention_days=DONE_JOB_RETENTION_DAYS):
+    """Delete completed jobs older than retention_days; returns how many were removed"""
+    from models import CalendarSyncJob
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    try:
+        purged = db.session.execute(
+            CalendarSyncJob.__table__.delete().where(
+                CalendarSyncJob.status == 'done', CalendarSyncJob.updated_at < cutoff
+            )
+        ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    sync_stats['purged'] += purged
+    return purged
+
+
+def run_calendar_sync(app):
+    """Run one timed sync pass inside an application context"""
+    started = time.perf_counter()
+    with app.app_context():
+        processed = calendar_sync_worker.drain()
+        purge_done_jobs()
+    sync_stats['passes'] += 1
+    sync_stats['last_run_at'] = datetime.utcnow()
+    sync_stats['last_duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    if processed:
+        logger.info(f"Calendar sync processed {processed} changes in {sync_stats['last_duration_ms']}ms")
+    return processed
+
+
+def start_calendar_sync_worker(app):
+    """Start a daemon thread that drains the queue every CALENDAR_SYNC_INTERVAL seconds"""
+    interval = app.config.get('CALENDAR_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL)
+    if not interval or interval <= 0:
+        logger.debug("Calendar sync worker disabled")
+        return None
+
+    stop_event = threading.Event()
+
+    def worker():
+        while not stop_event.wait(interval):
+            try:
+                run_calendar_sync(app)
+            except Exception as e:
+                logger.error(f"Calendar sync pass failed: {str(e)}")
+
+    thread = threading.Thread(target=worker, name='calendar-sync', daemon=True)
+    thread.stop_event = stop_event
+    thread.start()
+    return thread
@@ -0,0 +1,176 @@
+import csv
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from extensions import db
+
+# Rows fetched from the database per round trip while streaming
+EXPORT_BATCH_SIZE = 1000
+
+# Window used by the admission report when no start/end is given
+DEFAULT_REPORT_DAYS = 30
+
+
+class _LineBuffer:
+    """File-like object whose write() hands back what was written, so csv.writer yields lines"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Encode an iterable of rows as CSV text, one line at a time"""
+    writer = csv.writer(_LineBuffer())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def parse_report_range(start, end):
+    """Turn optional YYYY-MM-DD strings into a [start, end) datetime range.
+
+    end is inclusive of the whole day; missing bounds default to the last
+    DEFAULT_REPORT_DAYS days. Raises ValueError on malformed dates.
+    """
+    end_at = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else datetime.now()
+    start_at = datetime.strptime(start, '%Y-%m-%d') if start else end_at - timedelta(days=DEFAULT_REPORT_DAYS)
+    if start_at >= end_at:
+        raise ValueError('start must be before end')
+    return start_at, end_at
+
+
+def admission_report_rows(start_at, end_at):
+    """Admission report rows from one joined query, streamed in batches"""
+    from models import Admission, Bed, Patient, Ward
+
+    yield [
+        'Admission ID', 'Patient Name', 'Admission Date', 'Discharge Date',
+        'Length of Stay (days)', 'Priority Level', 'Ward', 'Bed Number',
+        'Admission Reason', 'Status'
+    ]
+
+    rows = db.session.query(
+        Admission.id, Patient.name, Admission.admission_date, Admission.discharge_date,
+        Admission.priority_level, Ward.name, Bed.number, Admission.admission_reason, Admission.status
+    ).join(
+        Patient, Patient.id == Admission.patient_id
+    ).outerjoin(
+        Bed, Bed.id == Admission.bed_id
+    ).outerjoin(
+        Ward, Ward.id == Bed.ward_id
+    ).filter(
+        Admission.admission_date >= start_at,
+        Admission.admission_date < end_at
+    ).order_by(
+        Admission.admission_date.desc(), Admission.id.desc()
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    for (admission_id, patient_name, admitted, discharged, priority_level,
+         ward_name, bed_number, reason, status) in rows:
+        length_of_stay = (discharged - admitted).days if discharged else None
+        yield [
+            admission_id,
+            patient_name,
+            admitted.strftime('%Y-%m-%d %H:%M'),
+            discharged.strftime('%Y-%m-%d %H:%M') if discharged else 'N/A',
+            length_of_stay if length_of_stay is not None else 'N/A',
+            priority_level,
+            ward_name if bed_number is not None else 'N/A',
+            bed_number if bed_number is not None else 'N/A',
+            reason,
+            status
+        ]
+
+
+def patient_export_rows(patient):
+    """Rows of a full patient export, each section streamed from its own batched query"""
+    from models import (MedicalHistory, PatientAllergy, Prescription,
+                        PrescriptionMedication, User, VitalSign)
+
+    yield ['Patient Information']
+    yield ['ID', 'Name', 'Age', 'Gender', 'Contact', 'Email', 'Blood Type']
+    yield [
+        patient.id, patient.name, patient.age, patient.gender,
+        patient.contact, patient.email or '', patient.blood_type or ''
+    ]
+
+    yield []
+    yield ['Vital Signs']
+    yield ['Date', 'Temperature', 'Blood Pressure', 'Heart Rate', 'Respiratory Rate', 'Oxygen Saturation']
+    vitals = db.session.query(
+        VitalSign.measured_at, VitalSign.temperature, VitalSign.blood_pressure_systolic,
+        VitalSign.blood_pressure_diastolic, VitalSign.heart_rate, VitalSign.respiratory_rate,
+        VitalSign.oxygen_saturation
+    ).filter(VitalSign.patient_id == patient.id).order_by(
+        VitalSign.measured_at, VitalSign.id
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for measured_at, temperature, systolic, diastolic, heart_rate, respiratory_rate, saturation in vitals:
+        yield [
+            measured_at.strftime('%Y-%m-%d %H:%M'),
+            temperature or '',
+            f"{systolic}/{diastolic}" if systolic else '',
+            heart_rate or '',
+            respiratory_rate or '',
+            saturation or ''
+        ]
+
+    yield []
+    yield ['Allergies']
+    yield ['Allergen', 'Severity', 'Reaction', 'Diagnosis Date']
+    allergies = db.session.query(
+        PatientAllergy.allergen, PatientAllergy.severity, PatientAllergy.reaction, PatientAllergy.diagnosis_date
+    ).filter(PatientAllergy.patient_id == patient.id).order_by(
+        PatientAllergy.id
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for allergen, severity, reaction, diagnosis_date in allergies:
+        yield [
+            allergen,
+            severity or '',
+            reaction or '',
+            diagnosis_date.strftime('%Y-%m-%d') if diagnosis_date else ''
+        ]
+
+    yield []
+    yield ['Medical History']
+    yield ['Condition', 'Diagnosis Date', 'Treatment', 'Status']
+    history = db.session.query(
+        MedicalHistory.condition, MedicalHistory.diagnosis_date, MedicalHistory.treatment, MedicalHistory.status
+    ).filter(MedicalHistory.patient_id == patient.id).order_by(
+        MedicalHistory.id
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for condition, diagnosis_date, treatment, status in history:
+        yield [
+            condition,
+            diagnosis_date.strftime('%Y-%m-%d') if diagnosis_date else '',
+            treatment or '',
+            status or ''
+        ]
+
+    yield []
+    yield ['Prescriptions']
+    yield ['Date', 'Doctor', 'Diagnosis', 'Medications']
+    # One row per medication, ordered so each prescription's medications are adjacent
+    prescriptions = db.session.query(
+        Prescription.id, Prescription.date, User.name, Prescription.diagnosis,
+        PrescriptionMedication.medication_name, PrescriptionMedication.dosage,
+        PrescriptionMedication.frequency, PrescriptionMedication.duration
+    ).join(
+        User, User.id == Prescription.doctor_id
+    ).outerjoin(
+        PrescriptionMedication, PrescriptionMedication.prescription_id == Prescription.id
+    ).filter(Prescription.patient_id == patient.id).order_by(
+        Prescription.id, PrescriptionMedication.id
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for _, group in groupby(prescriptions, key=lambda row: row[0]):
+        group = list(group)
+        _, prescribed_on, doctor_name, diagnosis = group[0][:4]
+        medications = '; '.join(
+            f"{name} ({dosage}, {frequency}, {duration})"
+            for _, _, _, _, name, dosage, frequency, duration in group
+            if name is not None
+        )
+        yield [
+            prescribed_on.strftime('%Y-%m-%d'),
+            doctor_name,
+            diagnosis,
+            medications
+        ]
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from utils.ward_occupancy import total_counts
+
+logger = logging.getLogger(__name__)
+
+# Backstop lifetime of the cached metrics, in case a change bypasses the session
+METRICS_CACHE_TTL = 30
+
+# Months of admissions and days of upcoming appointments in the charts
+ADMISSION_MONTHS = 6
+APPOINTMENT_DAYS = 7
+
+_cache = {'data': None, 'etag': None, 'loaded_at': 0.0}
+_cache_lock = threading.Lock()
+
+
+def _load_metrics():
+    from models import AdmissionRollup, Appointment, Patient, User
+
+    # Headline counts in a single round trip
+    total_patients, total_appointments = db.session.execute(select(
+        select(func.count(Patient.id)).scalar_subquery(),
+        select(func.count(Appointment.id)).scalar_subquery()
+    )).one()
+
+    staff_by_role = dict(db.session.query(User.role, func.count(User.id)).group_by(User.role).all())
+
+    # Admissions per month from the analytics rollups
+    today = date.today()
+    first_month = date(today.year, today.month, 1)
+    for _ in range(ADMISSION_MONTHS - 1):
+        first_month = date(first_month.year - (first_month.month == 1), (first_month.month - 2) % 12 + 1, 1)
+    admitted = dict(db.session.query(
+        AdmissionRollup.bucket, func.sum(AdmissionRollup.admitted)
+    ).filter(
+        AdmissionRollup.granularity == 'month',
+        AdmissionRollup.bucket >= first_month
+    ).group_by(AdmissionRollup.bucket).all())
+    months = []
+    month = first_month
+    while month <= today:
+        months.append(month)
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    # Appointment load for the coming days
+    last_day = today + timedelta(days=APPOINTMENT_DAYS - 1)
+    booked = dict(db.session.query(
+        Appointment.date, func.count(Appointment.id)
+    ).filter(
+        Appointment.date.between(today, last_day),
+        Appointment.status != 'Cancelled'
+    ).group_by(Appointment.date).all())
+    days = [today + timedelta(days=i) for i in range(APPOINTMENT_DAYS)]
+
+    beds = total_counts()
+    return {
+        'totals': {
+            'patients': total_patients,
+            'appointments': total_appointments,
+            'available_beds': beds['free'],
+            'staff': sum(staff_by_role.values())
+        },
+        'admissions_per_month': {
+            'labels': [m.strftime('%b %Y') for m in months],
+            'data': [int(admitted.get(m) or 0) for m in months]
+        },
+        'bed_occupancy': beds,
+        'appointment_load': {
+            'labels': [d.isoformat() for d in days],
+            'data': [booked.get(d, 0) for d in days]
+        },
+        'staff_by_role': staff_by_role
+    }
+
+
+def get_dashboard_metrics():
+    """Return (metrics, etag) for the dashboard, recomputed at most every METRICS_CACHE_TTL seconds"""
+    with _cache_lock:
+        if _cache['data'] is not None and time.monotonic() - _cache['loaded_at'] < METRICS_CACHE_TTL:
+            return _cache['data'], _cache['etag']
+
+    data = _load_metrics()
+    etag = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+    with _cache_lock:
+        _cache['data'] = data
+        _cache['etag'] = etag
+        _cache['loaded_at'] = time.monotonic()
+    return data, etag
+
+
+def invalidate_dashboard_metrics():
+    with _cache_lock:
+        _cache['data'] = None
+
+
+# Same scheme as the ward occupancy cache: changes to any model the metrics
+# are built from mark the session, and the cache is dropped on commit.
+
+def _mark_dirty(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['dashboard_metrics_dirty'] = True
+
+
+def register_metrics_listeners():
+    from models import Admission, Appointment, Bed, Patient, User
+
+    tracked = (Admission, Appointment, Bed, Patient, User)
+    for model in tracked:
+        for event_name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, event_name, _mark_dirty)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _bulk_statement(orm_execute_state):
+        if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+                and orm_execute_state.bind_mapper is not None \
+                and orm_execute_state.bind_mapper.class_ in tracked:
+            orm_execute_state.session.info['dashboard_metrics_dirty'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidate_after_commit(session):
+        if session.info.pop('dashboard_metrics_dirty', False):
+            invalidate_dashboard_metrics()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_after_rollback(session):
+        session.info.pop('dashboard_metrics_dirty', None)
@@ -0,0 +1,200 @@
+import logging
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from extensions import db
+from utils.admission_rollups import _as_date, date_bucket
+
+logger = logging.getLogger(__name__)
+
+# Days of consumption history the forecast is fitted on
+FORECAST_HISTORY_DAYS = 90
+
+# Weight of the most recent day in exponentially smoothed demand
+SMOOTHING_ALPHA = 0.1
+
+# Standard normal quantile of the cycle service level; 1.65 keeps about 95% of replenishment cycles stocked
+SERVICE_LEVEL_Z = 1.65
+
+# Lead time assumed for items whose supplier has none on record
+DEFAULT_LEAD_TIME_DAYS = 7
+
+# Seconds a full forecast is reused by pages that show it; history is daily, so minutes of staleness are harmless
+FORECAST_CACHE_SECONDS = 300
+
+# Runtime metrics of the last forecast in this process
+forecast_stats = {
+    'last_run_at': None,
+    'last_duration_ms': None,
+    'last_items': 0,
+    'last_history_rows': 0,
+    'engine': None,
+    'cache_hits': 0
+}
+
+# Last full forecast as (lead_times key, monotonic time computed, result)
+_cached_forecast = None
+_cache_lock = threading.Lock()
+
+
+def _load_numpy():
+    """numpy if it is installed; the forecast falls back to pure Python without it"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def consumption_history(item_ids=None, days=FORECAST_HISTORY_DAYS):
+    """Daily consumption over the last days as three parallel lists: item ids, day offsets and units.
+
+    One grouped query buckets the ledger by item and day; days without
+    consumption are simply absent. Day offsets count from the oldest day
+    of the window (0) to today (days - 1). Pass item_ids to load only those
+    items.
+    """
+    from models import InventoryTransaction
+
+    start = date.today() - timedelta(days=days - 1)
+    day = date_bucket(InventoryTransaction.transaction_date, 'day', db.engine.dialect.name)
+    query = db.session.query(
+        InventoryTransaction.inventory_item_id, day, func.sum(InventoryTransaction.quantity)
+    ).filter(
+        InventoryTransaction.transaction_type == 'consumed',
+        InventoryTransaction.transaction_date >= start
+    )
+    if item_ids is not None:
+        query = query.filter(InventoryTransaction.inventory_item_id.in_(item_ids))
+
+    items, offsets, units = [], [], []
+    day_offsets = {}  # Only `days` distinct buckets exist, so each is parsed once
+    for item_id, bucket, total in query.group_by(InventoryTransaction.inventory_item_id, day):
+        offset = day_offsets.get(bucket)
+        if offset is None:
+            offset = day_offsets[bucket] = (_as_date(bucket) - start).days
+        if 0 <= offset < days and total:
+            items.append(item_id)
+            offsets.append(offset)
+            # Consumption is stored as negative quantities
+            units.append(-total)
+    return items, offsets, units
+
+
+def _smoothing_weights(days, alpha):
+    """Exponential weights for day offsets 0..days-1, newest heaviest, normalised to sum to 1"""
+    weights = [alpha * (1 - alpha) ** (days - 1 - offset) for offset in range(days)]
+    total = sum(weights)
+    return [weight / total for weight in weights]
+
+
+def _lead_time(days):
+    return DEFAULT_LEAD_TIME_DAYS if days is None else days
+
+
+def _forecast_numpy(np, order, history, days, alpha):
+    items, offsets, units = history
+    ids = np.asarray(order, dtype=np.int64)
+    rows = np.asarray(items, dtype=np.int64)
+    units = np.asarray(units, dtype=np.float64)
+    weights = np.asarray(_smoothing_weights(days, alpha))
+
+    # Position of each history row's item in order; rows for items not asked about are dropped
+    sorter = np.argsort(ids, kind='stable')
+    found = np.searchsorted(ids, rows, sorter=sorter)
+    found = np.minimum(found, len(ids) - 1)
+    index = sorter[found]
+    wanted = ids[index] == rows
+    index, units, offsets = index[wanted], units[wanted], np.asarray(offsets, dtype=np.int64)[wanted]
+
+    # Days without consumption count as zeros, so sums over the sparse rows are enough
+    demand = np.bincount(index, weights=units * weights[offsets], minlength=len(ids))
+    mean = np.bincount(index, weights=units, minlength=len(ids)) / days
+    variance = np.bincount(index, weights=units * units, minlength=len(ids)) / days - mean * mean
+    return demand, np.sqrt(np.maximum(variance, 0))
+
+
+def _forecast_python(order, history, days, alpha):
+    weights = _smoothing_weights(days, alpha)
+    position = {item_id: n for n, item_id in enumerate(order)}
+    demand, total, squares = [0.0] * len(order), [0.0] * len(order), [0.0] * len(order)
+    for item_id, offset, quantity in zip(*history):
+        n = position.get(item_id)
+        if n is None:
+            continue
+        demand[n] += quantity * weights[offset]
+        total[n] += quantity
+        squares[n] += quantity * quantity
+    deviation = [math.sqrt(max(square / days - (sum_ / days) ** 2, 0)) for sum_, square in zip(total, squares)]
+    return demand, deviation
+
+
+def forecast_reorder_points(lead_times, item_ids=None, days=FORECAST_HISTORY_DAYS,
+                            alpha=SMOOTHING_ALPHA, z=SERVICE_LEVEL_Z):
+    """Forecast demand and suggest a reorder point for every item in lead_times ({item_id: days or None}).
+
+    Daily demand is the exponentially smoothed consumption over the
+    history window and its spread the standard deviation of daily usage,
+    both computed for all items in one vectorised pass with numpy when it
+    is installed (pure Python otherwise). The suggested reorder point is
+    the demand expected during the lead time plus z standard deviations
+    of it as safety stock. item_ids narrows the history query for small
+    evaluations. Returns {item_id: {'daily_demand', 'demand_std',
+    'safety_stock', 'reorder_point'}}.
+    """
+    started = time.perf_counter()
+    order = list(lead_times)
+    if not order:
+        return {}
+    history = consumption_history(item_ids, days)
+
+    np = _load_numpy()
+    if np is not None:
+        demand, deviation = _forecast_numpy(np, order, history, days, alpha)
+        lead = np.asarray([_lead_time(lead_times[item_id]) for item_id in order], dtype=np.float64)
+        safety = z * deviation * np.sqrt(lead)
+        points = demand * lead + safety
+        values = zip(demand.tolist(), deviation.tolist(), safety.tolist(), points.tolist())
+    else:
+        demand, deviation = _forecast_python(order, history, days, alpha)
+        values = []
+        for item_id, item_demand, item_deviation in zip(order, demand, deviation):
+            lead = _lead_time(lead_times[item_id])
+            safety = z * item_deviation * math.sqrt(lead)
+            values.append((item_demand, item_deviation, safety, item_demand * lead + safety))
+
+    forecast_stats['last_run_at'] = datetime.utcnow()
+    forecast_stats['last_duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    forecast_stats['last_items'] = len(order)
+    forecast_stats['last_history_rows'] = len(history[0])
+    forecast_stats['engine'] = 'numpy' if np is not None else 'python'
+    logger.debug(f"Forecast demand for {len(order)} items from {len(history[0])} daily totals "
+                 f"in {forecast_stats['last_duration_ms']}ms ({forecast_stats['engine']})")
+    return {item_id: {'daily_demand': item_demand, 'demand_std': item_deviation,
+                      'safety_stock': safety, 'reorder_point': point}
+            for item_id, (item_demand, item_deviation, safety, point) in zip(order, values)}
+
+
+def cached_forecast_reorder_points(lead_times, max_age=FORECAST_CACHE_SECONDS):
+    """forecast_reorder_points for lead_times, reusing the last result if it is under max_age seconds old.
+
+    The cached forecast is only reused for exactly the same items and lead
+    times. Meant for pages that forecast every item on each load; the
+    reorder evaluator always forecasts afresh.
+    """
+    global _cached_forecast
+    key = tuple(sorted(lead_times.items()))
+    with _cache_lock:
+        cached = _cached_forecast
+    if cached is not None and cached[0] == key and time.monotonic() - cached[1] < max_age:
+        forecast_stats['cache_hits'] += 1
+        return cached[2]
+
+    result = forecast_reorder_points(lead_times)
+    with _cache_lock:
+        _cached_forecast = (key, time.monotonic(), result)
+    return result
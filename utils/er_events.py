@@ -0,0 +1,192 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered per viewer before a slow connection starts losing events
+SUBSCRIBER_BUFFER_SIZE = 100
+
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_INTERVAL = 15
+
+# Seconds one stream stays open before the browser is made to reconnect
+STREAM_MAX_SECONDS = 300
+
+# Recent events kept so a reconnecting viewer can catch up from Last-Event-ID
+REPLAY_BUFFER_SIZE = 500
+
+RESYNC_MESSAGE = "event: resync\ndata: {}\n\n"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class EventBroker:
+    """In-process pub/sub fan-out for Server-Sent Events.
+
+    Each published event is serialized once into its wire format and the
+    same string is handed to every subscriber queue. The most recent
+    events are kept so a viewer reconnecting with Last-Event-ID receives
+    what it missed, or a resync when the gap is no longer buffered.
+    """
+
+    def __init__(self, buffer_size=SUBSCRIBER_BUFFER_SIZE, replay_size=REPLAY_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._epoch = uuid.uuid4().hex[:8]  # Tells this process's event ids apart from another's
+        self._last_id = 0
+        self._history = deque(maxlen=replay_size)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, last_event_id=None):
+        """New subscriber queue, primed with the events after last_event_id when reconnecting"""
+        subscription = queue.Queue(maxsize=self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            # Where this viewer resumes from if the stream ends before any event arrives
+            subscription.resume_id = f"{self._epoch}-{self._last_id}"
+            if last_event_id is not None:
+                self._replay(subscription, last_event_id)
+        return subscription
+
+    def _replay(self, subscription, last_event_id):
+        epoch, _, number = str(last_event_id).partition('-')
+        try:
+            number = int(number)
+        except ValueError:
+            number = -1
+        if epoch == self._epoch and number == self._last_id:
+            return
+        oldest = self._history[0][0] if self._history else self._last_id + 1
+        missed = [message for event_id, message in self._history if event_id > number]
+        # Ids from another process or worker, or a gap older than the buffer, cannot be replayed
+        if epoch != self._epoch or not 0 <= number <= self._last_id or number + 1 < oldest \
+                or len(missed) > self.buffer_size:
+            subscription.put_nowait(RESYNC_MESSAGE)
+            return
+        for message in missed:
+            subscription.put_nowait(message)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, data):
+        """Serialize an event once and fan it out; returns the number of viewers reached"""
+        payload = json.dumps(data, default=_json_default)
+        with self._lock:
+            # Ids are assigned and buffered under the lock so replays never miss or repeat an event
+            event_id = self._last_id = next(self._ids)
+            message = f"id: {self._epoch}-{event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+            self._history.append((event_id, message))
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return 0
+
+        delivered = 0
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(message)
+                delivered += 1
+            except queue.Full:
+                # Viewer is not keeping up; tell it to reload instead of blocking publishers
+                logger.warning("Dropping ER stream event for a slow subscriber")
+                self._force_resync(subscription)
+        return delivered
+
+    def _force_resync(self, subscription):
+        while True:
+            try:
+                while True:
+                    subscription.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                subscription.put_nowait(RESYNC_MESSAGE)
+                return
+            except queue.Full:
+                # Another publisher refilled the queue in between; drain again
+                continue
+
+    def stream(self, subscription, keepalive=KEEPALIVE_INTERVAL, max_seconds=STREAM_MAX_SECONDS):
+        """Generator yielding SSE messages for one viewer until it disconnects or max_seconds pass.
+
+        Ending the response makes the browser's EventSource reconnect
+        after the retry delay, sending Last-Event-ID so the new stream
+        replays what happened in between. This bounds how long one
+        viewer holds a server thread.
+        """
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f"retry: 2000\nid: {subscription.resume_id}\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    yield subscription.get(timeout=min(keepalive, remaining))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+def queue_delta(previous, current):
+    """Difference between two queue snapshots as upserted entries and removed ids"""
+    old_entries = {e['id']: e for e in previous.entries} if previous else {}
+    new_ids = set()
+    upserted = []
+    for entry in current.entries:
+        new_ids.add(entry['id'])
+        old = old_entries.get(entry['id'])
+        if old is None or old != entry:
+            upserted.append(entry)
+    removed = [admission_id for admission_id in old_entries if admission_id not in new_ids]
+    return upserted, removed
+
+
+def publish_queue_snapshot(previous, current):
+    """Push the changes between two published queue snapshots to ER viewers"""
+    if not er_broker.subscriber_count:
+        return 0
+    upserted, removed = queue_delta(previous, current)
+    if not upserted and not removed:
+        return 0
+    return er_broker.publish('queue', {
+        'version': current.version,
+        'upserted': upserted,
+        'removed': removed,
+        'waiting_patients': len(current),
+        'avg_wait_time': current.avg_wait_time
+    })
+
+
+def publish_bed_change(bed):
+    """Push the new state of a single bed to ER viewers"""
+    return er_broker.publish('bed', {
+        'id': bed.id,
+        'ward_id': bed.ward_id,
+        'number': bed.number,
+        'occupied': bool(bed.occupied),
+        'status': bed.status,
+        'patient_name': bed.patient.name if bed.occupied and bed.patient else None
+    })
+
+
+# Process-wide broker shared by all /er/stream connections in this worker
+er_broker = EventBroker()
@@ -0,0 +1,111 @@
+import itertools
+import threading
+
+
+class FakeHttpError(Exception):
+    """Stands in for googleapiclient.errors.HttpError; exposes resp.status the same way"""
+
+    class _Response:
+        def __init__(self, status):
+            self.status = status
+
+    def __init__(self, status, message=''):
+        super().__init__(f'{status} {message}'.strip())
+        self.resp = self._Response(status)
+
+
+class _FakeRequest:
+    def __init__(self, handler):
+        self._handler = handler
+
+    def execute(self):
+        return self._handler()
+
+
+class _FakeBatch:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request_id or str(len(self._requests)), request, callback or self._callback))
+
+    def execute(self):
+        service = self._service
+        with service._lock:
+            service.batches += 1
+            if service.outages:
+                service.outages -= 1
+                raise FakeHttpError(503, 'Backend Error')
+        for request_id, request, callback in self._requests:
+            try:
+                response, error = request.execute(), None
+            except FakeHttpError as e:
+                response, error = None, e
+            if callback:
+                callback(request_id, response, error)
+
+
+class _FakeEvents:
+    def __init__(self, service):
+        self._service = service
+
+    def insert(self, calendarId, body):
+        def handler():
+            service = self._service
+            with service._lock:
+                service.calls += 1
+                event_id = f'fake-{next(service._ids)}'
+                service.events_by_calendar.setdefault(calendarId, {})[event_id] = dict(body, id=event_id)
+                return service.events_by_calendar[calendarId][event_id]
+        return _FakeRequest(handler)
+
+    def update(self, calendarId, eventId, body):
+        def handler():
+            service = self._service
+            with service._lock:
+                service.calls += 1
+                events = service.events_by_calendar.setdefault(calendarId, {})
+                if eventId not in events:
+                    raise FakeHttpError(404, 'Not Found')
+                events[eventId] = dict(body, id=eventId)
+                return events[eventId]
+        return _FakeRequest(handler)
+
+    def delete(self, calendarId, eventId):
+        def handler():
+            service = self._service
+            with service._lock:
+                service.calls += 1
+                if service.events_by_calendar.get(calendarId, {}).pop(eventId, None) is None:
+                    raise FakeHttpError(410, 'Resource has been deleted')
+                return ''
+        return _FakeRequest(handler)
+
+
+class FakeCalendarService:
+    """In-memory Google Calendar v3 service for offline development and testing.
+
+    Supports the subset the sync worker uses: events().insert/update/delete
+    and new_batch_http_request(). Set outages to make the next N batches
+    fail with a 503, as during a Google outage.
+    """
+
+    def __init__(self, outages=0):
+        self.events_by_calendar = {}
+        self.outages = outages
+        self.calls = 0
+        self.batches = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def events(self):
+        return _FakeEvents(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+
+# Shared instance used by the sync worker when CALENDAR_SYNC_FAKE is set
+fake_calendar_service = FakeCalendarService()
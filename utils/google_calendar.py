@@ -1,19 +1,133 @@
+from collections import OrderedDict
 from datetime import datetime
+import json
 import os
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+import threading
+import time
 from flask import url_for
 
+# The Google client libraries are imported where used so the sync queue
+# (and its fake calendar service) works without them installed.
+
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# Seconds a cached Calendar service is reused before it is rebuilt
+SERVICE_CACHE_TTL = 3600
+
+# Most services kept at once; the least recently used are dropped beyond this
+SERVICE_CACHE_SIZE = 256
+
+# Socket timeout for Calendar API calls, in seconds
+HTTP_TIMEOUT = 30
+
+# Hit/miss counters of the per-user service cache in this process
+calendar_service_stats = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0
+}
+
 def create_calendar_service(credentials_dict):
     """Create a Google Calendar service instance from credentials."""
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
     credentials = Credentials.from_authorized_user_info(credentials_dict, SCOPES)
     return build('calendar', 'v3', credentials=credentials)
 
+def _grant_fingerprint(credentials_dict):
+    """What identifies a user's grant; access tokens rotate on refresh and are left out."""
+    return (credentials_dict.get('client_id'), credentials_dict.get('refresh_token'))
+
+class _CachedService:
+    def __init__(self, service, credentials, fingerprint):
+        self.service = service
+        self.credentials = credentials
+        self.fingerprint = fingerprint
+        self.created_at = time.monotonic()
+
+    def usable(self, ttl):
+        if time.monotonic() - self.created_at >= ttl:
+            return False
+        # An expired token is fine as long as it can be refreshed on the next call
+        return not (self.credentials.expired and not self.credentials.refresh_token)
+
+class CalendarServiceCache:
+    """Per-user Calendar service objects, reused until they age out or the user's grant changes.
+
+    Building a service parses the discovery document and sets up a new
+    authorized HTTP transport; a cached service keeps both, along with the
+    transport's keep-alive connections and its refreshed access token.
+    httplib2 transports are not thread-safe, so each thread gets its own.
+    """
+
+    def __init__(self, ttl=SERVICE_CACHE_TTL, max_size=SERVICE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._discovery_document = None
+
+    def get(self, user_key, credentials_dict):
+        """Calendar service for user_key, built from credentials_dict on a miss."""
+        key = (user_key, threading.get_ident())
+        fingerprint = _grant_fingerprint(credentials_dict)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.fingerprint == fingerprint and entry.usable(self.ttl):
+                self._entries.move_to_end(key)
+                calendar_service_stats['hits'] += 1
+                return entry.service
+            if entry is not None:
+                del self._entries[key]
+                calendar_service_stats['evictions'] += 1
+            calendar_service_stats['misses'] += 1
+
+        service, credentials = self._build(credentials_dict)
+        with self._lock:
+            self._entries[key] = _CachedService(service, credentials, fingerprint)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                calendar_service_stats['evictions'] += 1
+        return service
+
+    def refreshed_credentials(self, user_key, credentials_dict):
+        """Updated credentials to store if this thread's cached service refreshed its token, else None."""
+        with self._lock:
+            entry = self._entries.get((user_key, threading.get_ident()))
+        if entry is None or not entry.credentials.token \
+                or entry.credentials.token == credentials_dict.get('token'):
+            return None
+        return {**credentials_dict, **json.loads(entry.credentials.to_json())}
+
+    def _build(self, credentials_dict):
+        import httplib2
+        from google.oauth2.credentials import Credentials
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build, build_from_document
+
+        credentials = Credentials.from_authorized_user_info(credentials_dict, SCOPES)
+        http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        document = self._discovery()
+        if document is None:
+            return build('calendar', 'v3', http=http, cache_discovery=False), credentials
+        return build_from_document(document, http=http), credentials
+
+    def _discovery(self):
+        """The Calendar v3 discovery document bundled with the client library, read once."""
+        if self._discovery_document is None:
+            from googleapiclient.discovery_cache import get_static_doc
+            self._discovery_document = get_static_doc('calendar', 'v3')
+        return self._discovery_document
+
+calendar_service_cache = CalendarServiceCache()
+
+def get_calendar_service(user):
+    """Cached Google Calendar service for a user with stored credentials."""
+    return calendar_service_cache.get(user.id, user.google_credentials)
+
 def get_oauth_flow():
     """Create OAuth flow instance for Google Calendar."""
+    from google_auth_oauthlib.flow import Flow
     client_config = {
         "web": {
             "client_id": os.environ.get("GOOGLE_OAUTH_CLIENT_ID"),
@@ -28,8 +142,8 @@ def get_oauth_flow():
         redirect_uri=url_for('google_calendar_callback', _external=True)
     )
 
-def create_calendar_event(service, appointment):
-    """Create a calendar event for an appointment."""
+def appointment_event_body(appointment, reminders=True):
+    """Calendar event resource describing an appointment."""
     event = {
         'summary': f'Medical Appointment - {appointment.patient.name}',
         'location': 'Hospital',
@@ -43,40 +157,28 @@ def create_calendar_event(service, appointment):
             'timeZone': 'UTC',
         },
         'attendees': [
-            {'email': appointment.patient.email},
-            {'email': appointment.doctor.email}
+            {'email': email}
+            for email in (appointment.patient.email, appointment.doctor.email) if email
         ],
-        'reminders': {
+    }
+    if reminders:
+        event['reminders'] = {
             'useDefault': False,
             'overrides': [
                 {'method': 'email', 'minutes': 24 * 60},
                 {'method': 'popup', 'minutes': 30},
             ],
-        },
-    }
-    
+        }
+    return event
+
+def create_calendar_event(service, appointment):
+    """Create a calendar event for an appointment."""
+    event = appointment_event_body(appointment)
     return service.events().insert(calendarId='primary', body=event).execute()
 
 def update_calendar_event(service, event_id, appointment):
     """Update an existing calendar event."""
-    event = {
-        'summary': f'Medical Appointment - {appointment.patient.name}',
-        'location': 'Hospital',
-        'description': f'Medical appointment with Dr. {appointment.doctor.name}',
-        'start': {
-            'dateTime': appointment.start_time.isoformat(),
-            'timeZone': 'UTC',
-        },
-        'end': {
-            'dateTime': appointment.end_time.isoformat(),
-            'timeZone': 'UTC',
-        },
-        'attendees': [
-            {'email': appointment.patient.email},
-            {'email': appointment.doctor.email}
-        ],
-    }
-    
+    event = appointment_event_body(appointment, reminders=False)
     return service.events().update(
         calendarId='primary',
         eventId=event_id,
@@ -0,0 +1,342 @@
+import logging
+from datetime import date
+
+from sqlalchemy import func, insert, select, update
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_TYPES = ('received', 'consumed', 'adjusted', 'expired')
+
+# Most movements accepted in one bulk request
+BULK_MAX_MOVEMENTS = 5000
+
+# Free-text ledger fields a bulk movement may carry
+MOVEMENT_DETAIL_FIELDS = ('reference_number', 'department', 'notes')
+
+# Transaction types that take stock out; their quantities are stored negative
+OUTBOUND_TYPES = ('consumed', 'expired')
+
+
+class StockError(Exception):
+    """A stock movement that cannot be applied as asked"""
+    status_code = 400
+
+
+class InsufficientStock(StockError):
+    """The movement would take item or batch stock below zero"""
+    status_code = 409
+
+
+class BulkMovementError(StockError):
+    """A bulk request with invalid rows; errors lists them and nothing was applied"""
+
+    def __init__(self, message, errors, status_code=400):
+        super().__init__(message)
+        self.errors = errors
+        self.status_code = status_code
+
+
+def signed_quantity(transaction_type, quantity):
+    """Ledger quantity for a movement: negative for stock going out"""
+    if transaction_type not in TRANSACTION_TYPES:
+        raise StockError(f'Unknown transaction type: {transaction_type}')
+    if transaction_type in OUTBOUND_TYPES:
+        return -abs(quantity)
+    return quantity
+
+
+# Stock levels are only ever changed with conditional UPDATEs that add a
+# delta in the database, never by writing back a value read earlier, so
+# concurrent movements cannot overwrite each other or oversell. Items are
+# always updated before batches to keep lock order consistent.
+
+def adjust_item_stock(item_id, delta):
+    """Add delta to an item's current stock atomically, refusing to go below zero"""
+    from models import InventoryItem
+
+    stock = func.coalesce(InventoryItem.current_stock, 0)
+    updated = db.session.execute(
+        update(InventoryItem)
+        .where(InventoryItem.id == item_id, stock + delta >= 0)
+        .values(current_stock=stock + delta)
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+    if updated != 1:
+        if db.session.get(InventoryItem, item_id) is None:
+            raise StockError(f'Unknown inventory item {item_id}')
+        raise InsufficientStock('Insufficient stock')
+
+
+def adjust_batch_stock(batch_id, item_id, delta):
+    """Add delta to a batch's remaining quantity atomically, refusing to go below zero"""
+    from models import InventoryBatch
+
+    updated = db.session.execute(
+        update(InventoryBatch)
+        .where(InventoryBatch.id == batch_id,
+               InventoryBatch.inventory_item_id == item_id,
+               InventoryBatch.remaining_quantity + delta >= 0)
+        .values(remaining_quantity=InventoryBatch.remaining_quantity + delta)
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+    if updated != 1:
+        batch = db.session.get(InventoryBatch, batch_id)
+        if batch is None or batch.inventory_item_id != int(item_id):
+            raise StockError(f'Batch {batch_id} does not belong to item {item_id}')
+        raise InsufficientStock('Insufficient batch quantity')
+
+
+def record_stock_movement(item_id, transaction_type, quantity, performed_by_id, batch_id=None, **fields):
+    """Apply a stock movement and add its ledger row; returns the pending InventoryTransaction.
+
+    Raises InsufficientStock, leaving the session to be rolled back, if
+    the item or batch does not hold enough. The caller commits.
+    """
+    from models import InventoryTransaction
+
+    quantity = signed_quantity(transaction_type, quantity)
+    adjust_item_stock(item_id, quantity)
+    if batch_id:
+        adjust_batch_stock(batch_id, item_id, quantity)
+
+    transaction = InventoryTransaction(
+        inventory_item_id=item_id,
+        batch_id=batch_id,
+        transaction_type=transaction_type,
+        quantity=quantity,
+        performed_by_id=performed_by_id,
+        **fields
+    )
+    db.session.add(transaction)
+    return transaction
+
+
+def fefo_batches_query(item_id):
+    """Batches that can still be issued for an item, earliest expiry first"""
+    from models import InventoryBatch
+
+    return select(InventoryBatch).where(
+        InventoryBatch.inventory_item_id == item_id,
+        InventoryBatch.is_active.isnot(False),
+        InventoryBatch.remaining_quantity > 0,
+        InventoryBatch.expiry_date > date.today()
+    ).order_by(InventoryBatch.expiry_date, InventoryBatch.id)
+
+
+def unbatched_stock(item_id):
+    """Stock of an item held outside any batch: its current stock less what all its batches hold.
+
+    Expired and inactive batches count too; their units are on the shelf
+    until written off and must not be issued as unbatched stock.
+    """
+    from models import InventoryBatch, InventoryItem
+
+    in_batches = select(func.coalesce(func.sum(InventoryBatch.remaining_quantity), 0)).where(
+        InventoryBatch.inventory_item_id == item_id
+    ).scalar_subquery()
+    return db.session.scalar(
+        select(func.coalesce(InventoryItem.current_stock, 0) - in_batches).where(InventoryItem.id == item_id)
+    ) or 0
+
+
+def _take_fefo(item_id, quantity, allow_unbatched):
+    """Take quantity from an item's batches in expiry order; returns [(batch_id, quantity, unit_cost), ...]"""
+    from models import InventoryBatch
+
+    batches = db.session.execute(
+        fefo_batches_query(item_id)
+        .with_only_columns(InventoryBatch.id, InventoryBatch.remaining_quantity, InventoryBatch.unit_cost)
+        .with_for_update()
+    ).all()
+
+    slices = []
+    needed = quantity
+    for batch_id, remaining, unit_cost in batches:
+        if not needed:
+            break
+        take = min(needed, remaining)
+        taken = db.session.execute(
+            update(InventoryBatch)
+            .where(InventoryBatch.id == batch_id, InventoryBatch.remaining_quantity >= take)
+            .values(remaining_quantity=InventoryBatch.remaining_quantity - take)
+            .execution_options(synchronize_session='fetch')
+        ).rowcount
+        if taken:
+            slices.append((batch_id, take, unit_cost))
+            needed -= take
+    if needed:
+        # Callers have already taken the whole quantity off the item's stock,
+        # so what it still holds outside batches must not have gone negative
+        free = unbatched_stock(item_id) + needed if allow_unbatched else 0
+        if needed > free:
+            where = 'unexpired batches and outside batches' if allow_unbatched else 'unexpired batches'
+            raise InsufficientStock(f'Only {quantity - needed + max(free, 0)} available in {where}')
+        slices.append((None, needed, None))
+    return slices
+
+
+def allocate_fefo(item_id, quantity, performed_by_id, allow_unbatched=False, **fields):
+    """Consume quantity of an item first-expiry-first-out; returns [(batch_id, quantity), ...].
+
+    The item's stock is decremented first, which fails fast when there is
+    not enough. The quantity is then split across its unexpired batches in
+    expiry order (read via the FEFO index, locked where the database
+    supports it), each slice taken with a conditional UPDATE, and one
+    ledger row per slice is written with a single bulk INSERT. Stock held
+    outside any batch is only used when allow_unbatched is set, never more
+    than unbatched_stock, and is recorded as a slice with batch_id None;
+    stock left in expired batches is never issued. The caller commits.
+    """
+    from models import InventoryTransaction
+
+    quantity = abs(quantity)
+    if not quantity:
+        raise StockError('Quantity must be greater than zero')
+    adjust_item_stock(item_id, -quantity)
+    slices = _take_fefo(item_id, quantity, allow_unbatched)
+
+    db.session.execute(insert(InventoryTransaction), [{
+        'inventory_item_id': item_id,
+        'batch_id': batch_id,
+        'transaction_type': 'consumed',
+        'quantity': -take,
+        'unit_cost': unit_cost,
+        'performed_by_id': performed_by_id,
+        **fields
+    } for batch_id, take, unit_cost in slices])
+    return [(batch_id, take) for batch_id, take, _ in slices]
+
+
+def _optional_int(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def parse_movements(rows):
+    """Validate raw movement dicts (from JSON or CSV) into typed ones; raises BulkMovementError"""
+    if len(rows) > BULK_MAX_MOVEMENTS:
+        raise BulkMovementError(f'At most {BULK_MAX_MOVEMENTS} movements per request', [])
+
+    movements, errors = [], []
+    for number, row in enumerate(rows, 1):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError('expected an object')
+            transaction_type = (row.get('transaction_type') or '').strip()
+            if transaction_type not in TRANSACTION_TYPES:
+                raise ValueError(f'unknown transaction type {transaction_type!r}')
+            quantity = int(row.get('quantity'))
+            if not quantity:
+                raise ValueError('quantity must not be zero')
+            movements.append({
+                'inventory_item_id': int(row.get('inventory_item_id')),
+                'batch_id': _optional_int(row.get('batch_id')),
+                'transaction_type': transaction_type,
+                'quantity': signed_quantity(transaction_type, quantity),
+                **{name: row.get(name) or None for name in MOVEMENT_DETAIL_FIELDS}
+            })
+        except (TypeError, ValueError) as e:
+            errors.append({'row': number, 'error': str(e)})
+    if errors:
+        raise BulkMovementError(f'{len(errors)} of {len(rows)} movements are invalid', errors)
+    if not movements:
+        raise BulkMovementError('No movements given', [])
+    return movements
+
+
+def apply_movements(movements, performed_by_id):
+    """Apply many parsed movements as one unit; returns the ids of the items they touched.
+
+    Item and batch references are checked with one query each. Stock is
+    then changed once per item and once per explicitly named batch, with
+    the same conditional UPDATEs as single movements, so a net shortfall
+    fails the whole request. Consumptions without a batch are pooled per
+    item, allocated FEFO in one pass and split back onto their rows; like
+    allocate_fefo they never take more unbatched stock than the item holds
+    outside its batches.
+    Every ledger row is written with a single executemany INSERT.
+    The caller commits.
+    """
+    from models import InventoryBatch, InventoryItem, InventoryTransaction
+
+    item_ids = sorted({m['inventory_item_id'] for m in movements})
+    known_items = set(db.session.scalars(select(InventoryItem.id).where(InventoryItem.id.in_(item_ids))))
+    batch_ids = {m['batch_id'] for m in movements if m['batch_id']}
+    batch_items = dict(db.session.execute(
+        select(InventoryBatch.id, InventoryBatch.inventory_item_id).where(InventoryBatch.id.in_(batch_ids))
+    ).all()) if batch_ids else {}
+
+    errors = []
+    for number, movement in enumerate(movements, 1):
+        if movement['inventory_item_id'] not in known_items:
+            errors.append({'row': number, 'error': f"unknown inventory item {movement['inventory_item_id']}"})
+        elif movement['batch_id'] and batch_items.get(movement['batch_id']) != movement['inventory_item_id']:
+            errors.append({'row': number, 'error': f"batch {movement['batch_id']} does not belong to the item"})
+    if errors:
+        raise BulkMovementError(f'{len(errors)} of {len(movements)} movements are invalid', errors)
+
+    item_deltas, batch_deltas, fefo_rows = {}, {}, {}
+    for movement in movements:
+        item_id = movement['inventory_item_id']
+        item_deltas[item_id] = item_deltas.get(item_id, 0) + movement['quantity']
+        if movement['batch_id']:
+            key = (movement['batch_id'], item_id)
+            batch_deltas[key] = batch_deltas.get(key, 0) + movement['quantity']
+        elif movement['transaction_type'] == 'consumed':
+            fefo_rows.setdefault(item_id, []).append(movement)
+
+    shortfalls = []
+    for item_id in item_ids:
+        try:
+            adjust_item_stock(item_id, item_deltas[item_id])
+        except InsufficientStock:
+            shortfalls.append({'inventory_item_id': item_id, 'error': 'Insufficient stock'})
+    for (batch_id, item_id), delta in sorted(batch_deltas.items()):
+        try:
+            adjust_batch_stock(batch_id, item_id, delta)
+        except InsufficientStock:
+            shortfalls.append({'batch_id': batch_id, 'error': 'Insufficient batch quantity'})
+    if shortfalls:
+        raise BulkMovementError('Not enough stock for these movements', shortfalls, status_code=409)
+
+    ledger = []
+    for movement in movements:
+        if movement['batch_id'] or movement['transaction_type'] != 'consumed':
+            ledger.append(dict(movement, performed_by_id=performed_by_id))
+
+    fefo_slices = {}
+    for item_id, rows in fefo_rows.items():
+        try:
+            fefo_slices[item_id] = _take_fefo(item_id, -sum(row['quantity'] for row in rows),
+                                              allow_unbatched=True)
+        except InsufficientStock as e:
+            shortfalls.append({'inventory_item_id': item_id, 'error': str(e)})
+    if shortfalls:
+        raise BulkMovementError('Not enough stock for these movements', shortfalls, status_code=409)
+
+    for item_id, rows in fefo_rows.items():
+        slices = fefo_slices[item_id]
+        # Walk the rows and the batch slices together, splitting rows that straddle two batches
+        slice_index, left_in_slice = 0, slices[0][1]
+        for row in rows:
+            needed = -row['quantity']
+            while needed:
+                batch_id, _, unit_cost = slices[slice_index]
+                take = min(needed, left_in_slice)
+                ledger.append(dict(row, batch_id=batch_id, quantity=-take, unit_cost=unit_cost,
+                                   performed_by_id=performed_by_id))
+                needed -= take
+                left_in_slice -= take
+                if not left_in_slice and slice_index + 1 < len(slices):
+                    slice_index += 1
+                    left_in_slice = slices[slice_index][1]
+
+    db.session.execute(insert(InventoryTransaction), [
+        {'unit_cost': None, **row} for row in ledger
+    ])
+    logger.info(f"Applied {len(movements)} inventory movements across {len(item_ids)} items "
+                f"as {len(ledger)} ledger rows")
+    return item_ids
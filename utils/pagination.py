@@ -0,0 +1,116 @@
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class CursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+class KeysetPage:
+    """One page of keyset-paginated results plus the cursors around it"""
+
+    def __init__(self, items, next_cursor, prev_cursor, limit):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.limit = limit
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Clamp a requested page size to 1..maximum"""
+    try:
+        size = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _deserialize(value, column):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(row_values, direction='next'):
+    payload = {'d': direction, 'k': [_serialize(v) for v in row_values]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Return (direction, key values) for a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = payload['d']
+        values = payload['k']
+        if direction not in ('next', 'prev') or len(values) != len(columns):
+            raise ValueError('cursor does not match this listing')
+        return direction, [_deserialize(v, c) for v, c in zip(values, columns)]
+    except (ValueError, KeyError, TypeError) as e:
+        raise CursorError(f'Invalid cursor: {str(e)}')
+
+
+def _seek_condition(columns, values, ascending):
+    """(c0, c1, ...) > (v0, v1, ...) expanded so it works on every dialect and uses the index"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        step = column > values[i] if ascending else column < values[i]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, columns, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """Fetch one page of query ordered by columns (the last one must be unique).
+
+    Only limit + 1 rows are read per call no matter how far into the
+    listing the cursor points, so memory and latency stay flat. Every
+    column must be NOT NULL: a seek like created_at > x never matches a
+    NULL, so such rows would be skipped.
+    """
+    nullable = [c.key for c in columns if c.expression.nullable]
+    if nullable:
+        raise ValueError(f'Keyset pagination needs non-nullable sort columns: {", ".join(nullable)}')
+    direction, values = ('next', None)
+    if cursor:
+        direction, values = decode_cursor(cursor, columns)
+
+    forward = direction == 'next'
+    ascending = forward != descending
+    if values is not None:
+        query = query.filter(_seek_condition(columns, values, ascending))
+    order = [c.asc() if ascending else c.desc() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+
+    def key_of(row):
+        return [getattr(row, c.key) for c in columns]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if forward and has_more or not forward and values is not None:
+            next_cursor = encode_cursor(key_of(rows[-1]), 'next')
+        if forward and values is not None or not forward and has_more:
+            prev_cursor = encode_cursor(key_of(rows[0]), 'prev')
+    return KeysetPage(rows, next_cursor, prev_cursor, limit)
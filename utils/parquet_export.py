@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from extensions import db
+from utils.admission_rollups import _as_date, date_bucket
+
+logger = logging.getLogger(__name__)
+
+# Rows pulled from the database and written per Parquet row group
+EXPORT_BATCH_SIZE = 10000
+
+DEFAULT_EXPORT_DIR = os.path.join('exports', 'parquet')
+
+# Watermarks of previous runs, stored next to the exported tables
+WATERMARK_FILE = '_watermarks.json'
+
+# Partition for rows whose partition date is NULL, named as Hive does
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+class ParquetExportError(RuntimeError):
+    """Raised when the export cannot run (e.g. pyarrow is not installed)"""
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ParquetExportError('Parquet export requires pyarrow (pip install pyarrow)')
+    return pyarrow, pyarrow.parquet
+
+
+def _export_specs():
+    """table name -> (model, partition column, change column) for every exported table.
+
+    Rows are partitioned by the month of the partition column. The change
+    column grows whenever a row is inserted or modified, so rows past the
+    last watermark tell which months hold edited rows. vital_sign and
+    inventory_transaction have none: both are append-only (readings and
+    ledger rows are recorded, never edited), so new rows are all there is
+    to pick up, and the per-month fingerprints find those.
+    """
+    from models import Admission, InventoryTransaction, LabTestResult, VitalSign
+
+    return {
+        'admission': (Admission, Admission.admission_date, Admission.updated_at),
+        'vital_sign': (VitalSign, VitalSign.measured_at, None),
+        'inventory_transaction': (InventoryTransaction, InventoryTransaction.transaction_date, None),
+        'lab_test_result': (LabTestResult, LabTestResult.created_at, LabTestResult.updated_at)
+    }
+
+
+EXPORT_TABLES = ('admission', 'vital_sign', 'inventory_transaction', 'lab_test_result')
+
+
+def _arrow_type(pa, column):
+    """Arrow type for a SQLAlchemy column so BI tools get real types instead of CSV text"""
+    sql_type = column.type
+    python_type = sql_type.python_type if not isinstance(sql_type, db.JSON) else dict
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is Decimal:
+        return pa.decimal128(sql_type.precision or 18, sql_type.scale or 2)
+    if python_type is datetime:
+        return pa.timestamp('us')
+    if python_type is date:
+        return pa.date32()
+    return pa.string()
+
+
+def _month_key(value):
+    """Partition name of a month bucket value, or NULL_PARTITION"""
+    if value is None:
+        return NULL_PARTITION
+    value = _as_date(value)
+    return f'{value.year:04d}-{value.month:02d}'
+
+
+def _month_bounds(key):
+    year, month = int(key[:4]), int(key[5:7])
+    return datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def _load_watermarks(output_dir):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_watermarks(output_dir, watermarks):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _encode_watermark(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode_watermark(value, column):
+    if value is None:
+        return None
+    return datetime.fromisoformat(value) if column.type.python_type is datetime else value
+
+
+class ParquetExporter:
+    """Writes tables to month-partitioned Parquet files, incrementally.
+
+    Layout is <output_dir>/<table>/month=YYYY-MM/part-0.parquet, readable
+    as a Hive-partitioned dataset; rows without a partition date go to
+    month=__HIVE_DEFAULT_PARTITION__. A run rewrites only the months that
+    changed since the previous run. These are months holding rows past
+    the change-column watermark (edits), plus months whose (row count, id
+    sum) fingerprint differs from the last export (new, deleted, or moved
+    rows, including a row whose date moved it out of a month). Each month
+    is streamed from the database in batches into a temporary file and
+    swapped in atomically, so readers never see a half-written partition.
+    """
+
+    def __init__(self, output_dir=DEFAULT_EXPORT_DIR, batch_size=EXPORT_BATCH_SIZE):
+        self.pa, self.pq = _require_pyarrow()
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+
+    def export(self, tables=EXPORT_TABLES, full=False):
+        """Export the given tables; returns {table: {'months': n, 'rows': n}}"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        state = _load_watermarks(self.output_dir)
+        summary = {}
+        specs = _export_specs()
+        for table in tables:
+            if table not in specs:
+                raise ParquetExportError(f'Unknown export table: {table}')
+            model, partition_column, change_column = specs[table]
+            previous = {} if full else state.get(table) or {}
+            if not isinstance(previous, dict):
+                previous = {}  # Written by a version that only kept the watermark
+
+            # Read the new marks first: rows changed during the export are picked up next run
+            watermark = db.session.query(func.max(change_column)).scalar() if change_column is not None else None
+            fingerprints = self._month_fingerprints(model, partition_column)
+            exported = previous.get('months', {})
+            if full:
+                # Also clear partitions on disk that no longer have rows
+                exported = dict.fromkeys(self._partitions_on_disk(table))
+            months = {month for month in set(fingerprints) | set(exported)
+                      if full or fingerprints.get(month) != exported.get(month)}
+            if change_column is not None and previous.get('watermark') is not None:
+                since = _decode_watermark(previous['watermark'], change_column)
+                months |= self._edited_months(partition_column, change_column, since)
+
+            summary[table] = {'months': 0, 'rows': 0}
+            columns = list(model.__table__.columns)
+            schema = self.pa.schema([(c.name, _arrow_type(self.pa, c)) for c in columns])
+            for month in sorted(months):
+                summary[table]['rows'] += self._write_month(table, model, columns, schema, partition_column, month)
+                summary[table]['months'] += 1
+
+            state[table] = {'watermark': _encode_watermark(watermark), 'months': fingerprints}
+            _save_watermarks(self.output_dir, state)
+            logger.info(f"Exported {summary[table]['rows']} {table} rows "
+                        f"in {summary[table]['months']} monthly partitions")
+        db.session.remove()
+        return summary
+
+    def _partitions_on_disk(self, table):
+        directory = os.path.join(self.output_dir, table)
+        if not os.path.isdir(directory):
+            return []
+        return [name.partition('=')[2] for name in os.listdir(directory) if name.startswith('month=')]
+
+    def _bucket(self, partition_column):
+        return date_bucket(partition_column, 'month', db.engine.dialect.name)
+
+    def _month_fingerprints(self, model, partition_column):
+        """{month key: [row count, id sum]} for every month, from one grouped query"""
+        bucket = self._bucket(partition_column)
+        rows = db.session.query(bucket, func.count(model.id), func.sum(model.id)).group_by(bucket)
+        return {_month_key(month): [count, int(id_sum or 0)] for month, count, id_sum in rows}
+
+    def _edited_months(self, partition_column, change_column, since):
+        bucket = self._bucket(partition_column)
+        months = db.session.query(bucket).filter(change_column > since).distinct()
+        return {_month_key(month) for month, in months}
+
+    def _write_month(self, table, model, columns, schema, partition_column, month):
+        directory = os.path.join(self.output_dir, table, f"month={month}")
+        path = os.path.join(directory, 'part-0.parquet')
+        if month == NULL_PARTITION:
+            in_month = partition_column.is_(None)
+        else:
+            start, end = _month_bounds(month)
+            in_month = (partition_column >= start) & (partition_column < end)
+
+        result = db.session.execute(
+            select(*columns)
+            .where(in_month)
+            .order_by(model.id)
+            .execution_options(yield_per=self.batch_size)
+        )
+        json_columns = [i for i, c in enumerate(columns) if isinstance(c.type, db.JSON)]
+
+        os.makedirs(directory, exist_ok=True)
+        rows_written = 0
+        with self.pq.ParquetWriter(path + '.tmp', schema, compression='snappy') as writer:
+            for batch in result.partitions():
+                data = [list(column) for column in zip(*batch)]
+                for i in json_columns:
+                    data[i] = [json.dumps(v) if v is not None else None for v in data[i]]
+                writer.write_batch(self.pa.RecordBatch.from_arrays(
+                    [self.pa.array(values, type=field.type) for values, field in zip(data, schema)],
+                    schema=schema
+                ))
+                rows_written += len(batch)
+
+        if rows_written:
+            os.replace(path + '.tmp', path)
+        else:
+            # Every row of the month was deleted or moved elsewhere: drop the partition
+            os.remove(path + '.tmp')
+            if os.path.exists(path):
+                os.remove(path)
+            if not os.listdir(directory):
+                os.rmdir(directory)
+        return rows_written
@@ -0,0 +1,75 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from utils.pagination import keyset_paginate
+
+# Entries shown per chart section before "load more"
+CHART_SECTION_LIMIT = 10
+MAX_CHART_SECTION_LIMIT = 100
+
+CHART_SECTIONS = ('admissions', 'vital_signs', 'allergies', 'medical_history',
+                  'documents', 'prescriptions', 'lab_tests')
+
+
+def _section_spec(section):
+    """(model, newest-first keyset columns, eager-load options) for one chart section.
+
+    Sections whose timestamp column is nullable are keyed on the id alone,
+    which follows insertion order just as their defaulted timestamps do.
+    """
+    from models import (Admission, Bed, LabTest, MedicalHistory, PatientAllergy,
+                        PatientDocument, Prescription, VitalSign)
+
+    specs = {
+        'admissions': (Admission, [Admission.admission_date, Admission.id], [
+            selectinload(Admission.bed).joinedload(Bed.ward),
+            selectinload(Admission.attending_doctor)
+        ]),
+        'vital_signs': (VitalSign, [VitalSign.measured_at, VitalSign.id], []),
+        'allergies': (PatientAllergy, [PatientAllergy.id], []),
+        'medical_history': (MedicalHistory, [MedicalHistory.id], []),
+        'documents': (PatientDocument, [PatientDocument.id], []),
+        'prescriptions': (Prescription, [Prescription.id], [
+            selectinload(Prescription.medications),
+            selectinload(Prescription.doctor)
+        ]),
+        'lab_tests': (LabTest, [LabTest.test_date, LabTest.id], [
+            selectinload(LabTest.category),
+            selectinload(LabTest.doctor),
+            selectinload(LabTest.results)
+        ])
+    }
+    return specs[section]
+
+
+def load_chart_section(patient_id, section, cursor=None, limit=CHART_SECTION_LIMIT):
+    """One newest-first page of a chart section with its related rows eager-loaded"""
+    model, columns, options = _section_spec(section)
+    query = model.query.options(*options).filter(model.patient_id == patient_id)
+    return keyset_paginate(query, columns, cursor, limit, descending=True)
+
+
+class PatientChart:
+    """A patient plus the most recent entries of every chart section"""
+
+    def __init__(self, patient, sections):
+        self.patient = patient
+        self.sections = sections
+
+
+def load_patient_chart(patient_id, limit=CHART_SECTION_LIMIT):
+    """Load a patient's chart in a fixed number of queries, whatever the length of their history.
+
+    Returns None when the patient does not exist.
+    """
+    from models import Admission, Bed, Patient
+
+    current = joinedload(Patient.current_admission)
+    patient = Patient.query.options(
+        current.joinedload(Admission.bed).joinedload(Bed.ward),
+        current.joinedload(Admission.attending_doctor)
+    ).filter(Patient.id == patient_id).first()
+    if patient is None:
+        return None
+
+    sections = {name: load_chart_section(patient_id, name, limit=limit) for name in CHART_SECTIONS}
+    return PatientChart(patient, sections)
@@ -0,0 +1,227 @@
+import logging
+import re
+
+from sqlalchemy import event, func, or_, text
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Search backend in use: 'fts5', 'tsvector' or 'like'; 'warned' once the missing index was logged
+_backend = {'name': None, 'warned': False}
+
+# Separators stripped from stored contacts when matching digits-only queries without the index
+CONTACT_SEPARATORS = ' -().+/'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Postgres expression indexed by ix_patient_search_tsv (see the patient_search_index migration);
+# queries must repeat it verbatim
+PG_TSVECTOR_SQL = ("to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(contact, '') || ' ' || "
+                   "coalesce(email, '') || ' ' || coalesce(insurance_number, ''))")
+
+
+def _digits(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def _index_row(patient):
+    return {
+        'rowid': patient.id,
+        'name': patient.name or '',
+        'contact': patient.contact or '',
+        'contact_digits': _digits(patient.contact),
+        'email': patient.email or '',
+        'insurance_number': patient.insurance_number or ''
+    }
+
+
+def detect_search_backend(connection=None):
+    """Pick the search backend for the current database; the index itself is created by a migration.
+
+    SQLite uses FTS5 once the patient_search table exists (see the
+    patient_search_index migration) and LIKE until then. Only FTS5 is
+    remembered, so a process started before `flask db upgrade` switches
+    over on its next search or write without a restart. Postgres always
+    uses tsvector queries, which the migration's GIN index speeds up.
+    """
+    if _backend['name'] is not None:
+        return _backend['name']
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        check = text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_search'")
+        if connection is not None:
+            exists = connection.execute(check).first()
+        else:
+            with db.engine.connect() as conn:
+                exists = conn.execute(check).first()
+        if exists:
+            _backend['name'] = 'fts5'
+            return 'fts5'
+        if not _backend['warned']:
+            logger.warning("Patient search index missing (run `flask db upgrade`); falling back to LIKE")
+            _backend['warned'] = True
+        return 'like'
+    elif dialect == 'postgresql':
+        _backend['name'] = 'tsvector'
+    else:
+        _backend['name'] = 'like'
+    return _backend['name']
+
+
+def register_search_listeners():
+    """Keep the FTS5 table in step with Patient rows inside the same transaction"""
+    from models import Patient
+
+    def upsert(mapper, connection, target):
+        if detect_search_backend(connection) != 'fts5':
+            return
+        connection.execute(text("DELETE FROM patient_search WHERE rowid = :rowid"), {'rowid': target.id})
+        connection.execute(text(
+            "INSERT INTO patient_search(rowid, name, contact, contact_digits, email, insurance_number) "
+            "VALUES (:rowid, :name, :contact, :contact_digits, :email, :insurance_number)"
+        ), _index_row(target))
+
+    def remove(mapper, connection, target):
+        if detect_search_backend(connection) != 'fts5':
+            return
+        connection.execute(text("DELETE FROM patient_search WHERE rowid = :rowid"), {'rowid': target.id})
+
+    event.listen(Patient, 'after_insert', upsert)
+    event.listen(Patient, 'after_update', upsert)
+    event.listen(Patient, 'after_delete', remove)
+
+
+def _query_tokens(query):
+    tokens = _TOKEN_RE.findall(query.lower())
+    # Phone numbers are often typed without separators
+    digits = _digits(query)
+    if len(digits) >= 3 and digits not in tokens:
+        tokens = [t for t in tokens if not t.isdigit()] + [digits]
+    return tokens
+
+
+def _edit_distance(a, b, limit):
+    """Edit distance counting adjacent transpositions as one edit, giving up early past limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1,
+                       current[j - 1] + 1,
+                       previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before_previous[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+def _fuzzy_terms(conn, token):
+    """Indexed terms within a small edit distance of token, sharing its first letter"""
+    if len(token) < 4 or token.isdigit():
+        return []
+    limit = 1 if len(token) < 8 else 2
+    candidates = conn.execute(text(
+        "SELECT term FROM patient_search_vocab WHERE term >= :low AND term < :high "
+        "AND length(term) BETWEEN :min_len AND :max_len"
+    ), {
+        'low': token[0],
+        'high': token[0] + '\uffff',
+        'min_len': len(token) - limit,
+        'max_len': len(token) + limit
+    }).scalars()
+    return [term for term in candidates if term != token and _edit_distance(token, term, limit) <= limit]
+
+
+def _fts5_match(tokens, conn=None, fuzzy=False):
+    clauses = []
+    for token in tokens:
+        alternatives = [f'"{token}"*']
+        if fuzzy:
+            alternatives += [f'"{term}"' for term in _fuzzy_terms(conn, token)]
+        clauses.append('(' + ' OR '.join(alternatives) + ')')
+    return ' AND '.join(clauses)
+
+
+def _search_fts5(tokens, limit):
+    sql = text(
+        "SELECT rowid FROM patient_search WHERE patient_search MATCH :match ORDER BY rank LIMIT :limit"
+    )
+    with db.engine.connect() as conn:
+        ids = list(conn.execute(sql, {'match': _fts5_match(tokens), 'limit': limit}).scalars())
+        if len(ids) < limit:
+            # Not enough prefix hits: retry allowing near-miss spellings
+            fuzzy_match = _fts5_match(tokens, conn, fuzzy=True)
+            for patient_id in conn.execute(sql, {'match': fuzzy_match, 'limit': limit}).scalars():
+                if patient_id not in ids:
+                    ids.append(patient_id)
+    return ids[:limit]
+
+
+def _search_tsvector(tokens, limit):
+    from models import Patient
+
+    # Tokens only contain word characters, so they are safe to join into a tsquery
+    tsquery = ' & '.join(f'{token}:*' for token in tokens)
+    rows = db.session.query(Patient.id).filter(
+        text(f"{PG_TSVECTOR_SQL} @@ to_tsquery('simple', :tsquery)")
+    ).order_by(
+        text(f"ts_rank({PG_TSVECTOR_SQL}, to_tsquery('simple', :tsquery)) DESC")
+    ).params(tsquery=tsquery).limit(limit).all()
+    return [row.id for row in rows]
+
+
+def _contact_digits(column):
+    """SQL expression for column with the usual phone number separators removed"""
+    for separator in CONTACT_SEPARATORS:
+        column = func.replace(column, separator, '')
+    return column
+
+
+def _search_like(tokens, limit):
+    from models import Patient
+
+    query = db.session.query(Patient.id)
+    for token in tokens:
+        pattern = f'{token}%'
+        # _query_tokens collapses phone numbers to their digits, so compare those against bare digits too
+        contact = _contact_digits(Patient.contact) if token.isdigit() else Patient.contact
+        query = query.filter(or_(
+            func.lower(Patient.name).like(pattern),
+            func.lower(Patient.name).like(f'% {token}%'),
+            contact.like(f'%{token}%'),
+            func.lower(Patient.email).like(pattern),
+            func.lower(Patient.insurance_number).like(pattern)
+        ))
+    return [row.id for row in query.order_by(Patient.name).limit(limit)]
+
+
+def search_patients(query, limit=DEFAULT_SEARCH_LIMIT):
+    """Return matching Patient objects, best matches first"""
+    from models import Patient
+
+    tokens = _query_tokens(query or '')
+    if not tokens:
+        return []
+
+    backend = detect_search_backend()
+    if backend == 'fts5':
+        ids = _search_fts5(tokens, limit)
+    elif backend == 'tsvector':
+        ids = _search_tsvector(tokens, limit)
+    else:
+        ids = _search_like(tokens, limit)
+
+    if not ids:
+        return []
+    patients = {p.id: p for p in Patient.query.filter(Patient.id.in_(ids))}
+    return [patients[i] for i in ids if i in patients]
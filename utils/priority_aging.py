@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, update
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between aging passes; 0 disables the background thread
+DEFAULT_AGING_INTERVAL = 300
+
+# Tick durations above this many seconds are logged as warnings
+DEFAULT_SLOW_TICK_SECONDS = 1.0
+
+# Runtime metrics of the most recent aging passes in this process
+aging_stats = {
+    'ticks': 0,
+    'last_run_at': None,
+    'last_duration_ms': None,
+    'last_rows_updated': 0,
+    'max_duration_ms': 0
+}
+
+
+def aged_priority_score_expression(now):
+    """SQL expression mirroring Admission.update_priority_score for every row at once"""
+    from models import (Admission, PRIORITY_LEVELS, PRIORITY_AGING_HOURS_PER_POINT,
+                        MAX_PRIORITY_AGING_BOOST)
+
+    base_score = case(
+        PRIORITY_LEVELS,
+        value=func.coalesce(Admission.triage_category, Admission.priority_level),
+        else_=4
+    )
+
+    # One point of boost per PRIORITY_AGING_HOURS_PER_POINT hours waited, capped.
+    # Cut-off timestamps are bound parameters so no dialect date math is needed.
+    boost = case(
+        *[
+            (Admission.created_at <= now - timedelta(hours=points * PRIORITY_AGING_HOURS_PER_POINT), points)
+            for points in range(MAX_PRIORITY_AGING_BOOST, 0, -1)
+        ],
+        else_=0
+    )
+    return case((base_score - boost < 1, 1), else_=base_score - boost)
+
+
+def age_waiting_admissions():
+    """Re-age all waiting admissions with one UPDATE and republish the queue.
+
+    Returns the number of admissions whose priority score changed.
+    """
+    from models import Admission
+    from utils.admission_queue import admission_queue
+    from utils.bed_allocation import bed_allocator
+
+    now = datetime.utcnow()
+    new_score = aged_priority_score_expression(now)
+
+    try:
+        result = db.session.execute(
+            update(Admission)
+            .where(Admission.status == 'waiting', Admission.priority_score != new_score)
+            .values(priority_score=new_score)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error aging admission priorities: {str(e)}")
+        return 0
+
+    if result.rowcount:
+        admission_queue.rebuild()
+        admission_queue.flush_positions()
+        bed_allocator.rebuild()
+    admission_queue.publish()
+    return result.rowcount
+
+
+def run_aging_tick(app):
+    """Run one timed aging pass inside an application context and record its metrics"""
+    started = time.perf_counter()
+    with app.app_context():
+        rows_updated = age_waiting_admissions()
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    aging_stats['ticks'] += 1
+    aging_stats['last_run_at'] = datetime.utcnow()
+    aging_stats['last_duration_ms'] = duration_ms
+    aging_stats['last_rows_updated'] = rows_updated
+    aging_stats['max_duration_ms'] = max(aging_stats['max_duration_ms'], duration_ms)
+
+    slow_tick_seconds = app.config.get('PRIORITY_AGING_SLOW_TICK_SECONDS', DEFAULT_SLOW_TICK_SECONDS)
+    if duration_ms / 1000 > slow_tick_seconds:
+        logger.warning(f"Priority aging tick took {duration_ms}ms ({rows_updated} admissions updated)")
+    elif app.config.get('PRIORITY_AGING_LOG_METRICS', True):
+        logger.info(f"Priority aging tick took {duration_ms}ms ({rows_updated} admissions updated)")
+    return rows_updated
+
+
+def start_priority_aging_scheduler(app):
+    """Start a daemon thread that ages priorities every PRIORITY_AGING_INTERVAL seconds"""
+    interval = app.config.get('PRIORITY_AGING_INTERVAL', DEFAULT_AGING_INTERVAL)
+    if not interval or interval <= 0:
+        logger.debug("Priority aging scheduler disabled")
+        return None
+
+    stop_event = threading.Event()
+
+    def worker():
+        while not stop_event.wait(interval):
+            try:
+                run_aging_tick(app)
+            except Exception as e:
+                logger.error(f"Priority aging tick failed: {str(e)}")
+
+    thread = threading.Thread(target=worker, name='priority-aging', daemon=True)
+    thread.stop_event = stop_event
+    thread.start()
+    return thread
@@ -0,0 +1,104 @@
+from calendar import monthrange
+from datetime import date, timedelta
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# Most occurrences one series may generate
+MAX_SERIES_OCCURRENCES = 366
+
+
+class RecurrenceRule:
+    """The subset of RFC 5545 RRULEs used for follow-up clinics.
+
+    Supports FREQ=DAILY|WEEKLY|MONTHLY with INTERVAL, BYDAY (weekly only),
+    and COUNT or UNTIL, e.g. 'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,TH;COUNT=24'.
+    Occurrences are generated lazily, so only the dates asked for are built.
+    """
+
+    def __init__(self, freq, interval=1, count=None, until=None, by_day=None):
+        if freq not in FREQUENCIES:
+            raise ValueError(f'Unsupported recurrence frequency: {freq}')
+        if interval < 1:
+            raise ValueError('Recurrence interval must be at least 1')
+        if count is None and until is None:
+            raise ValueError('A recurrence needs COUNT or UNTIL')
+        if count is not None and count < 1:
+            raise ValueError('Recurrence count must be at least 1')
+        if by_day and freq != 'WEEKLY':
+            raise ValueError('BYDAY is only supported for weekly recurrences')
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.by_day = sorted(set(by_day)) if by_day else None  # Weekday numbers, Monday = 0
+
+    @classmethod
+    def parse(cls, text):
+        """Build a rule from an RRULE string; raises ValueError on anything unsupported"""
+        parts = {}
+        for part in text.strip().removeprefix('RRULE:').split(';'):
+            if not part:
+                continue
+            name, sep, value = part.partition('=')
+            if not sep:
+                raise ValueError(f'Malformed recurrence rule part: {part}')
+            parts[name.strip().upper()] = value.strip().upper()
+
+        unknown = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY'}
+        if unknown:
+            raise ValueError(f'Unsupported recurrence rule parts: {", ".join(sorted(unknown))}')
+        try:
+            by_day = [WEEKDAYS.index(day) for day in parts['BYDAY'].split(',')] if 'BYDAY' in parts else None
+            until = parts.get('UNTIL')
+            return cls(
+                parts.get('FREQ'),
+                interval=int(parts.get('INTERVAL', 1)),
+                count=int(parts['COUNT']) if 'COUNT' in parts else None,
+                until=date(int(until[:4]), int(until[4:6]), int(until[6:8])) if until else None,
+                by_day=by_day
+            )
+        except (IndexError, TypeError, ValueError) as e:
+            raise ValueError(f'Invalid recurrence rule: {text} ({e})')
+
+    def __str__(self):
+        parts = [f'FREQ={self.freq}', f'INTERVAL={self.interval}']
+        if self.by_day:
+            parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in self.by_day))
+        if self.count is not None:
+            parts.append(f'COUNT={self.count}')
+        if self.until is not None:
+            parts.append(f'UNTIL={self.until.strftime("%Y%m%d")}')
+        return ';'.join(parts)
+
+    def _candidates(self, start):
+        if self.freq == 'DAILY':
+            day = start
+            while True:
+                yield day
+                day += timedelta(days=self.interval)
+        elif self.freq == 'WEEKLY':
+            by_day = self.by_day or [start.weekday()]
+            week = start - timedelta(days=start.weekday())
+            while True:
+                for weekday in by_day:
+                    day = week + timedelta(days=weekday)
+                    if day >= start:
+                        yield day
+                week += timedelta(weeks=self.interval)
+        else:
+            # Same day of the month; months too short for it are skipped, as RFC 5545 does
+            year, month = start.year, start.month
+            while True:
+                if start.day <= monthrange(year, month)[1]:
+                    yield date(year, month, start.day)
+                month += self.interval
+                year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+
+    def occurrences(self, start):
+        """Dates of the series beginning on start, in order"""
+        for n, day in enumerate(self._candidates(start)):
+            if (self.count is not None and n >= self.count) or (self.until is not None and day > self.until):
+                return
+            yield day
@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import exists, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from utils.demand_forecast import forecast_reorder_points
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between background reorder evaluations; 0 disables the thread
+DEFAULT_REORDER_INTERVAL = 900
+
+# Order lines in these states mean the item is already being replenished
+OPEN_ORDER_STATUSES = ('pending', 'approved', 'ordered')
+
+# Status changes a purchase order may go through; its open lines follow it
+PURCHASE_ORDER_TRANSITIONS = {
+    'pending': ('approved', 'cancelled'),
+    'approved': ('ordered', 'cancelled'),
+    'ordered': ('received', 'cancelled')
+}
+
+# Runtime metrics of the reorder evaluator in this process
+reorder_stats = {
+    'runs': 0,
+    'last_run_at': None,
+    'last_duration_ms': None,
+    'last_lines_created': 0,
+    'last_orders_touched': 0
+}
+
+
+def reorder_point(minimum_stock, forecast_point):
+    """Stock level that triggers a reorder: the forecast reorder point, never below the configured minimum"""
+    return max(minimum_stock or 0, forecast_point)
+
+
+def evaluate_reorders(item_ids=None):
+    """Create reorder lines for items at or below their reorder point, grouped into supplier purchase orders.
+
+    Reorder points come from the demand forecast (see
+    utils.demand_forecast), floored at each item's minimum stock.
+    Items that already have an open order are skipped in the candidate
+    query itself, so repeated runs never duplicate lines. New lines join
+    the supplier's pending purchase order, or a new one per supplier, and
+    are written with one bulk INSERT. Pass item_ids to evaluate only those
+    items. Returns {supplier_id: number of lines added}.
+    """
+    from models import AutomatedOrder, InventoryItem, PurchaseOrder, Supplier
+
+    open_order = exists().where(
+        AutomatedOrder.inventory_item_id == InventoryItem.id,
+        AutomatedOrder.status.in_(OPEN_ORDER_STATUSES)
+    )
+    query = db.session.query(
+        InventoryItem.id, InventoryItem.supplier_id, InventoryItem.current_stock,
+        InventoryItem.minimum_stock, InventoryItem.reorder_quantity, Supplier.lead_time_days
+    ).outerjoin(Supplier, Supplier.id == InventoryItem.supplier_id).filter(
+        InventoryItem.is_active.isnot(False),
+        InventoryItem.reorder_quantity > 0,
+        ~open_order
+    )
+    if item_ids is not None:
+        query = query.filter(InventoryItem.id.in_(item_ids))
+    candidates = query.all()
+    if not candidates:
+        return {}
+
+    forecasts = forecast_reorder_points({row.id: row.lead_time_days for row in candidates}, item_ids)
+    lines, lead_times = {}, {}
+    for row in candidates:
+        point = reorder_point(row.minimum_stock, forecasts[row.id]['reorder_point'])
+        if (row.current_stock or 0) <= point:
+            lines.setdefault(row.supplier_id, []).append((row, point))
+            lead_times[row.supplier_id] = row.lead_time_days
+    if not lines:
+        return {}
+
+    suppliers = [PurchaseOrder.supplier_id.in_([supplier_id for supplier_id in lines if supplier_id is not None])]
+    if None in lines:
+        suppliers.append(PurchaseOrder.supplier_id.is_(None))
+    pending = {order.supplier_id: order for order in PurchaseOrder.query.filter(
+        PurchaseOrder.status == 'pending', or_(*suppliers)
+    )}
+
+    try:
+        for supplier_id in lines:
+            if supplier_id not in pending:
+                lead_time = lead_times[supplier_id]
+                pending[supplier_id] = PurchaseOrder(
+                    supplier_id=supplier_id,
+                    expected_delivery=date.today() + timedelta(days=lead_time) if lead_time else None
+                )
+                db.session.add(pending[supplier_id])
+        db.session.flush()
+
+        db.session.execute(insert(AutomatedOrder), [{
+            'inventory_item_id': row.id,
+            'purchase_order_id': pending[supplier_id].id,
+            'quantity': row.reorder_quantity,
+            'status': 'pending',
+            'suggested_by': 'low_stock',
+            'notes': f'Stock {row.current_stock or 0} at or below reorder point {point:.0f}'
+        } for supplier_id, supplier_lines in lines.items() for row, point in supplier_lines])
+        db.session.commit()
+    except IntegrityError:
+        # Another evaluator ordered some of these items first; the next run picks up the rest
+        db.session.rollback()
+        logger.info("Reorder evaluation raced with another run; skipped")
+        return {}
+    except Exception:
+        db.session.rollback()
+        raise
+
+    created = {supplier_id: len(supplier_lines) for supplier_id, supplier_lines in lines.items()}
+    logger.info(f"Created {sum(created.values())} reorder lines across {len(created)} purchase orders")
+    return created
+
+
+def set_purchase_order_status(order_id, status, user_id=None):
+    """Move a purchase order, and its lines still open, to status; raises ValueError if not allowed.
+
+    Approved orders stop taking new lines, so the next evaluation starts a
+    fresh pending order for the supplier. Received and cancelled lines no
+    longer count as open, so their items can be reordered again. The
+    caller commits.
+    """
+    from models import AutomatedOrder, PurchaseOrder
+
+    sources = [source for source, targets in PURCHASE_ORDER_TRANSITIONS.items() if status in targets]
+    if not sources:
+        raise ValueError(f'Invalid purchase order status: {status}')
+    # Conditional so two people acting on the same order cannot both move it
+    changed = db.session.execute(
+        update(PurchaseOrder)
+        .where(PurchaseOrder.id == order_id, PurchaseOrder.status.in_(sources))
+        .values(status=status, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+    if not changed:
+        order = db.session.get(PurchaseOrder, order_id)
+        if order is None:
+            raise ValueError(f'Unknown purchase order {order_id}')
+        raise ValueError(f'Purchase order {order_id} is {order.status} and cannot become {status}')
+
+    values = {'status': status, 'updated_at': datetime.utcnow()}
+    if status == 'approved':
+        values['approved_by_id'] = user_id
+    db.session.execute(
+        update(AutomatedOrder)
+        .where(AutomatedOrder.purchase_order_id == order_id,
+               AutomatedOrder.status.in_(OPEN_ORDER_STATUSES))
+        .values(**values)
+        .execution_options(synchronize_session='fetch')
+    )
+
+
+def close_received_lines(item_ids):
+    """Mark the open reorder lines of items whose stock just arrived as received.
+
+    Called when stock is received however it is booked, so a delivery
+    that skipped the purchase order workflow does not block the item
+    from ever being reordered. Orders left without open lines become
+    received as well. Returns the number of lines closed; the caller
+    commits.
+    """
+    from models import AutomatedOrder, PurchaseOrder
+
+    if not item_ids:
+        return 0
+    lines = db.session.execute(
+        update(AutomatedOrder)
+        .where(AutomatedOrder.inventory_item_id.in_(item_ids),
+               AutomatedOrder.status.in_(OPEN_ORDER_STATUSES))
+        .values(status='received', updated_at=datetime.utcnow())
+        .returning(AutomatedOrder.purchase_order_id)
+    ).scalars().all()
+    order_ids = {order_id for order_id in lines if order_id is not None}
+    if order_ids:
+        still_open = exists().where(
+            AutomatedOrder.purchase_order_id == PurchaseOrder.id,
+            AutomatedOrder.status.in_(OPEN_ORDER_STATUSES)
+        )
+        db.session.execute(
+            update(PurchaseOrder)
+            .where(PurchaseOrder.id.in_(order_ids),
+                   PurchaseOrder.status.in_(OPEN_ORDER_STATUSES), ~still_open)
+            .values(status='received', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    return len(lines)
+
+
+def run_reorder_evaluation(app):
+    """Run one timed reorder evaluation inside an application context"""
+    started = time.perf_counter()
+    with app.app_context():
+        created = evaluate_reorders()
+    reorder_stats['runs'] += 1
+    reorder_stats['last_run_at'] = datetime.utcnow()
+    reorder_stats['last_duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    reorder_stats['last_lines_created'] = sum(created.values())
+    reorder_stats['last_orders_touched'] = len(created)
+    return created
+
+
+def start_reorder_scheduler(app):
+    """Start a daemon thread that evaluates reorders every REORDER_EVALUATION_INTERVAL seconds"""
+    interval = app.config.get('REORDER_EVALUATION_INTERVAL', DEFAULT_REORDER_INTERVAL)
+    if not interval or interval <= 0:
+        logger.debug("Reorder scheduler disabled")
+        return None
+
+    stop_event = threading.Event()
+
+    def worker():
+        while not stop_event.wait(interval):
+            try:
+                run_reorder_evaluation(app)
+            except Exception as e:
+                logger.error(f"Reorder evaluation failed: {str(e)}")
+
+    thread = threading.Thread(target=worker, name='reorder-evaluation', daemon=True)
+    thread.stop_event = stop_event
+    thread.start()
+    return thread
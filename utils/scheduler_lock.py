@@ -0,0 +1,40 @@
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = 'background-schedulers.lock'
+
+# Open handle of the held lock; closing it (or exiting) releases the lock
+_lock_handle = None
+
+
+def acquire_scheduler_lock(directory):
+    """True if this process may run the background schedulers on this host.
+
+    The first process to take an exclusive lock on a file in directory
+    wins and keeps it until it exits, so of several gunicorn workers only
+    one starts the schedulers, and a restarted worker can take over.
+    Without fcntl every process is allowed to run them.
+    """
+    global _lock_handle
+    if _lock_handle is not None:
+        return True
+    if fcntl is None:
+        return True
+
+    os.makedirs(directory, exist_ok=True)
+    handle = open(os.path.join(directory, LOCK_FILENAME), 'w')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        logger.debug("Background schedulers already run by another process")
+        return False
+    _lock_handle = handle
+    return True
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import case, event, func
+from sqlalchemy.orm import Session
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Backstop lifetime of the cached counts, in case a change bypasses the session
+OCCUPANCY_CACHE_TTL = 30
+
+_cache = {'data': None, 'loaded_at': 0.0}
+_cache_lock = threading.Lock()
+
+
+def _empty_counts():
+    return {'free': 0, 'occupied': 0, 'maintenance': 0, 'reserved': 0, 'total': 0}
+
+
+def _load_occupancy():
+    from models import Bed
+
+    occupied = Bed.occupied.is_(True)
+    rows = db.session.query(
+        Bed.ward_id,
+        func.count(Bed.id),
+        func.sum(case((occupied, 1), else_=0)),
+        func.sum(case((~occupied & (Bed.status == 'maintenance'), 1), else_=0)),
+        func.sum(case((~occupied & (Bed.status == 'reserved'), 1), else_=0))
+    ).group_by(Bed.ward_id).all()
+
+    occupancy = {}
+    for ward_id, total, occupied_count, maintenance, reserved in rows:
+        occupied_count, maintenance, reserved = occupied_count or 0, maintenance or 0, reserved or 0
+        occupancy[ward_id] = {
+            'free': total - occupied_count - maintenance - reserved,
+            'occupied': occupied_count,
+            'maintenance': maintenance,
+            'reserved': reserved,
+            'total': total
+        }
+    return occupancy
+
+
+def get_ward_occupancy():
+    """Per-ward bed counts {ward_id: {free, occupied, maintenance, reserved, total}} from one grouped query"""
+    with _cache_lock:
+        data = _cache['data']
+        if data is not None and time.monotonic() - _cache['loaded_at'] < OCCUPANCY_CACHE_TTL:
+            return data
+
+    data = _load_occupancy()
+    with _cache_lock:
+        _cache['data'] = data
+        _cache['loaded_at'] = time.monotonic()
+    return data
+
+
+def get_ward_counts(ward_id):
+    return get_ward_occupancy().get(ward_id, _empty_counts())
+
+
+def total_counts(ward_ids=None):
+    """Sum the per-ward counts, optionally restricted to some wards"""
+    totals = _empty_counts()
+    for ward_id, counts in get_ward_occupancy().items():
+        if ward_ids is None or ward_id in ward_ids:
+            for key in totals:
+                totals[key] += counts[key]
+    return totals
+
+
+def invalidate_occupancy():
+    with _cache_lock:
+        _cache['data'] = None
+
+
+# Cache invalidation: beds changed in a session mark it dirty, and the cache
+# is dropped once that session commits so readers never cache uncommitted rows.
+
+def _mark_dirty(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['ward_occupancy_dirty'] = True
+
+
+def register_occupancy_listeners():
+    from models import Bed
+
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(Bed, event_name, _mark_dirty)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _bulk_bed_statement(orm_execute_state):
+        if (orm_execute_state.is_update or orm_execute_state.is_delete) \
+                and orm_execute_state.bind_mapper is not None \
+                and orm_execute_state.bind_mapper.class_ is Bed:
+            orm_execute_state.session.info['ward_occupancy_dirty'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidate_after_commit(session):
+        if session.info.pop('ward_occupancy_dirty', False):
+            invalidate_occupancy()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_after_rollback(session):
+        session.info.pop('ward_occupancy_dirty', None)